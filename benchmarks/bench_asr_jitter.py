@@ -0,0 +1,202 @@
+"""
+ASR Process Jitter Benchmark
+对比转写服务在主进程内运行与在子进程中运行时，字幕投递到 WebSocket 发送协程的抖动
+
+主进程中用若干线程模拟 LLM 侧的纯 Python 重负载（JSON 解析、正则、字典构造），
+事件循环中的消费协程与 /ws/captions 相同（run_in_executor 取字幕）。
+
+指标（毫秒）：
+- partial_emit_to_ws / accurate_emit_to_ws: 字幕产生 -> 发送协程拿到
+- accurate_audio_to_ws:                     语音段结束（音频时间）-> 发送协程拿到 accurate
+- loop_lag:                                 事件循环 10ms 定时器的超时量
+
+用法：
+    python -m benchmarks.bench_asr_jitter --stub-model --synthetic 45
+    python -m benchmarks.bench_asr_jitter lecture.wav --llm-threads 4
+
+--stub-model 同时使用能量 VAD；回放按真实时钟进行（--speed 必须为 1）。
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from src.config import SR
+from src.services.audio_service import AudioTranscriptionService
+from src.services.asr_process import ASRProcessClient
+from benchmarks.bench_caption_latency import percentiles, git_commit, load_fixtures, add_common_args
+from benchmarks.replay import (
+    SimClock, ReplayInputStream, StubWhisperModel, EnergyVAD, pad_for_final,
+)
+
+
+def make_stub_service(partial_delay: float, partial_per_sec: float,
+                      final_delay: float, final_per_sec: float) -> AudioTranscriptionService:
+    """桩模型 + 能量 VAD 的服务（模块级函数，可作为子进程的 service_factory）"""
+    clock = SimClock(1.0)
+    service = AudioTranscriptionService()
+    service.partial_model = StubWhisperModel(clock, partial_delay, partial_per_sec, name="partial")
+    service.final_model = StubWhisperModel(clock, final_delay, final_per_sec, name="final")
+    service.vad_engine = EnergyVAD()
+    return service
+
+
+# ====== 模拟 LLM 负载 ======
+_WORDS = "gradient descent eigenvalue matrix lecture theorem proof lemma integral derivative".split()
+
+
+def llm_busy_loop(stop: threading.Event):
+    """纯 Python 重负载：构造/序列化/解析结构化笔记，正则抽取关键词"""
+    rng = random.Random(threading.get_ident())
+    pattern = re.compile(r"\b(\w+)(?:tion|ent|ix)\b")
+    while not stop.is_set():
+        notes = {
+            "sections": [
+                {
+                    "title": " ".join(rng.choice(_WORDS) for _ in range(6)),
+                    "points": [" ".join(rng.choice(_WORDS) for _ in range(20)) for _ in range(12)],
+                }
+                for _ in range(20)
+            ]
+        }
+        text = json.dumps(notes)
+        parsed = json.loads(text)
+        sum(len(pattern.findall(p)) for s in parsed["sections"] for p in s["points"])
+
+
+# ====== 单次运行 ======
+async def consume(service, clock: SimClock, stop: asyncio.Event) -> Dict[str, List[float]]:
+    """与 /ws/captions 相同的取字幕方式，记录投递延迟和事件循环延迟"""
+    values: Dict[str, List[float]] = {
+        "partial_emit_to_ws": [], "accurate_emit_to_ws": [], "accurate_audio_to_ws": [], "loop_lag": [],
+    }
+    loop = asyncio.get_event_loop()
+
+    async def pump(get_caption, kind: str):
+        while not stop.is_set():
+            try:
+                caption = await loop.run_in_executor(None, get_caption, True, 0.2)
+            except queue.Empty:
+                continue
+            now = time.monotonic()
+            if caption.emit_t is not None:
+                values[f"{kind}_emit_to_ws"].append((now - caption.emit_t) * 1000.0)
+            if kind == "accurate" and caption.audio_end is not None:
+                values["accurate_audio_to_ws"].append((clock.from_monotonic(now) - caption.audio_end) * 1000.0)
+
+    async def ticker():
+        while not stop.is_set():
+            t0 = time.monotonic()
+            await asyncio.sleep(0.01)
+            values["loop_lag"].append(max(0.0, (time.monotonic() - t0 - 0.01) * 1000.0))
+
+    await asyncio.gather(
+        pump(service.get_partial_caption, "partial"),
+        pump(service.get_accurate_caption, "accurate"),
+        ticker(),
+    )
+    return values
+
+
+def run_mode(args, audio, use_process: bool, llm_threads: int) -> Dict[str, List[float]]:
+    if args.stub_model:
+        factory = functools.partial(
+            make_stub_service, args.partial_delay, args.partial_per_sec, args.final_delay, args.final_per_sec
+        )
+    else:
+        factory = AudioTranscriptionService
+
+    if use_process:
+        service = ASRProcessClient(service_factory=factory)
+        service.initialize()  # 子进程中已注入桩模型时直接返回
+    else:
+        service = factory()
+        if not args.stub_model:
+            service.initialize()
+
+    clock = SimClock(1.0)
+    finished = threading.Event()
+    service.input_stream_factory = ReplayInputStream.factory(audio, clock, on_finished=finished.set)
+
+    llm_stop = threading.Event()
+    workers = [threading.Thread(target=llm_busy_loop, args=(llm_stop,), daemon=True) for _ in range(llm_threads)]
+    for w in workers:
+        w.start()
+
+    async def main():
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(consume(service, clock, stop))
+        service.start_capture()
+        await asyncio.get_event_loop().run_in_executor(None, finished.wait)
+        await asyncio.sleep(args.drain_sec)  # 等最后一句的 accurate
+        stop.set()
+        return await task
+
+    try:
+        values = asyncio.run(main())
+    finally:
+        llm_stop.set()
+        for w in workers:
+            w.join()
+        service.stop_capture()
+        if use_process:
+            service.close()
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caption delivery jitter: in-process vs ASR child process")
+    add_common_args(parser)
+    parser.set_defaults(synthetic=45.0, partial_delay=0.05)
+    parser.add_argument("--llm-threads", type=int, default=2, help="CPU-heavy Python threads in the server process")
+    parser.add_argument("--drain-sec", type=float, default=3.0, help="wait after the replay for the last captions")
+    parser.add_argument("--out", default=os.path.join("data", "bench", "asr_jitter.json"))
+    args = parser.parse_args()
+    if args.speed != 1.0:
+        parser.error("--speed must be 1: the child process runs on the real clock")
+
+    audio = pad_for_final(np.concatenate([a for _name, a in load_fixtures(args)]))
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("fixtures", "out")},
+        "audio_sec": audio.size / SR,
+        "modes": {},
+    }
+    modes = [
+        ("inprocess_idle", False, 0),
+        ("inprocess_llm", False, args.llm_threads),
+        ("process_idle", True, 0),
+        ("process_llm", True, args.llm_threads),
+    ]
+    for label, use_process, threads in modes:
+        print(f"[{label}] replaying {audio.size / SR:.1f}s ...")
+        values = run_mode(args, audio, use_process, threads)
+        result["modes"][label] = {k: percentiles(v) for k, v in values.items()}
+
+    print("=" * 80)
+    print(f"{'metric':<24} {'mode':<16} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for metric in ("partial_emit_to_ws", "accurate_emit_to_ws", "accurate_audio_to_ws", "loop_lag"):
+        for label, _p, _t in modes:
+            p = result["modes"][label][metric]
+            if p["n"]:
+                print(f"{metric:<24} {label:<16} {p['n']:>6} {p['p50']:>8.1f} {p['p95']:>8.1f} {p['p99']:>8.1f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
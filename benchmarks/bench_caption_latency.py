@@ -0,0 +1,221 @@
+"""
+Caption Latency Benchmark
+用确定性回放源驱动 AudioTranscriptionService，统计端到端字幕延迟
+
+指标（模拟时钟，单位秒）：
+- start_to_first_partial: VAD START 事件 -> 该句第一条 partial
+- end_to_accurate:        VAD END 事件 -> 该句 accurate 字幕
+- final_rtf:              final 解码耗时 / 语音段时长
+
+用法：
+    python -m benchmarks.bench_caption_latency --stub-model --stub-vad --synthetic 120
+    python -m benchmarks.bench_caption_latency lecture.wav --speed 1 --out results.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.config import SR, UTT_Q_MAX
+from src.services.audio_service import AudioTranscriptionService, CaptionOutput, UTTEvent
+from src.services.audio_source import read_audio_file
+from benchmarks.replay import (
+    SimClock, ReplayInputStream, StubWhisperModel, EnergyVAD, RecordingQueue, TimedModel,
+    make_synthetic_lecture, pad_for_final,
+)
+
+
+@dataclass
+class ReplayRecord:
+    """一次回放的原始记录（时间均为模拟秒）"""
+    events: List[Tuple[str, float, int]] = field(default_factory=list)
+    partials: List[Tuple[float, CaptionOutput]] = field(default_factory=list)
+    accurates: List[Tuple[float, CaptionOutput]] = field(default_factory=list)
+    final_calls: List[Tuple[float, float]] = field(default_factory=list)
+    partial_calls: List[Tuple[float, float]] = field(default_factory=list)
+
+
+def build_service(clock: SimClock, args) -> AudioTranscriptionService:
+    """创建服务：真实模型或桩模型"""
+    service = AudioTranscriptionService()
+    if args.stub_model:
+        service.partial_model = StubWhisperModel(clock, args.partial_delay, args.partial_per_sec, name="partial")
+        service.final_model = StubWhisperModel(clock, args.final_delay, args.final_per_sec, name="final")
+        service.vad_engine = None
+    else:
+        service.initialize()
+        service.partial_model = TimedModel(service.partial_model, clock, name="partial")
+        service.final_model = TimedModel(service.final_model, clock, name="final")
+    if args.stub_vad:
+        service.vad_engine = EnergyVAD()
+    elif service.vad_engine is None:
+        from src.services.vad_engine import load_vad_engine
+        service.vad_engine = load_vad_engine()
+    return service
+
+
+def run_replay(service: AudioTranscriptionService, audio_i16: np.ndarray, clock: SimClock) -> ReplayRecord:
+    """回放一段音频，直到所有语音段处理完毕"""
+    record = ReplayRecord()
+    lock = threading.Lock()
+
+    def on_partial(c: CaptionOutput):
+        with lock:
+            record.partials.append((clock.now(), c))
+
+    def on_accurate(c: CaptionOutput):
+        with lock:
+            record.accurates.append((clock.now(), c))
+
+    evt_q = RecordingQueue(clock, maxsize=UTT_Q_MAX)
+    service.evt_q = evt_q
+    service.set_partial_callback(on_partial)
+    service.set_accurate_callback(on_accurate)
+
+    finished = threading.Event()
+    service.input_stream_factory = ReplayInputStream.factory(pad_for_final(audio_i16), clock, on_finished=finished.set)
+    service._offline_done.clear()
+    service.start_capture()
+
+    finished.wait()
+    # 等 VAD 处理完最后一批块，再用 EOF 标记确认转写线程已处理完之前的所有事件
+    while not service.audio_q.empty():
+        time.sleep(0.05)
+    time.sleep(0.5)
+    evt_q.put(UTTEvent(kind="EOF", t=time.monotonic()))
+    service._offline_done.wait()
+    service.stop_capture()
+
+    record.events = list(evt_q.log)
+    record.final_calls = list(service.final_model.calls)
+    record.partial_calls = list(service.partial_model.calls)
+    return record
+
+
+def percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "mean": None}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+        "mean": float(arr.mean()),
+    }
+
+
+def compute_metrics(record: ReplayRecord) -> Dict[str, List[float]]:
+    """从回放记录计算每句延迟"""
+    starts = [(t, pos) for kind, t, pos in record.events if kind == "START"]
+    ends = [(t, pos) for kind, t, pos in record.events if kind == "END"]
+
+    start_to_partial: List[float] = []
+    for i, (t_start, _pos) in enumerate(starts):
+        t_next = starts[i + 1][0] if i + 1 < len(starts) else float("inf")
+        for t_p, _c in record.partials:
+            if t_start <= t_p < t_next:
+                start_to_partial.append(t_p - t_start)
+                break
+
+    end_time_by_pos = {pos: t for t, pos in ends}
+    end_to_accurate: List[float] = []
+    for t_a, c in record.accurates:
+        if c.audio_end is None:
+            continue
+        t_end = end_time_by_pos.get(int(round(c.audio_end * SR)))
+        if t_end is not None:
+            end_to_accurate.append(t_a - t_end)
+
+    final_rtf = [dt / dur for dur, dt in record.final_calls if dur > 0]
+
+    return {
+        "start_to_first_partial": start_to_partial,
+        "end_to_accurate": end_to_accurate,
+        "final_rtf": final_rtf,
+    }
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def load_fixtures(args) -> List[Tuple[str, np.ndarray]]:
+    fixtures = [(os.path.basename(p), read_audio_file(p)) for p in args.fixtures]
+    if not fixtures:
+        fixtures.append((f"synthetic_{int(args.synthetic)}s", make_synthetic_lecture(args.synthetic, seed=args.seed)))
+    return fixtures
+
+
+def add_common_args(parser: argparse.ArgumentParser):
+    parser.add_argument("fixtures", nargs="*", help="fixture recordings (default: synthetic lecture)")
+    parser.add_argument("--synthetic", type=float, default=120.0, help="synthetic fixture length (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speed", type=float, default=1.0, help="simulated clock speed-up")
+    parser.add_argument("--stub-model", action="store_true", help="use StubWhisperModel instead of real models")
+    parser.add_argument("--stub-vad", action="store_true", help="use energy VAD (deterministic for synthetic audio)")
+    parser.add_argument("--partial-delay", type=float, default=0.08, help="stub partial decode base delay (s)")
+    parser.add_argument("--partial-per-sec", type=float, default=0.03, help="stub partial delay per audio second")
+    parser.add_argument("--final-delay", type=float, default=0.15, help="stub final decode base delay (s)")
+    parser.add_argument("--final-per-sec", type=float, default=0.08, help="stub final delay per audio second")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end caption latency benchmark")
+    add_common_args(parser)
+    parser.add_argument("--out", default=os.path.join("data", "bench", "caption_latency.json"))
+    args = parser.parse_args()
+
+    all_metrics: Dict[str, List[float]] = {"start_to_first_partial": [], "end_to_accurate": [], "final_rtf": []}
+    per_fixture = []
+
+    for name, audio in load_fixtures(args):
+        clock = SimClock(args.speed)
+        service = build_service(clock, args)
+        print(f"Replaying {name} ({audio.size / SR:.1f}s, speed x{args.speed}) ...")
+        record = run_replay(service, audio, clock)
+        metrics = compute_metrics(record)
+        per_fixture.append({
+            "fixture": name,
+            "audio_sec": audio.size / SR,
+            "utterances": sum(1 for e in record.events if e[0] == "END"),
+            "partials": len(record.partials),
+            "accurates": len(record.accurates),
+            "metrics": {k: percentiles(v) for k, v in metrics.items()},
+        })
+        for k, v in metrics.items():
+            all_metrics[k].extend(v)
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("fixtures", "out")},
+        "fixtures": per_fixture,
+        "metrics": {k: percentiles(v) for k, v in all_metrics.items()},
+    }
+
+    print("=" * 80)
+    for k, p in result["metrics"].items():
+        if p["n"]:
+            print(f"{k:<24} n={p['n']:<5} p50={p['p50']:.3f}  p95={p['p95']:.3f}  p99={p['p99']:.3f}")
+        else:
+            print(f"{k:<24} n=0")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
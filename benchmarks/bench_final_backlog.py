@@ -0,0 +1,75 @@
+"""
+Final Backlog Benchmark
+模拟 final_q 积压：取录音中的前 N 句，比较逐句 transcribe_once 与一次 transcribe_batch 清空积压的耗时
+
+用法：
+    python -m benchmarks.bench_final_backlog lecture.wav --backlog 2 4 8
+"""
+import argparse
+import time
+
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+from src.config import (
+    SR, MODEL_DIR_FINAL, DEVICE, COMPUTE_TYPE_FINAL, LANGUAGE, BEAM_SIZE, TEMPERATURE, PATIENCE,
+    DEFAULT_PROF_WORDS, FINAL_BATCH_MAX_CLIP_SEC,
+)
+from src.services.audio_service import int16_to_float32, transcribe_once, transcribe_batch, check_final_text
+from src.services.audio_source import read_audio_file
+from src.services.parallel_transcribe import split_speech_segments, MIN_SEGMENT_SEC
+from src.services.vad_engine import load_vad_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to drain a final-decode backlog: sequential vs batched")
+    parser.add_argument("input", help="audio file (.wav / .flac / .pcm)")
+    parser.add_argument("--backlog", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--device", default=DEVICE)
+    parser.add_argument("--compute-type", default=COMPUTE_TYPE_FINAL)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    audio_i16 = read_audio_file(args.input)
+    segments = [
+        (s, e) for s, e in split_speech_segments(audio_i16, load_vad_engine())
+        if MIN_SEGMENT_SEC <= (e - s) / SR <= FINAL_BATCH_MAX_CLIP_SEC
+    ]
+    utterances = [int16_to_float32(audio_i16[s:e]) for s, e in segments]
+    print(f"{len(utterances)} utterances available")
+
+    model = WhisperModel(MODEL_DIR_FINAL, device=args.device, compute_type=args.compute_type)
+    pipeline = BatchedInferencePipeline(model=model)
+    opts = dict(language=LANGUAGE, beam_size=BEAM_SIZE, temperature=TEMPERATURE, patience=PATIENCE,
+                initial_prompt=DEFAULT_PROF_WORDS)
+
+    # 预热
+    transcribe_once(model, utterances[0], condition_on_previous_text=True, vad_filter=True, **opts)
+
+    print("=" * 90)
+    print(f"{'backlog':>7} {'audio(s)':>9} {'sequential(s)':>14} {'batched(s)':>11} {'speedup':>8} {'accepted seq/batch':>19}")
+    for n in args.backlog:
+        batch = utterances[:n]
+        if len(batch) < n:
+            print(f"{n:>7} not enough utterances")
+            continue
+        audio_sec = sum(a.size for a in batch) / SR
+
+        seq_best, seq_ok = float("inf"), 0
+        bat_best, bat_ok = float("inf"), 0
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            seq = [transcribe_once(model, a, condition_on_previous_text=True, vad_filter=True, **opts) for a in batch]
+            seq_best = min(seq_best, time.perf_counter() - t0)
+            seq_ok = sum(check_final_text(t, i.no_speech_prob, i.avg_logprob) is None for t, i in seq)
+
+            t0 = time.perf_counter()
+            bat = transcribe_batch(pipeline, batch, batch_size=n, **opts)
+            bat_best = min(bat_best, time.perf_counter() - t0)
+            bat_ok = sum(check_final_text(t, i.no_speech_prob, i.avg_logprob) is None for t, i in bat)
+
+        print(f"{n:>7} {audio_sec:>9.1f} {seq_best:>14.2f} {bat_best:>11.2f} {seq_best / bat_best:>7.2f}x "
+              f"{seq_ok:>9}/{bat_ok}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+LLM Client Load Test
+对本地模拟服务（mock_llm_server，独立进程）压测 LLM 客户端
+
+模式：
+- per_call: 每次调用新建 OpenAI 客户端（旧 DSV3 / 每批次新建客户端的行为，每次重新建立连接，无重试）
+- shared:   共享的 LLMClient（连接池 + 超时 + 指数退避重试 + 并发上限）
+- async:    同一个 LLMClient 的 agenerate()
+
+--callers 个调用方并发，每个连续发出 --calls 次请求；模拟服务按 --error-rate / --rate-limit-rate 返回 500 / 429。
+指标：调用延迟（含重试等待）、失败数、重试数、模拟服务观察到的最大并发请求数。
+（模拟服务是明文 HTTP，per_call 的额外开销只含 TCP 建连；真实服务还要加上 TLS 握手）
+
+用法：
+    python -m benchmarks.bench_llm_client --callers 8 --calls 20 --latency 0.5
+    python -m benchmarks.bench_llm_client --error-rate 0.1 --rate-limit-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+from openai import OpenAI
+
+from src.agent.llm import LLMClient
+from benchmarks.bench_caption_latency import percentiles, git_commit
+
+
+PROMPT = "<previous></previous><transcript chunk>the gradient of the loss tells us which direction to move</transcript chunk>"
+
+
+def run_mock(port: int, settings_kwargs: Dict[str, Any]):
+    import uvicorn
+    from benchmarks.mock_llm_server import MockSettings, create_app
+
+    uvicorn.run(create_app(MockSettings(**settings_kwargs)), host="127.0.0.1", port=port, log_level="warning")
+
+
+def mock_stats(port: int) -> Dict[str, Any]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def wait_ready(port: int, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            mock_stats(port)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("mock LLM server did not start")
+
+
+def run_threads(call, callers: int, calls: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            try:
+                call()
+                ok = True
+            except Exception:
+                ok = False
+            dt = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                if ok:
+                    latencies.append(dt)
+                else:
+                    failures[0] += 1
+
+    t_start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(callers)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return {"total_sec": time.perf_counter() - t_start, "latency_ms": percentiles(latencies), "failures": failures[0]}
+
+
+async def run_async(client: LLMClient, callers: int, calls: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            try:
+                await client.agenerate(PROMPT)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+            except Exception:
+                failures += 1
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(callers)))
+    return {"total_sec": time.perf_counter() - t_start, "latency_ms": percentiles(latencies), "failures": failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client load test against the local mock provider")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--callers", type=int, default=8, help="concurrent callers")
+    parser.add_argument("--calls", type=int, default=20, help="calls per caller")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock response latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock HTTP 500 probability")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="mock HTTP 429 probability")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--max-concurrency", type=int, default=4, help="LLMClient concurrency cap")
+    parser.add_argument("--out", default=os.path.join("data", "bench", "llm_client.json"))
+    args = parser.parse_args()
+
+    settings = {
+        "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate, "retry_after": args.retry_after,
+    }
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    modes: Dict[str, Dict[str, Any]] = {}
+
+    for mode in ("per_call", "shared", "async"):
+        server = mp.Process(target=run_mock, args=(args.port, settings), daemon=True)
+        server.start()
+        try:
+            wait_ready(args.port)
+            print(f"[{mode}] {args.callers} callers x {args.calls} calls ...")
+            if mode == "per_call":
+                def call():
+                    client = OpenAI(base_url=base_url, api_key="EMPTY", max_retries=0)
+                    try:
+                        client.chat.completions.create(model="mock", messages=[{"role": "user", "content": PROMPT}])
+                    finally:
+                        client.close()
+
+                result = run_threads(call, args.callers, args.calls)
+                result["retries"] = 0
+            else:
+                client = LLMClient(mode, base_url, "EMPTY", "mock", max_concurrency=args.max_concurrency)
+                if mode == "shared":
+                    result = run_threads(lambda: client.generate(PROMPT), args.callers, args.calls)
+                else:
+                    result = asyncio.run(run_async(client, args.callers, args.calls))
+                result["retries"] = client.retries
+                client.close()
+            result["server"] = mock_stats(args.port)
+            modes[mode] = result
+        finally:
+            server.terminate()
+            server.join(timeout=5)
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "modes": modes,
+    }
+
+    print("=" * 80)
+    print(f"{'mode':<10} {'total':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'failures':>9} {'retries':>8} {'max inflight':>13}")
+    for label, r in modes.items():
+        lat = r["latency_ms"]
+        print(f"{label:<10} {r['total_sec']:>7.2f}s {lat['p50'] or 0:>7.1f}ms {lat['p95'] or 0:>7.1f}ms "
+              f"{lat['p99'] or 0:>7.1f}ms {r['failures']:>9} {r['retries']:>8} {r['server']['max_inflight']:>13}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Notes Store Benchmark
+对比结构化笔记的两种保存方式（模拟约 3 小时课程、500 个批次）：
+- legacy: 每个批次后持锁把整个 structured_content 以 indent=2 重写为 JSON（旧 save_to_file）
+- store:  每个批次向会话 JSONL 追加一行（NotesStore），读取方不持锁取快照
+
+写入线程连续写完所有批次，同时一个读取线程不断调用 get_all_content，统计：
+- 每批写入耗时、累计写入字节数
+- 读取调用耗时（legacy 下包含等待写入方释放锁的时间）
+- 重新加载耗时（legacy: json.load；store: 逐行重放），以及 store 的压缩 / 导出耗时
+
+用法：
+    python -m benchmarks.bench_notes_store [--batches 500] [--fsync]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from src.services.notes_store import NotesStore, load_contents
+from benchmarks.bench_caption_latency import percentiles, git_commit
+
+
+_WORDS = (
+    "gradient descent eigenvalue matrix theorem proof lemma integral derivative convergence "
+    "probability distribution variance estimator regression kernel optimization constraint"
+).split()
+
+
+def make_batches(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成与 LLM 输出结构相同的批次内容（每批 3~8 条知识点，偶有作业和问题）"""
+    rng = random.Random(seed)
+
+    def sentence(n_words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(n_words))
+
+    return [
+        {
+            "coursework": [sentence(12) for _ in range(rng.choice((0, 0, 0, 1, 2)))],
+            "knowledge": [sentence(rng.randint(15, 30)) for _ in range(rng.randint(3, 8))],
+            "question": [sentence(14) for _ in range(rng.choice((0, 0, 1, 2, 3)))],
+        }
+        for _ in range(n)
+    ]
+
+
+class LegacyJsonStore:
+    """旧实现：结果列表 + 每批持锁重写整个 JSON 文件"""
+
+    def __init__(self, path: str, fsync: bool):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.structured_content: List[Dict[str, Any]] = []
+        self.bytes_written = 0
+
+    def add(self, content: Dict[str, Any]):
+        with self.lock:
+            self.structured_content.append(content)
+        with self.lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.structured_content, f, ensure_ascii=False, indent=2)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self.bytes_written += f.tell()
+
+    def get_all_content(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return self.structured_content.copy()
+
+
+class AppendStore:
+    """新实现：结果列表只追加 + 会话 JSONL 追加一行（与 LLMProcessorService 相同）"""
+
+    def __init__(self, path: str, fsync: bool):
+        self.store = NotesStore(path, fsync=fsync)
+        self.lock = threading.Lock()
+        self.structured_content: List[Dict[str, Any]] = []
+
+    def add(self, content: Dict[str, Any]):
+        with self.lock:
+            self.structured_content.append(content)
+            batch_no = len(self.structured_content)
+        self.store.append_batch(batch_no, content, "{}")
+
+    def get_all_content(self) -> List[Dict[str, Any]]:
+        return self.structured_content[:]
+
+    @property
+    def bytes_written(self) -> int:
+        return os.path.getsize(self.store.path)
+
+
+def run(store, batches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    write_ms: List[float] = []
+    read_ms: List[float] = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            store.get_all_content()
+            read_ms.append((time.perf_counter() - t0) * 1000.0)
+            time.sleep(0.001)
+
+    th = threading.Thread(target=reader, daemon=True)
+    th.start()
+    t_start = time.perf_counter()
+    for content in batches:
+        t0 = time.perf_counter()
+        store.add(content)
+        write_ms.append((time.perf_counter() - t0) * 1000.0)
+    total_sec = time.perf_counter() - t_start
+    stop.set()
+    th.join()
+
+    return {
+        "write_total_sec": total_sec,
+        "write_ms": percentiles(write_ms),
+        "read_ms": percentiles(read_ms),
+        "read_max_ms": max(read_ms) if read_ms else None,
+        "bytes_written": store.bytes_written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Structured notes persistence: JSON rewrite vs append-only JSONL")
+    parser.add_argument("--batches", type=int, default=500, help="LLM batches (~3 h lecture)")
+    parser.add_argument("--fsync", action="store_true", help="fsync after every write in both modes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=os.path.join("data", "bench", "notes_store.json"))
+    args = parser.parse_args()
+
+    batches = make_batches(args.batches, args.seed)
+    tmp_dir = tempfile.mkdtemp(prefix="notes_bench_")
+    try:
+        legacy_path = os.path.join(tmp_dir, "legacy_content.json")
+        store_path = os.path.join(tmp_dir, "session_content.jsonl")
+
+        print(f"[legacy] {args.batches} batches ...")
+        legacy = run(LegacyJsonStore(legacy_path, args.fsync), batches)
+        t0 = time.perf_counter()
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            n_legacy = len(json.load(f))
+        legacy["load_sec"] = time.perf_counter() - t0
+        legacy["file_bytes"] = os.path.getsize(legacy_path)
+
+        print(f"[store] {args.batches} batches ...")
+        append = AppendStore(store_path, args.fsync)
+        store = run(append, batches)
+        t0 = time.perf_counter()
+        n_store = len(load_contents(store_path)[0])
+        store["load_sec"] = time.perf_counter() - t0
+        store["file_bytes"] = os.path.getsize(store_path)
+        t0 = time.perf_counter()
+        append.store.compact()
+        store["compact_sec"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        append.store.export_json()
+        store["export_sec"] = time.perf_counter() - t0
+        append.store.close()
+
+        assert n_legacy == n_store == args.batches, (n_legacy, n_store)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "modes": {"legacy": legacy, "store": store},
+    }
+
+    print("=" * 80)
+    print(f"{'mode':<8} {'write total':>12} {'write p99':>10} {'read p99':>10} {'read max':>10} {'bytes written':>14} {'load':>8}")
+    for label, r in result["modes"].items():
+        print(f"{label:<8} {r['write_total_sec']:>11.3f}s {r['write_ms']['p99']:>8.2f}ms {r['read_ms']['p99']:>8.3f}ms "
+              f"{r['read_max_ms']:>8.2f}ms {r['bytes_written']:>14,} {r['load_sec'] * 1000:>6.1f}ms")
+    print(f"store compact={store['compact_sec'] * 1000:.1f}ms export={store['export_sec'] * 1000:.1f}ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
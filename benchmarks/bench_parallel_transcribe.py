@@ -0,0 +1,50 @@
+"""
+Parallel Transcription Benchmark
+测量离线并行转写的吞吐量随进程数的变化（受 PARALLEL_MAX_MEMORY_MB 约束）
+
+用法：
+    python -m benchmarks.bench_parallel_transcribe lecture.wav --workers 1 2 4 8 16
+"""
+import argparse
+
+from src.config import PARALLEL_MAX_MEMORY_MB, PARALLEL_COMPUTE_TYPE, MODEL_DIR_FINAL
+from src.services.parallel_transcribe import (
+    transcribe_file_parallel, estimate_replica_mb, plan_workers,
+)
+from src.services.vad_engine import load_vad_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput vs. worker count")
+    parser.add_argument("input", help="audio file (.wav / .flac / .pcm)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--compute-type", default=PARALLEL_COMPUTE_TYPE)
+    parser.add_argument("--max-memory-mb", type=float, default=PARALLEL_MAX_MEMORY_MB)
+    args = parser.parse_args()
+
+    replica_mb = estimate_replica_mb(MODEL_DIR_FINAL, args.compute_type)
+    print(f"Estimated replica memory: {replica_mb:.0f} MB, cap: {args.max_memory_mb:.0f} MB "
+          f"(max {plan_workers(10 ** 6, args.max_memory_mb, replica_mb)} replicas)")
+    print("=" * 90)
+    print(f"{'requested':>9} {'used':>5} {'audio(s)':>9} {'wall(s)':>8} {'RTF':>7} {'x realtime':>11} {'captions':>9}")
+
+    vad_engine = load_vad_engine()
+    baseline = None
+    for n in args.workers:
+        result = transcribe_file_parallel(
+            args.input,
+            workers=n,
+            compute_type=args.compute_type,
+            max_memory_mb=args.max_memory_mb,
+            vad_engine=vad_engine,
+        )
+        speed = result.audio_sec / result.elapsed_sec if result.elapsed_sec > 0 else 0.0
+        baseline = baseline or speed
+        print(f"{n:>9} {result.workers:>5} {result.audio_sec:>9.1f} {result.elapsed_sec:>8.1f} "
+              f"{result.rtf:>7.3f} {speed:>10.1f}x {len(result.captions):>9}   "
+              f"(speedup {speed / baseline:.2f})")
+    print("\nWall time includes per-process model loading.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Partial Freeze Benchmark
+对比 final 解码在转写线程内同步执行与独立线程执行时，partial 字幕的"冻结"时间
+
+冻结时间（每句）：START -> 第一条 partial，以及该句内相邻 partial 间隔中的最大值
+
+用法：
+    python -m benchmarks.bench_partial_freeze --stub-model --stub-vad --synthetic 180
+    python -m benchmarks.bench_partial_freeze lecture.wav
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+from src.config import SR
+from benchmarks.bench_caption_latency import (
+    ReplayRecord, build_service, run_replay, compute_metrics, percentiles,
+    git_commit, load_fixtures, add_common_args,
+)
+from benchmarks.replay import SimClock
+
+
+def partial_freeze(record: ReplayRecord) -> List[float]:
+    """每句 partial 的最长停顿（模拟秒）"""
+    starts = [t for kind, t, _pos in record.events if kind == "START"]
+    ends = [t for kind, t, _pos in record.events if kind == "END"]
+    partial_times = sorted(t for t, _c in record.partials)
+
+    out: List[float] = []
+    for i, t_start in enumerate(starts):
+        t_end = ends[i] if i < len(ends) else float("inf")
+        times = [t for t in partial_times if t_start <= t < t_end]
+        if not times:
+            continue
+        gaps = [times[0] - t_start] + [b - a for a, b in zip(times, times[1:])]
+        out.append(max(gaps))
+    return out
+
+
+def run_mode(args, separate: bool) -> Dict[str, List[float]]:
+    values: Dict[str, List[float]] = {"partial_freeze": [], "start_to_first_partial": [], "end_to_accurate": []}
+    for name, audio in load_fixtures(args):
+        clock = SimClock(args.speed)
+        service = build_service(clock, args)
+        service.separate_final_worker = separate
+        print(f"[{'separate' if separate else 'inline'}] replaying {name} ({audio.size / SR:.1f}s) ...")
+        record = run_replay(service, audio, clock)
+        metrics = compute_metrics(record)
+        values["partial_freeze"].extend(partial_freeze(record))
+        values["start_to_first_partial"].extend(metrics["start_to_first_partial"])
+        values["end_to_accurate"].extend(metrics["end_to_accurate"])
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partial caption freeze: inline vs separate final worker")
+    add_common_args(parser)
+    # 默认模拟 CPU 上 beam-8 medium.en 的 final 解码代价
+    parser.set_defaults(final_delay=0.3, final_per_sec=0.25)
+    parser.add_argument("--out", default=os.path.join("data", "bench", "partial_freeze.json"))
+    args = parser.parse_args()
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("fixtures", "out")},
+        "modes": {},
+    }
+    for label, separate in (("inline", False), ("separate", True)):
+        values = run_mode(args, separate)
+        result["modes"][label] = {k: percentiles(v) for k, v in values.items()}
+
+    print("=" * 80)
+    print(f"{'metric':<24} {'mode':<10} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for metric in ("partial_freeze", "start_to_first_partial", "end_to_accurate"):
+        for label in ("inline", "separate"):
+            p = result["modes"][label][metric]
+            if p["n"]:
+                print(f"{metric:<24} {label:<10} {p['p50']:>8.3f} {p['p95']:>8.3f} {p['p99']:>8.3f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
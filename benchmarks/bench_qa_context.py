@@ -0,0 +1,222 @@
+"""
+Q&A Context Benchmark
+问答提示词大小和回答延迟随课堂时长的变化：全部笔记（旧行为） vs 检索选取（build_qa_context）
+
+合成课堂：每 --batch-sec 秒一个批次（3~5 条知识点，少数批次带作业安排），转写原文按约 170 词/分钟生成并提到当批的概念。
+问题针对随机一个批次的知识点（概念名由词表中的两个词组成，其他批次和转写原文中会出现相同的单词作为干扰），
+另有部分问题问作业安排（期望命中最近一条作业）。
+
+指标：
+- prompt_tokens: 提示词 token 数（estimate_tokens）
+- recall: 期望的笔记条目出现在提示词中的比例
+- build_ms: 选取上下文并生成提示词的耗时；index_update_us: 每条字幕 / 每个批次更新索引的耗时
+- answer_ms: 对本地模拟服务（mock_llm_server，独立进程）调用 LLMClient.generate() 的延迟，
+  模拟服务按 --per-prompt-token 模拟预填充耗时（--no-llm 跳过）
+
+用法：
+    python -m benchmarks.bench_qa_context [--minutes 15 30 60 90 180] [--questions 20]
+    python -m benchmarks.bench_qa_context --budget 3000 --no-llm
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from src.config import QA_CONTEXT_MAX_TOKENS, QA_TOP_K
+from src.services.llm_service import LLMProcessorService
+from src.services.transcript_chunker import estimate_tokens
+from benchmarks.bench_caption_latency import percentiles, git_commit
+from benchmarks.bench_llm_client import run_mock, mock_stats, wait_ready
+
+
+_CONCEPT_WORDS = (
+    "gradient loss entropy kernel margin prior posterior variance bias momentum dropout attention "
+    "embedding softmax convolution pooling residual batch layer norm decay sampling tree boosting "
+    "cluster distance projection eigen matrix rank"
+).split()
+_FILLER = (
+    "so this means that when we look at the model the value changes with each step and we can see "
+    "how the result depends on the data and the choice of parameters in practice"
+).split()
+
+
+def make_session(minutes: float, batch_sec: float, seed: int) -> List[Tuple[List[str], Dict[str, Any]]]:
+    """[(本批次期间的字幕, 本批次笔记)]"""
+    rng = random.Random(seed)
+    used = set()
+
+    def new_concept() -> str:
+        # 两个词的组合用完后改用三个词（长课堂）
+        while True:
+            words = 2 if len(used) < len(_CONCEPT_WORDS) * (len(_CONCEPT_WORDS) - 1) // 2 else 3
+            concept = " ".join(rng.sample(_CONCEPT_WORDS, words))
+            if concept not in used:
+                used.add(concept)
+                return concept
+
+    session = []
+    for batch_no in range(1, int(minutes * 60 / batch_sec) + 1):
+        knowledge = []
+        for _ in range(rng.randint(3, 5)):
+            filler = " ".join(rng.choice(_FILLER) for _ in range(rng.randint(12, 24)))
+            knowledge.append(f"{new_concept()}: {filler}")
+        coursework = []
+        if rng.random() < 0.05:
+            coursework.append(f"作业：完成第 {batch_no} 页的习题，下周{rng.choice('一二三四五')}课前提交")
+
+        captions = []
+        words = int(batch_sec * 170 / 60)
+        while words > 0:
+            n = rng.randint(8, 30)
+            concept = rng.choice(knowledge).split(":")[0]
+            captions.append(" ".join(rng.choice(_FILLER) for _ in range(n)) + " " + concept)
+            words -= n
+        session.append((captions, {"coursework": coursework, "knowledge": knowledge, "question": []}))
+    return session
+
+
+def make_questions(session, count: int, seed: int) -> List[Tuple[str, str]]:
+    """[(问题, 期望出现在提示词中的笔记条目)]"""
+    rng = random.Random(seed + 1)
+    homework = [item for _, content in session for item in content["coursework"]]
+    questions = []
+    for i in range(count):
+        if homework and i % 5 == 4:
+            questions.append(("这节课的作业是什么？什么时候交？", homework[-1]))
+            continue
+        _, content = rng.choice(session)
+        item = rng.choice(content["knowledge"])
+        concept = item.split(":")[0]
+        template = rng.choice(["What did the lecture say about {}?", "{} 是什么意思？", "老师讲的 {} 和前面有什么关系？"])
+        questions.append((template.format(concept), item))
+    return questions
+
+
+def full_prompt(service: LLMProcessorService, question: str) -> str:
+    """旧行为：全部结构化笔记（get_content_as_text）"""
+    return f"<user_query>{question}</user_query>\n\n<class_content>\n{service.get_content_as_text()}\n</class_content>\n"
+
+
+def build_service(session, budget: int, top_k: int) -> Tuple[LLMProcessorService, Dict[str, Any]]:
+    """按时间顺序喂入字幕和批次（与运行时相同的增量更新路径），记录每次更新的耗时"""
+    service = LLMProcessorService(qa_max_tokens=budget, qa_top_k=top_k)
+    service.auto_save = False
+    caption_us: List[float] = []
+    batch_us: List[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for captions, content in session:
+            for text in captions:
+                t0 = time.perf_counter()
+                service.add_transcript(text)
+                caption_us.append((time.perf_counter() - t0) * 1e6)
+            t0 = time.perf_counter()
+            service._store_batch(content, "{}")
+            batch_us.append((time.perf_counter() - t0) * 1e6)
+    return service, {"caption": percentiles(caption_us), "batch": percentiles(batch_us)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q&A prompt size and latency versus lecture length")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[15, 30, 60, 90, 180])
+    parser.add_argument("--batch-sec", type=float, default=45.0, help="simulated time between LLM batches")
+    parser.add_argument("--questions", type=int, default=20, help="questions per session length")
+    parser.add_argument("--budget", type=int, default=QA_CONTEXT_MAX_TOKENS, help="class content token budget")
+    parser.add_argument("--top-k", type=int, default=QA_TOP_K)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-llm", action="store_true", help="skip answer latency against the mock provider")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--latency", type=float, default=0.3, help="mock base latency (s)")
+    parser.add_argument("--per-prompt-token", type=float, default=0.0005, help="mock prefill time per prompt token (s)")
+    parser.add_argument("--out", default=os.path.join("data", "bench", "qa_context.json"))
+    args = parser.parse_args()
+
+    server = None
+    client = None
+    if not args.no_llm:
+        from src.agent.llm import LLMClient
+
+        settings = {"latency": args.latency, "jitter": 0.0, "per_prompt_token": args.per_prompt_token}
+        server = mp.Process(target=run_mock, args=(args.port, settings), daemon=True)
+        server.start()
+        wait_ready(args.port)
+        client = LLMClient("bench", f"http://127.0.0.1:{args.port}/v1", "EMPTY", "mock")
+
+    sessions: Dict[str, Dict[str, Any]] = {}
+    try:
+        for minutes in args.minutes:
+            session = make_session(minutes, args.batch_sec, args.seed)
+            questions = make_questions(session, args.questions, args.seed)
+            service, index_update_us = build_service(session, args.budget, args.top_k)
+
+            modes: Dict[str, Dict[str, List[float]]] = {
+                m: {"tokens": [], "hits": [], "build_ms": [], "answer_ms": []} for m in ("full", "retrieval")
+            }
+            for question, expected in questions:
+                for mode in modes:
+                    t0 = time.perf_counter()
+                    prompt = full_prompt(service, question) if mode == "full" else service.build_qa_prompt(question)
+                    modes[mode]["build_ms"].append((time.perf_counter() - t0) * 1000.0)
+                    modes[mode]["tokens"].append(estimate_tokens(prompt))
+                    modes[mode]["hits"].append(1.0 if expected in prompt else 0.0)
+                    if client is not None:
+                        t0 = time.perf_counter()
+                        client.generate(prompt)
+                        modes[mode]["answer_ms"].append((time.perf_counter() - t0) * 1000.0)
+
+            stats = service.get_stats()
+            sessions[f"{minutes:g}min"] = {
+                "batches": len(session),
+                "index_passages": stats["qa_index_passages"],
+                "index_tokens": stats["qa_index_tokens"],
+                "index_update_us": index_update_us,
+                "modes": {
+                    mode: {
+                        "prompt_tokens": percentiles(r["tokens"]),
+                        "recall": sum(r["hits"]) / len(r["hits"]) if r["hits"] else None,
+                        "build_ms": percentiles(r["build_ms"]),
+                        "answer_ms": percentiles(r["answer_ms"]),
+                    }
+                    for mode, r in modes.items()
+                },
+            }
+            print(f"[{minutes:g}min] {len(session)} batches, {stats['qa_index_passages']} passages indexed")
+    finally:
+        if client is not None:
+            client.close()
+        if server is not None:
+            server_stats = mock_stats(args.port)
+            server.terminate()
+            server.join(timeout=5)
+            print(f"mock requests: {server_stats['requests']}")
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "sessions": sessions,
+    }
+
+    print("=" * 96)
+    print(f"{'session':<9} {'mode':<10} {'tok p50':>8} {'tok p95':>8} {'recall':>7} {'build p50':>10} "
+          f"{'answer p50':>11} {'answer p95':>11} {'upd p99':>9}")
+    for name, r in sessions.items():
+        for mode, m in r["modes"].items():
+            upd = r["index_update_us"]["batch"]["p99"] if mode == "retrieval" else None
+            print(f"{name:<9} {mode:<10} {m['prompt_tokens']['p50'] or 0:>8.0f} {m['prompt_tokens']['p95'] or 0:>8.0f} "
+                  f"{m['recall'] or 0:>7.2f} {m['build_ms']['p50'] or 0:>8.2f}ms "
+                  f"{m['answer_ms']['p50'] or 0:>9.0f}ms {m['answer_ms']['p95'] or 0:>9.0f}ms "
+                  f"{'' if upd is None else f'{upd:.0f}us':>9}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Utterance Buffer Benchmark
+对比 list + np.concatenate（旧实现）与预分配 UtteranceBuffer 的每句分配量和 CPU 时间
+
+用法：
+    python -m benchmarks.bench_utterance_buffer [--utterances 50] [--seconds 18]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import List
+
+import numpy as np
+
+from src.config import (
+    SR, BLOCK_SAMPLES, BLOCK_MS, PADDING_SAMPLES, PARTIAL_UPDATE_MS,
+    PARTIAL_TAIL_SEC, MAX_UTT_S, UTT_BUFFER_SAMPLES,
+)
+from src.services.utterance_buffer import UtteranceBuffer
+
+
+def make_blocks(seconds: float, seed: int = 0) -> List[np.ndarray]:
+    """生成一句话的 float32 音频块（与 VAD 线程输出一致）"""
+    rng = np.random.default_rng(seed)
+    n_blocks = int(seconds * 1000 / BLOCK_MS)
+    raw = rng.integers(-8000, 8000, size=(n_blocks, BLOCK_SAMPLES), dtype=np.int16)
+    return [(b.astype(np.float32) / 32768.0) for b in raw]
+
+
+def run_legacy(start_audio: np.ndarray, blocks: List[np.ndarray]) -> int:
+    """旧实现：list 累积，每次 partial/final 都 concatenate；返回新分配的字节数"""
+    allocated = 0
+    acc: List[np.ndarray] = [start_audio.astype(np.float32, copy=False)]
+    tail_blocks = int(PARTIAL_TAIL_SEC * SR / BLOCK_SAMPLES)
+    since_partial_ms = PARTIAL_UPDATE_MS
+    for b in blocks:
+        acc.append(b.astype(np.float32, copy=False))
+        _total = sum(x.size for x in acc)
+        since_partial_ms += BLOCK_MS
+        if since_partial_ms >= PARTIAL_UPDATE_MS:
+            since_partial_ms = 0
+            tail = np.concatenate(acc[-tail_blocks:], axis=0)
+            allocated += tail.nbytes
+    full = np.concatenate(acc, axis=0)
+    allocated += full.nbytes
+    return allocated
+
+
+def run_buffer(buf: UtteranceBuffer, start_audio: np.ndarray, blocks: List[np.ndarray]) -> int:
+    """新实现：预分配缓冲区，返回视图；返回新分配的字节数"""
+    allocated = 0
+    tail_samples = int(PARTIAL_TAIL_SEC * SR)
+    since_partial_ms = PARTIAL_UPDATE_MS
+    buf.clear()
+    buf.append(start_audio)
+    for b in blocks:
+        buf.append(b)
+        _total = len(buf)
+        since_partial_ms += BLOCK_MS
+        if since_partial_ms >= PARTIAL_UPDATE_MS:
+            since_partial_ms = 0
+            tail = buf.tail(tail_samples)
+            if tail.base is None:
+                allocated += tail.nbytes
+    full = buf.full()
+    if full.base is None:
+        allocated += full.nbytes
+    return allocated
+
+
+def measure(name: str, fn, n_utt: int, seconds: float):
+    start_audio = np.zeros((PADDING_SAMPLES,), dtype=np.float32)
+    utterances = [make_blocks(seconds, seed=i) for i in range(n_utt)]
+
+    # 预热
+    fn(start_audio, utterances[0])
+
+    tracemalloc.start()
+    t0 = time.process_time()
+    allocated = 0
+    for blocks in utterances:
+        allocated += fn(start_audio, blocks)
+    cpu = time.process_time() - t0
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<22} cpu/utt={cpu / n_utt * 1000:8.2f} ms  "
+          f"alloc/utt={allocated / n_utt / 1024 / 1024:8.2f} MiB  "
+          f"peak={peak / 1024 / 1024:6.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UtteranceBuffer benchmark")
+    parser.add_argument("--utterances", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=float(MAX_UTT_S))
+    args = parser.parse_args()
+
+    print(f"Utterance length: {args.seconds:.1f}s, utterances: {args.utterances}")
+    print("=" * 80)
+
+    measure("legacy (concatenate)", run_legacy, args.utterances, args.seconds)
+
+    buf_f32 = UtteranceBuffer(UTT_BUFFER_SAMPLES, dtype="float32")
+    measure("buffer float32", lambda a, b: run_buffer(buf_f32, a, b), args.utterances, args.seconds)
+
+    buf_i16 = UtteranceBuffer(UTT_BUFFER_SAMPLES, dtype="int16")
+    measure("buffer int16", lambda a, b: run_buffer(buf_i16, a, b), args.utterances, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+VAD Engine Benchmark
+对比 ONNX Runtime 与 torch 两种 Silero VAD 后端的逐块延迟和导入开销
+
+用法：
+    python -m benchmarks.bench_vad_engine [--blocks 2000] [--batch 1 4 16]
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.config import SR, BLOCK_SAMPLES, BLOCK_MS, VAD_DIR, VAD_ONNX_PATH, VAD_ONNX_THREADS
+from src.services.vad_engine import OnnxSileroVAD, TorchSileroVAD, find_silero_onnx
+
+
+def import_cost(module: str) -> float:
+    """在独立进程中测量导入耗时（秒）"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    try:
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120)
+        return float(out.stdout.strip())
+    except Exception:
+        return float("nan")
+
+
+def make_audio(n_blocks: int, seed: int = 0) -> np.ndarray:
+    """生成测试音频块（噪声 + 间断的正弦，模拟有声/无声交替）"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_blocks * BLOCK_SAMPLES) / SR
+    envelope = (np.sin(2 * np.pi * 0.25 * t) > 0).astype(np.float32)
+    audio = 0.02 * rng.standard_normal(t.size).astype(np.float32)
+    audio += 0.3 * envelope * np.sin(2 * np.pi * 220 * t).astype(np.float32)
+    return audio.reshape(n_blocks, BLOCK_SAMPLES).astype(np.float32)
+
+
+def run(engine, blocks: np.ndarray, batch: int):
+    """按批次推理，返回每块延迟（微秒）"""
+    engine.reset()
+    engine.score(blocks[:batch])  # 预热
+    engine.reset()
+
+    per_block = []
+    for i in range(0, blocks.shape[0], batch):
+        chunk = blocks[i:i + batch]
+        t0 = time.perf_counter()
+        engine.score(chunk)
+        dt = time.perf_counter() - t0
+        per_block.extend([dt / chunk.shape[0] * 1e6] * chunk.shape[0])
+    return np.array(per_block)
+
+
+def report(name: str, batch: int, lat_us: np.ndarray):
+    print(f"{name:<6} batch={batch:<3} per-block mean={lat_us.mean():8.1f} us  "
+          f"p50={np.percentile(lat_us, 50):8.1f} us  p95={np.percentile(lat_us, 95):8.1f} us  "
+          f"({BLOCK_MS} ms audio/block, {lat_us.mean() / (BLOCK_MS * 1000) * 100:.2f}% of real time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Silero VAD backend benchmark")
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    blocks = make_audio(args.blocks)
+
+    print("Import cost (fresh process):")
+    print(f"  onnxruntime: {import_cost('onnxruntime'):.2f}s")
+    print(f"  torch:       {import_cost('torch'):.2f}s")
+    print("=" * 100)
+
+    engines = []
+    onnx_path = VAD_ONNX_PATH or find_silero_onnx(VAD_DIR)
+    if onnx_path:
+        engine = OnnxSileroVAD(onnx_path, num_threads=VAD_ONNX_THREADS)
+        print(f"onnx model: {onnx_path} (format={engine.format})")
+        engines.append(engine)
+    else:
+        print("ONNX model not found, skipping onnx backend")
+    try:
+        from src.services.audio_service import load_silero_vad_local
+        engines.append(TorchSileroVAD(load_silero_vad_local(VAD_DIR)))
+    except Exception as e:
+        print(f"torch backend unavailable: {e}")
+
+    for engine in engines:
+        for batch in args.batch:
+            report(engine.name, batch, run(engine, blocks, batch))
+
+
+if __name__ == "__main__":
+    main()
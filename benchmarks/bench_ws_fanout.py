@@ -0,0 +1,246 @@
+"""
+WebSocket Fan-out Load Test
+数百个 /ws/captions 客户端同时在线时，CaptionHub 的投递延迟、完整性与慢客户端处理
+
+服务端（独立进程）：只含 /ws/captions 的 FastAPI 应用，使用与正式服务相同的 CaptionHub / serve_captions，
+发布线程按固定速率产生 partial / accurate 字幕，文本中带序号和产生时刻。
+客户端（本进程）：N 个 websockets 连接，其中 --slow-clients 个每收一条消息额外睡眠 --slow-delay 秒。
+
+指标：
+- partial / accurate 投递延迟（毫秒，产生 -> 客户端收到，p50/p95/p99）
+- accurate 缺失条数（正常客户端应为 0）
+- partial 接收比例、被断开的慢客户端数
+- 服务端发送的字幕字节数（permessage-deflate 之前）
+
+用法：
+    python -m benchmarks.bench_ws_fanout --clients 300 --duration 20
+    python -m benchmarks.bench_ws_fanout --clients 500 --slow-clients 20 --slow-delay 0.5
+    python -m benchmarks.bench_ws_fanout --subprotocol captions.delta.msgpack
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from src.api.caption_hub import CaptionHub, serve_captions, parse_types, negotiate_subprotocol
+from src.services.audio_service import CaptionOutput
+from benchmarks.bench_caption_latency import percentiles, git_commit
+
+
+# ====== 服务端进程 ======
+def publisher(hub: CaptionHub, stop, partial_hz: float, accurate_every: float):
+    """按固定速率发布字幕；文本为 "<序号> <time.monotonic()>"（partial 每次两个词都变化，增量即整行）"""
+    partial_seq = accurate_seq = 0
+    next_accurate = time.monotonic() + accurate_every
+    while not stop.wait(1.0 / partial_hz):
+        now = time.monotonic()
+        words = [str(partial_seq), f"{now:.6f}"]
+        hub.publish_threadsafe(CaptionOutput(
+            type="partial", text=" ".join(words), timestamp=time.strftime("%H:%M:%S"), emit_t=now,
+            caption_id=accurate_seq, words=words, stable_words=0,
+        ))
+        partial_seq += 1
+        if now >= next_accurate:
+            hub.publish_threadsafe(CaptionOutput(
+                type="accurate", text=f"{accurate_seq} {now:.6f}", timestamp=time.strftime("%H:%M:%S"), emit_t=now,
+                caption_id=accurate_seq,
+            ))
+            accurate_seq += 1
+            next_accurate += accurate_every
+
+
+def run_server(port: int, partial_hz: float, accurate_every: float, subprotocol: Optional[str],
+               started, publish_gate, publish_stop, stats_conn):
+    import uvicorn
+    from fastapi import FastAPI, WebSocket
+
+    hub = CaptionHub()
+    app = FastAPI()
+
+    @app.on_event("startup")
+    async def _startup():
+        hub.start()
+        started.set()
+
+        def gated():
+            publish_gate.wait()
+            publisher(hub, publish_stop, partial_hz, accurate_every)
+        threading.Thread(target=gated, daemon=True).start()
+
+    @app.on_event("shutdown")
+    async def _shutdown():
+        publish_stop.set()
+        from src.api.caption_hub import (
+            HUB_DROPPED_TOTAL, HUB_SLOW_DISCONNECTS_TOTAL, HUB_PUBLISHED_TOTAL, HUB_SENT_BYTES_TOTAL,
+        )
+        stats_conn.send({
+            "published_partial": HUB_PUBLISHED_TOTAL.labels(type="partial").value,
+            "published_accurate": HUB_PUBLISHED_TOTAL.labels(type="accurate").value,
+            "dropped_partials": HUB_DROPPED_TOTAL.value,
+            "slow_disconnects": HUB_SLOW_DISCONNECTS_TOTAL.value,
+            "sent_bytes": HUB_SENT_BYTES_TOTAL.labels(protocol=subprotocol or "full").value,
+        })
+
+    @app.websocket("/ws/captions")
+    async def ws(websocket: WebSocket):
+        subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        try:
+            await serve_captions(websocket, hub, parse_types(websocket.query_params.get("types")), subprotocol)
+        except Exception:
+            pass
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ====== 客户端 ======
+def decode(raw) -> Dict[str, Any]:
+    if isinstance(raw, bytes):
+        import msgpack
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+
+async def client(url: str, subprotocol: Optional[str], slow_delay: float, stop: asyncio.Event, out: Dict[str, Any]):
+    out.update({"partial_ms": [], "accurate_ms": [], "accurate_seqs": [], "partials": 0, "closed_by_server": False})
+    subprotocols = [subprotocol] if subprotocol else None
+    async with websockets.connect(url, max_size=None, open_timeout=30, subprotocols=subprotocols) as ws:
+        out["connected"] = True
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            except websockets.ConnectionClosed as e:
+                out["closed_by_server"] = e.code == 1013
+                return
+            now = time.monotonic()
+            msg = decode(raw)
+            if msg["type"] == "ping":
+                continue
+            seq, t_emit = (msg["suffix"] if "suffix" in msg else msg["text"]).split()
+            if msg["type"] == "partial":
+                out["partials"] += 1
+                out["partial_ms"].append((now - float(t_emit)) * 1000.0)
+            else:
+                out["accurate_seqs"].append(int(seq))
+                out["accurate_ms"].append((now - float(t_emit)) * 1000.0)
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+
+
+async def run_clients(args) -> List[Dict[str, Any]]:
+    url = f"ws://127.0.0.1:{args.port}/ws/captions"
+    stop = asyncio.Event()
+    results: List[Dict[str, Any]] = [{"slow": i < args.slow_clients, "connected": False} for i in range(args.clients)]
+    tasks = [
+        asyncio.ensure_future(client(url, args.subprotocol, args.slow_delay if r["slow"] else 0.0, stop, r))
+        for r in results
+    ]
+    # 等全部连上再开始发布
+    t0 = time.monotonic()
+    while sum(r["connected"] for r in results) < args.clients and time.monotonic() - t0 < 60:
+        await asyncio.sleep(0.1)
+    print(f"{sum(r['connected'] for r in results)}/{args.clients} clients connected in {time.monotonic() - t0:.1f}s")
+
+    args.publish_gate.set()
+    await asyncio.sleep(args.duration)
+    args.publish_stop.set()
+    await asyncio.sleep(args.drain_sec)  # 收完已发布的字幕（慢客户端可能仍有积压）
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caption hub fan-out load test")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--slow-clients", type=int, default=0, help="clients that sleep after each message")
+    parser.add_argument("--slow-delay", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=20.0, help="publishing time (s)")
+    parser.add_argument("--partial-hz", type=float, default=5.0)
+    parser.add_argument("--accurate-every", type=float, default=2.0, help="seconds between accurate captions")
+    parser.add_argument("--drain-sec", type=float, default=2.0, help="wait after publishing stops")
+    parser.add_argument("--subprotocol", default=None,
+                        help="wire format offered by the clients (captions.delta.json / captions.delta.msgpack)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default=os.path.join("data", "bench", "ws_fanout.json"))
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    started = ctx.Event()
+    args.publish_gate = ctx.Event()
+    args.publish_stop = ctx.Event()
+    stats_recv, stats_send = ctx.Pipe(duplex=False)
+    server = ctx.Process(
+        target=run_server,
+        args=(args.port, args.partial_hz, args.accurate_every, args.subprotocol,
+              started, args.publish_gate, args.publish_stop, stats_send),
+        daemon=True,
+    )
+    server.start()
+    if not started.wait(30):
+        raise RuntimeError("Server did not start")
+
+    results = asyncio.run(run_clients(args))
+
+    server.terminate()  # SIGTERM：uvicorn 正常关闭并发回服务端统计
+    server_stats = stats_recv.recv() if stats_recv.poll(10) else {}
+    server.join(timeout=5)
+
+    normal = [r for r in results if not r["slow"] and r["connected"]]
+    slow = [r for r in results if r["slow"] and r["connected"]]
+    published_accurate = int(server_stats.get("published_accurate", 0))
+    published_partial = int(server_stats.get("published_partial", 0))
+
+    def summarize(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if not group:
+            return {"n": 0}
+        missing = sum(published_accurate - len(set(r["accurate_seqs"])) for r in group if not r["closed_by_server"])
+        return {
+            "n": len(group),
+            "partial_ms": percentiles([v for r in group for v in r["partial_ms"]]),
+            "accurate_ms": percentiles([v for r in group for v in r["accurate_ms"]]),
+            "accurate_missing": missing,
+            "partial_received_ratio": (
+                sum(r["partials"] for r in group) / (published_partial * len(group)) if published_partial else None
+            ),
+            "closed_by_server": sum(r["closed_by_server"] for r in group),
+        }
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "publish_gate", "publish_stop")},
+        "server": server_stats,
+        "normal": summarize(normal),
+        "slow": summarize(slow),
+    }
+
+    print("=" * 80)
+    for label in ("normal", "slow"):
+        g = result[label]
+        if not g["n"]:
+            continue
+        print(f"[{label}] clients={g['n']} accurate_missing={g['accurate_missing']} "
+              f"partial_ratio={g['partial_received_ratio']} closed_by_server={g['closed_by_server']}")
+        for metric in ("partial_ms", "accurate_ms"):
+            p = g[metric]
+            if p["n"]:
+                print(f"    {metric:<12} p50={p['p50']:.1f} p95={p['p95']:.1f} p99={p['p99']:.1f} (n={p['n']})")
+    print(f"server: {server_stats}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
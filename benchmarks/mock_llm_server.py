@@ -0,0 +1,169 @@
+"""
+Mock LLM Server
+本地 OpenAI 兼容模拟服务（POST .../chat/completions），用于离线压测整条 LLM 路径
+
+- 延迟：每次请求 latency ± jitter 秒，另加 per_prompt_token × 提示词 token 数（预填充）和 per_token × 输出 token 数
+- 错误：按概率返回 429（带 Retry-After）或 500
+- 回复：批次整理提示词（含 <transcript chunk>）返回合法的 content / supplement JSON，其他提示词返回一段固定文本
+- 支持 stream=true（SSE 逐块返回）
+
+把服务接到 ClassAudio：
+    python -m benchmarks.mock_llm_server --port 8001 --latency 3 --error-rate 0.05 --rate-limit-rate 0.05
+    LLM_BASE_URL_OVERRIDE=http://127.0.0.1:8001/v1 python scripts/launcher.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.services.transcript_chunker import estimate_tokens
+
+
+class MockSettings:
+    """模拟服务参数（可在运行中修改，压测脚本用来切换场景）"""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, per_token: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0,
+                 per_prompt_token: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_token = per_token
+        self.per_prompt_token = per_prompt_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+
+_TRANSCRIPT_RE = re.compile(r"<transcript chunk>(.*?)</transcript chunk>", re.S)
+
+
+def mock_reply(prompt: str) -> str:
+    """按提示词类型生成回复"""
+    match = _TRANSCRIPT_RE.search(prompt)
+    if match:
+        words = match.group(1).split()
+        knowledge = [" ".join(words[i:i + 12]) for i in range(0, min(len(words), 48), 12)]
+        return json.dumps({
+            "content": {"coursework": [], "knowledge": knowledge, "question": []},
+            "supplement": {"ongoing": knowledge[-1:], "carryover_raw": []},
+        }, ensure_ascii=False)
+    return "这是本地模拟服务的回复。" * 8
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Mock LLM")
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        return {k: v for k, v in vars(settings).items() if k != "rng"}
+
+    @app.post("/chat/completions")
+    @app.post("/{prefix:path}/chat/completions")
+    async def chat_completions(request: Request, prefix: str = ""):
+        body = await request.json()
+        settings.requests += 1
+
+        roll = settings.rng.random()
+        if roll < settings.rate_limit_rate:
+            settings.rate_limited += 1
+            return JSONResponse(
+                status_code=429, headers={"Retry-After": str(settings.retry_after)},
+                content={"error": {"message": "mock rate limit", "type": "rate_limit_error"}},
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            settings.errors += 1
+            return JSONResponse(status_code=500, content={"error": {"message": "mock server error", "type": "server_error"}})
+
+        messages: List[Dict[str, Any]] = body.get("messages") or []
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        reply = mock_reply(prompt)
+        delay = max(0.0, settings.latency + settings.rng.uniform(-settings.jitter, settings.jitter))
+        prompt_tokens = estimate_tokens(prompt)
+        delay += settings.per_prompt_token * prompt_tokens + settings.per_token * len(reply.split())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "mock")
+
+        settings.inflight += 1
+        settings.max_inflight = max(settings.max_inflight, settings.inflight)
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                settings.inflight -= 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(reply.split()),
+                          "total_tokens": prompt_tokens + len(reply.split())},
+            }
+
+        async def stream():
+            try:
+                pieces = [reply[i:i + 16] for i in range(0, len(reply), 16)] or [""]
+                step = delay / (len(pieces) + 1)
+                await asyncio.sleep(step)  # 首个 token 前的等待
+                for piece in pieces:
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(step)
+                done = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }
+                yield f"data: {json.dumps(done)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                settings.inflight -= 1
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=1.0, help="mean response latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="uniform latency jitter (s)")
+    parser.add_argument("--per-token", type=float, default=0.0, help="extra latency per output token (s)")
+    parser.add_argument("--per-prompt-token", type=float, default=0.0, help="extra latency per prompt token (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="probability of HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency, args.jitter, args.per_token, args.error_rate,
+                            args.rate_limit_rate, args.retry_after, args.seed, per_prompt_token=args.per_prompt_token)
+    print(f"Mock LLM listening on http://{args.host}:{args.port}/v1 "
+          f"(latency={args.latency}s, 429={args.rate_limit_rate:.0%}, 500={args.error_rate:.0%})")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Replay Harness
+确定性的音频回放源、模拟时钟和桩模型，用于在没有麦克风/GPU 的环境下复现转写时序
+
+- SimClock: 以 speed 倍速推进的模拟时钟（所有 sleep 按倍速缩放）
+- ReplayInputStream: 替代 sd.InputStream，按模拟时钟节奏把音频块喂给回调
+- StubWhisperModel: 可配置解码延迟的 WhisperModel 替身，输出确定性文本
+- EnergyVAD: 基于能量阈值的 VAD 引擎，配合合成音频使用
+- RecordingQueue: 记录事件入队时间的 evt_q 替身
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import SR, BLOCK_SAMPLES, MIN_SILENCE_MS
+from src.services.vad_engine import VADEngine
+
+
+# ====== 时钟 ======
+class SimClock:
+    """
+    模拟时钟
+
+    now() 返回自 start() 起的模拟秒数；speed > 1 时回放与桩模型延迟同比例加速。
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self._wall0 = time.monotonic()
+
+    def start(self):
+        self._wall0 = time.monotonic()
+
+    def now(self) -> float:
+        return (time.monotonic() - self._wall0) * self.speed
+
+    def from_monotonic(self, t: float) -> float:
+        """把 time.monotonic() 的读数换算为模拟时间"""
+        return (t - self._wall0) * self.speed
+
+    def sleep(self, sim_sec: float):
+        if sim_sec > 0:
+            time.sleep(sim_sec / self.speed)
+
+    def sleep_until(self, sim_t: float):
+        self.sleep(sim_t - self.now())
+
+
+# ====== 音频源 ======
+class ReplayInputStream:
+    """
+    sd.InputStream 的回放替身
+
+    用法：service.input_stream_factory = ReplayInputStream.factory(audio_i16, clock)
+    第 i 个块在模拟时间 (i + 1) * 块时长 时交付，与声卡回调节奏一致。
+    """
+
+    def __init__(self, audio_i16: np.ndarray, clock: SimClock, *, samplerate: int, channels: int,
+                 dtype: str, blocksize: int, callback: Callable, on_finished: Optional[Callable] = None):
+        if samplerate != SR or channels != 1 or dtype != "int16":
+            raise ValueError("ReplayInputStream only supports 16k mono int16")
+        self.audio = audio_i16
+        self.clock = clock
+        self.blocksize = blocksize
+        self.callback = callback
+        self.on_finished = on_finished
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.finished = threading.Event()
+
+    @classmethod
+    def factory(cls, audio_i16: np.ndarray, clock: SimClock, on_finished: Optional[Callable] = None):
+        def make(**kwargs):
+            return cls(audio_i16, clock, on_finished=on_finished, **kwargs)
+        return make
+
+    def start(self):
+        self.clock.start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        block_sec = self.blocksize / SR
+        n_blocks = self.audio.size // self.blocksize
+        for i in range(n_blocks):
+            if self._stop.is_set():
+                break
+            self.clock.sleep_until((i + 1) * block_sec)
+            block = self.audio[i * self.blocksize:(i + 1) * self.blocksize].reshape(-1, 1)
+            self.callback(block, self.blocksize, None, None)
+        self.finished.set()
+        if self.on_finished:
+            self.on_finished()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def close(self):
+        pass
+
+
+# ====== 桩模型 ======
+@dataclass
+class StubWord:
+    word: str
+    start: float
+    end: float
+    probability: float = 1.0
+
+
+@dataclass
+class StubSegment:
+    text: str
+    start: float
+    end: float
+    avg_logprob: float = -0.2
+    no_speech_prob: float = 0.01
+    words: List[StubWord] = field(default_factory=list)
+
+
+@dataclass
+class StubInfo:
+    duration: float
+    language: str = "en"
+
+
+class StubWhisperModel:
+    """
+    WhisperModel 替身
+
+    解码耗时 = base_delay + per_audio_sec * 音频秒数（按模拟时钟睡眠）；
+    文本为每 0.4 秒一个确定性单词，便于 partial 的 LCP 稳定。
+    """
+
+    def __init__(self, clock: SimClock, base_delay: float = 0.05, per_audio_sec: float = 0.05, name: str = "stub"):
+        self.clock = clock
+        self.base_delay = base_delay
+        self.per_audio_sec = per_audio_sec
+        self.name = name
+        self.calls: List[Tuple[float, float]] = []  # (音频秒数, 模拟解码耗时)
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, **kwargs):
+        dur = float(np.asarray(audio).size) / SR
+        delay = self.base_delay + self.per_audio_sec * dur
+        t0 = self.clock.now()
+        self.clock.sleep(delay)
+        with self._lock:
+            self.calls.append((dur, self.clock.now() - t0))
+
+        words = []
+        n_words = max(1, int(dur / 0.4))
+        for k in range(n_words):
+            words.append(StubWord(word=f" w{k}", start=k * 0.4, end=(k + 1) * 0.4))
+        text = "".join(w.word for w in words)
+        segment = StubSegment(text=text, start=0.0, end=dur, words=words if kwargs.get("word_timestamps") else [])
+        return iter([segment]), StubInfo(duration=dur)
+
+
+class EnergyVAD(VADEngine):
+    """能量阈值 VAD（用于合成音频，结果完全确定）"""
+
+    name = "energy"
+
+    def __init__(self, threshold_rms: float = 0.02):
+        self.threshold_rms = threshold_rms
+
+    def reset(self):
+        pass
+
+    def score(self, blocks: np.ndarray) -> np.ndarray:
+        rms = np.sqrt(np.mean(np.square(blocks, dtype=np.float32), axis=1))
+        return (rms >= self.threshold_rms).astype(np.float32)
+
+
+# ====== 事件记录 ======
+class RecordingQueue(queue.Queue):
+    """
+    evt_q 替身：记录 START / END 事件的入队时间（模拟时钟）和采样位置
+    """
+
+    def __init__(self, clock: SimClock, maxsize: int = 0):
+        super().__init__(maxsize=maxsize)
+        self.clock = clock
+        self.log: List[Tuple[str, float, int]] = []  # (kind, sim_t, pos)
+        self._log_lock = threading.Lock()
+
+    def _record(self, item):
+        kind = getattr(item, "kind", None)
+        if kind in ("START", "END"):
+            with self._log_lock:
+                self.log.append((kind, self.clock.from_monotonic(item.t), item.pos))
+
+    def put(self, item, block=True, timeout=None):
+        self._record(item)
+        super().put(item, block=block, timeout=timeout)
+
+    def put_nowait(self, item):
+        self._record(item)
+        super().put_nowait(item)
+
+
+# ====== 合成音频 ======
+def make_synthetic_lecture(seconds: float, seed: int = 0) -> np.ndarray:
+    """
+    生成确定性的"讲课"音频：1~8 秒的语音段（带音节节奏的调制噪声）与 0.3~2.5 秒停顿交替
+
+    Returns:
+        16k 单声道 int16
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SR)
+    out = np.zeros((total,), dtype=np.float32)
+    pos = int(0.5 * SR)
+    while pos < total:
+        speech = int(rng.uniform(1.0, 8.0) * SR)
+        end = min(total, pos + speech)
+        n = end - pos
+        t = np.arange(n) / SR
+        envelope = 0.55 + 0.45 * np.abs(np.sin(2 * np.pi * 2.0 * t))
+        out[pos:end] = 0.15 * envelope * rng.standard_normal(n).astype(np.float32)
+        pos = end + int(rng.uniform(0.3, 2.5) * SR)
+
+    out += 0.002 * rng.standard_normal(total).astype(np.float32)
+    return (np.clip(out, -1.0, 32767 / 32768) * 32768.0).astype(np.int16)
+
+
+def pad_for_final(audio_i16: np.ndarray) -> np.ndarray:
+    """末尾补足静音，确保最后一句能触发 END"""
+    tail = int((MIN_SILENCE_MS / 1000 + 1.0) * SR)
+    pad = tail + (-(audio_i16.size + tail)) % BLOCK_SAMPLES
+    return np.concatenate([audio_i16, np.zeros((pad,), dtype=np.int16)])
+
+
+class TimedModel:
+    """
+    真实 WhisperModel 的计时包装：在 transcribe() 内部消费完分段生成器，
+    记录 (音频秒数, 模拟解码耗时)
+    """
+
+    def __init__(self, model, clock: SimClock, name: str = "model"):
+        self.model = model
+        self.clock = clock
+        self.name = name
+        self.calls: List[Tuple[float, float]] = []
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, **kwargs):
+        dur = float(np.asarray(audio).size) / SR
+        t0 = self.clock.now()
+        segments, info = self.model.transcribe(audio, **kwargs)
+        segments = list(segments)
+        with self._lock:
+            self.calls.append((dur, self.clock.now() - t0))
+        return iter(segments), info
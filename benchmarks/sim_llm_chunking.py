@@ -0,0 +1,184 @@
+"""
+LLM Chunking Simulator
+回放字幕时间线，比较 LLM 批次切分策略的笔记延迟和调用次数（模拟时间，不调用 LLM）
+
+- count:  旧策略，每 4 条字幕一个批次，停止录音时剩余的字幕不处理
+- budget: TranscriptChunker（token 上限 / 最长等待 / 停顿切分），停止录音时处理剩余内容
+
+LLM 按串行处理建模：调用耗时 = llm_base + llm_per_token × 批次 token 数，前一次调用结束后才开始下一次。
+统计：
+- note_latency: 每条字幕到达 -> 其所在批次的笔记保存完成
+- tokens_per_call、LLM 调用次数、token 少于 --min-tokens 的小批次数、未处理的字幕条数
+
+时间线来源：accurate 字幕会话文件（CAPTION_SESSION_DIR/<session>.jsonl，使用 time / text 字段），
+未提供时生成合成课堂（长短句混合，偶有长停顿）。
+
+用法：
+    python -m benchmarks.sim_llm_chunking [--minutes 90] [--max-tokens 200 --max-wait 45 --silence 4]
+    python -m benchmarks.sim_llm_chunking data/logs/sessions/20260118_143025.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import (
+    LLM_CHUNK_MIN_TOKENS, LLM_CHUNK_MAX_TOKENS, LLM_CHUNK_MAX_WAIT_SEC, LLM_CHUNK_SILENCE_SEC,
+)
+from src.services.transcript_chunker import TranscriptChunker, estimate_tokens
+from benchmarks.bench_caption_latency import percentiles, git_commit
+
+
+_WORDS = (
+    "so the gradient of the loss with respect to each weight tells us which direction to move "
+    "and the learning rate controls how far we step along that direction before we evaluate again"
+).split()
+
+
+def make_synthetic_timeline(minutes: float, seed: int = 0) -> List[Tuple[float, str]]:
+    """合成课堂字幕：30% 短句（1~3 词），其余 5~40 词；句间 0.3~2 秒，5% 概率停顿 10~40 秒"""
+    rng = random.Random(seed)
+    timeline: List[Tuple[float, str]] = []
+    t = 0.0
+    while t < minutes * 60.0:
+        n_words = rng.randint(1, 3) if rng.random() < 0.3 else rng.randint(5, 40)
+        t += n_words * 0.35  # 语速约 170 词/分钟
+        timeline.append((t, " ".join(rng.choice(_WORDS) for _ in range(n_words))))
+        t += rng.uniform(10.0, 40.0) if rng.random() < 0.05 else rng.uniform(0.3, 2.0)
+    return timeline
+
+
+def load_timeline(path: str) -> List[Tuple[float, str]]:
+    """读取 accurate 字幕会话文件，时间换算为相对第一条的秒数"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("text"):
+                records.append((float(record["time"]), record["text"]))
+    records.sort()
+    t0 = records[0][0] if records else 0.0
+    return [(t - t0, text) for t, text in records]
+
+
+def simulate(
+    timeline: List[Tuple[float, str]],
+    chunker: TranscriptChunker,
+    flush_on_stop: bool,
+    llm_base: float,
+    llm_per_token: float,
+    stop_delay: float,
+    small_tokens: int,
+) -> Dict[str, Any]:
+    """按事件推进模拟时间：字幕到达、切分期限（poll）、停止录音"""
+    batches: List[Tuple[float, List[float], int]] = []  # (切出时间, 各字幕到达时间, token 数)
+    arrivals: List[float] = []
+
+    def cut(chunk: Optional[List[str]], now: float):
+        nonlocal arrivals
+        if chunk:
+            batches.append((now, arrivals[:len(chunk)], sum(estimate_tokens(text) for text in chunk)))
+            arrivals = arrivals[len(chunk):]
+
+    def advance(until: float):
+        while True:
+            deadline = chunker.next_deadline()
+            if deadline is None or deadline > until:
+                return
+            cut(chunker.poll(deadline), deadline)
+
+    for t, text in timeline:
+        advance(t)
+        arrivals.append(t)
+        cut(chunker.add(text, t), t)
+
+    stop_time = (timeline[-1][0] if timeline else 0.0) + stop_delay
+    advance(stop_time)
+    if flush_on_stop:
+        cut(chunker.flush(), stop_time)
+    unprocessed = len(chunker.buffer)
+
+    latencies: List[float] = []
+    tokens_per_call: List[float] = []
+    llm_free = 0.0
+    for cut_time, batch_arrivals, tokens in batches:
+        done = max(cut_time, llm_free) + llm_base + llm_per_token * tokens
+        llm_free = done
+        latencies.extend(done - t for t in batch_arrivals)
+        tokens_per_call.append(tokens)
+
+    return {
+        "calls": len(batches),
+        "small_calls": sum(1 for n in tokens_per_call if n < small_tokens),
+        "unprocessed_captions": unprocessed,
+        "note_latency": percentiles(latencies),
+        "note_latency_max": max(latencies) if latencies else None,
+        "tokens_per_call": percentiles(tokens_per_call),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay caption timelines through LLM chunking policies")
+    parser.add_argument("timelines", nargs="*", help="caption session JSONL files (default: synthetic lecture)")
+    parser.add_argument("--minutes", type=float, default=90.0, help="synthetic lecture length")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--count", type=int, default=4, help="captions per batch for the count policy")
+    parser.add_argument("--min-tokens", type=int, default=LLM_CHUNK_MIN_TOKENS)
+    parser.add_argument("--max-tokens", type=int, default=LLM_CHUNK_MAX_TOKENS)
+    parser.add_argument("--max-wait", type=float, default=LLM_CHUNK_MAX_WAIT_SEC)
+    parser.add_argument("--silence", type=float, default=LLM_CHUNK_SILENCE_SEC)
+    parser.add_argument("--llm-base", type=float, default=6.0, help="modelled LLM call overhead (s)")
+    parser.add_argument("--llm-per-token", type=float, default=0.02, help="modelled LLM time per input token (s)")
+    parser.add_argument("--stop-delay", type=float, default=5.0, help="time from the last caption to stop_capture (s)")
+    parser.add_argument("--out", default=os.path.join("data", "bench", "llm_chunking.json"))
+    args = parser.parse_args()
+
+    timelines = [(os.path.basename(p), load_timeline(p)) for p in args.timelines]
+    if not timelines:
+        timelines.append((f"synthetic_{int(args.minutes)}min", make_synthetic_timeline(args.minutes, args.seed)))
+
+    policies = {
+        "count": (lambda: TranscriptChunker(args.count, 0, 0, 0.0, 0.0), False),
+        "budget": (lambda: TranscriptChunker(0, args.min_tokens, args.max_tokens, args.max_wait, args.silence), True),
+    }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, timeline in timelines:
+        results[name] = {"captions": len(timeline)}
+        for label, (make_chunker, flush_on_stop) in policies.items():
+            results[name][label] = simulate(
+                timeline, make_chunker(), flush_on_stop, args.llm_base, args.llm_per_token, args.stop_delay,
+                args.min_tokens,
+            )
+
+    result = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "timelines")},
+        "timelines": results,
+    }
+
+    print("=" * 80)
+    print(f"{'timeline':<24} {'policy':<8} {'calls':>6} {'small':>6} {'unproc':>7} {'tok p50':>8} "
+          f"{'lat p50':>8} {'lat p95':>8} {'lat max':>8}")
+    for name, r in results.items():
+        for label in policies:
+            p = r[label]
+            lat = p["note_latency"]
+            print(f"{name:<24} {label:<8} {p['calls']:>6} {p['small_calls']:>6} {p['unprocessed_captions']:>7} "
+                  f"{p['tokens_per_call']['p50'] or 0:>8.0f} {lat['p50'] or 0:>7.1f}s {lat['p95'] or 0:>7.1f}s "
+                  f"{p['note_latency_max'] or 0:>7.1f}s")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,8 @@
 const CONFIG = {
   API_BASE_URL: 'http://localhost:8000',
   WS_URL: 'ws://localhost:8000/ws/captions',
-  AUTO_REFRESH_INTERVAL: 5000, // 5秒
+  WS_SUBPROTOCOL: 'captions.delta.json', // 增量字幕协议：partial 只传变化的后缀
+  AUTO_REFRESH_INTERVAL: 5000, // 5秒（笔记改为服务端推送后，仅用于心跳检查）
 };
 
 // ==================== 全局状态 ====================
@@ -13,6 +14,7 @@ const state = {
   accurateCount: 0,
   notesCount: 0,
   autoRefreshTimer: null,
+  notesStream: null, // 结构化笔记的 EventSource
   reconnectAttempts: 0,
   maxReconnectAttempts: 5,
   reconnectTimer: null,
@@ -20,6 +22,9 @@ const state = {
   topicSet: false,
   currentTopic: null,
   accurateCaptions: [], // 用于持久化的字幕数组
+  partial: { id: null, words: [], stable: 0 }, // 当前 partial 行（增量协议的基准）
+  captionCursor: { log: null, seq: 0 }, // 已收到的最后一条 accurate（断线重连时补发其后的字幕）
+  notes: { generation: null, items: [], etag: null }, // 已收到的笔记批次（增量拉取 / 推送的游标）
 };
 
 // ==================== DOM 元素 ====================
@@ -62,6 +67,7 @@ const STORAGE_KEYS = {
   QA_HISTORY: 'classaudio_qa_history',
   LLM_NOTES: 'classaudio_llm_notes',
   SESSION_ID: 'classaudio_session_id',
+  CAPTION_CURSOR: 'classaudio_caption_cursor',
 };
 
 /**
@@ -85,12 +91,27 @@ function loadAccurateCaptions() {
       state.accurateCaptions = JSON.parse(saved);
       renderAccurateCaptions();
     }
+    const cursor = localStorage.getItem(STORAGE_KEYS.CAPTION_CURSOR);
+    if (cursor) {
+      state.captionCursor = JSON.parse(cursor);
+    }
   } catch (error) {
     console.error('Failed to load accurate captions:', error);
     state.accurateCaptions = [];
   }
 }
 
+/**
+ * 保存字幕游标到 localStorage
+ */
+function saveCaptionCursor() {
+  try {
+    localStorage.setItem(STORAGE_KEYS.CAPTION_CURSOR, JSON.stringify(state.captionCursor));
+  } catch (error) {
+    console.error('Failed to save caption cursor:', error);
+  }
+}
+
 /**
  * 渲染所有 Accurate 字幕
  */
@@ -187,7 +208,9 @@ function clearPersistedData() {
   localStorage.removeItem(STORAGE_KEYS.ACCURATE_CAPTIONS);
   localStorage.removeItem(STORAGE_KEYS.QA_HISTORY);
   localStorage.removeItem(STORAGE_KEYS.LLM_NOTES);
+  localStorage.removeItem(STORAGE_KEYS.CAPTION_CURSOR);
   state.accurateCaptions = [];
+  state.captionCursor = { log: null, seq: 0 };
   qaState.qaHistory = [];
 }
 
@@ -266,7 +289,11 @@ function connectWebSocket() {
   }
 
   console.log('Connecting to WebSocket...');
-  state.ws = new WebSocket(CONFIG.WS_URL);
+  // 带上游标：服务端先补发断线期间的 accurate（新设备 since=0 补发本次服务的全部字幕）
+  const cursor = state.captionCursor;
+  const url = `${CONFIG.WS_URL}?since=${cursor.seq}` + (cursor.log ? `&log=${encodeURIComponent(cursor.log)}` : '');
+  state.ws = new WebSocket(url, [CONFIG.WS_SUBPROTOCOL]);
+  resetPartialCaption();
 
   state.ws.onopen = () => {
     console.log('WebSocket connected');
@@ -332,9 +359,25 @@ function disconnectWebSocket() {
  */
 function handleWebSocketMessage(data) {
   if (data.type === 'partial') {
-    updatePartialCaption(data.text);
+    if (data.id === undefined) {
+      updatePartialCaption(data.text); // 整行协议（服务端未接受子协议）
+    } else {
+      applyPartialDelta(data);
+    }
   } else if (data.type === 'accurate') {
+    if (data.id !== undefined && data.id === state.partial.id) {
+      resetPartialCaption(); // accurate 替换同一句的 partial
+    }
+    if (data.seq !== undefined && data.seq !== null) {
+      if (data.seq <= state.captionCursor.seq) {
+        return; // 已在补发中收到
+      }
+      state.captionCursor.seq = data.seq;
+      saveCaptionCursor();
+    }
     addAccurateCaption(data);
+  } else if (data.type === 'catchup') {
+    applyCaptionCatchup(data);
   } else if (data.type === 'ping') {
     // 收到心跳，更新时间
     state.lastPingTime = Date.now();
@@ -350,10 +393,68 @@ function updatePartialCaption(text) {
   elements.partialCaption.innerHTML = text || '<div class="placeholder-text">等待语音输入...</div>';
 }
 
+/**
+ * 应用增量 partial：保留当前行前 keep 个词，接上 suffix；前 stable 个词为稳定词
+ */
+function applyPartialDelta(data) {
+  const partial = state.partial;
+  const kept = data.id === partial.id ? partial.words.slice(0, data.keep) : [];
+  const suffix = data.suffix ? data.suffix.split(' ') : [];
+
+  partial.id = data.id;
+  partial.words = kept.concat(suffix);
+  partial.stable = data.stable;
+
+  const stable = partial.words.slice(0, partial.stable).join(' ');
+  const unstable = partial.words.slice(partial.stable).join(' ');
+  let line = stable;
+  if (unstable) {
+    line = stable ? `${stable}  [${unstable}]` : `[${unstable}]`;
+  }
+  updatePartialCaption(line);
+}
+
+/**
+ * 清空当前 partial 行
+ */
+function resetPartialCaption() {
+  state.partial = { id: null, words: [], stable: 0 };
+  updatePartialCaption('');
+}
+
+/**
+ * 应用补发帧：按序号追加游标之后的 accurate 字幕
+ */
+function applyCaptionCatchup(data) {
+  const cursor = state.captionCursor;
+  if (cursor.log !== data.log) {
+    // 服务端换了日志（重启），游标从头计
+    cursor.log = data.log;
+    cursor.seq = 0;
+  }
+
+  let added = 0;
+  data.captions.forEach(caption => {
+    if (caption.seq > cursor.seq) {
+      addAccurateCaption(caption, false);
+      cursor.seq = caption.seq;
+      added++;
+    }
+  });
+  cursor.seq = Math.max(cursor.seq, data.last_seq);
+
+  saveAccurateCaptions();
+  saveCaptionCursor();
+  if (added > 0) {
+    console.log(`Caught up ${added} captions`);
+  }
+}
+
 /**
  * 添加 Accurate 字幕
+ * persist 为 false 时由调用方统一保存（批量补发）
  */
-function addAccurateCaption(data) {
+function addAccurateCaption(data, persist = true) {
   // 添加到数组开头（最新的在前面）
   state.accurateCaptions.unshift({
     timestamp: data.timestamp,
@@ -361,7 +462,9 @@ function addAccurateCaption(data) {
   });
 
   // 保存到 localStorage
-  saveAccurateCaptions();
+  if (persist) {
+    saveAccurateCaptions();
+  }
 
   // 移除空状态
   const emptyState = elements.accurateCaptions.querySelector('.empty-state');
@@ -388,18 +491,36 @@ function addAccurateCaption(data) {
 // ==================== 结构化笔记 ====================
 
 /**
- * 刷新结构化笔记
+ * 刷新结构化笔记（增量：只拉取已有批次之后的部分，没有新批次时服务端返回 304）
  */
 async function refreshStructuredNotes() {
   try {
-    const response = await fetch(`${CONFIG.API_BASE_URL}/api/structured-content?latest=0`);
+    let url = `${CONFIG.API_BASE_URL}/api/structured-content`;
+    const headers = {};
+    if (state.notes.generation !== null) {
+      url += `?since=${state.notes.items.length}&generation=${state.notes.generation}`;
+      if (state.notes.etag) {
+        headers['If-None-Match'] = state.notes.etag;
+      }
+    }
+
+    const response = await fetch(url, { headers });
 
+    if (response.status === 304) {
+      return;
+    }
     if (!response.ok) {
       throw new Error(`HTTP ${response.status}`);
     }
 
     const data = await response.json();
-    displayStructuredNotes(data.content);
+    if (data.reset || data.generation !== state.notes.generation) {
+      state.notes.items = [];
+    }
+    state.notes.generation = data.generation;
+    state.notes.items = state.notes.items.slice(0, data.since).concat(data.content);
+    state.notes.etag = response.headers.get('ETag');
+    displayStructuredNotes(state.notes.items);
 
   } catch (error) {
     console.error('Failed to refresh notes:', error);
@@ -416,7 +537,7 @@ function displayStructuredNotes(content) {
       <div class="empty-state">
         <div class="empty-icon">🤖</div>
         <div class="empty-text">等待 LLM 处理中...</div>
-        <div class="empty-hint">至少需要 4 条准确字幕才会开始处理</div>
+        <div class="empty-hint">字幕累积到一定长度或讲课停顿时开始处理</div>
       </div>
     `;
     state.notesCount = 0;
@@ -658,11 +779,12 @@ function clearDisplay() {
 
   // 清空笔记（包括 localStorage）
   localStorage.removeItem(STORAGE_KEYS.LLM_NOTES);
+  state.notes = { generation: null, items: [], etag: null };
   elements.structuredNotes.innerHTML = `
     <div class="empty-state">
       <div class="empty-icon">🤖</div>
       <div class="empty-text">等待 LLM 处理中...</div>
-      <div class="empty-hint">至少需要 4 条准确字幕才会开始处理</div>
+      <div class="empty-hint">字幕累积到一定长度或讲课停顿时开始处理</div>
     </div>
   `;
   state.notesCount = 0;
@@ -746,15 +868,63 @@ async function exportNotes() {
 
 // ==================== 自动刷新 ====================
 
+/**
+ * 订阅结构化笔记推送：服务端每处理完一个批次推送一条 batch 事件，清空时推送 reset
+ * （EventSource 断线后自动重连，并以 Last-Event-ID 续传）
+ */
+function connectNotesStream() {
+  closeNotesStream();
+
+  let url = `${CONFIG.API_BASE_URL}/api/structured-content/stream`;
+  if (state.notes.generation !== null) {
+    url += `?since=${state.notes.items.length}&generation=${state.notes.generation}`;
+  }
+  const stream = new EventSource(url);
+
+  stream.addEventListener('reset', (event) => {
+    const data = JSON.parse(event.data);
+    state.notes = { generation: data.generation, items: [], etag: null };
+    displayStructuredNotes(state.notes.items);
+  });
+
+  stream.addEventListener('batch', (event) => {
+    const data = JSON.parse(event.data);
+    if (data.generation === state.notes.generation && data.index < state.notes.items.length) {
+      return; // 已有的批次
+    }
+    if (data.generation !== state.notes.generation || data.index !== state.notes.items.length) {
+      // 与本地游标不连续（漏推或代号变化）：回退为一次增量拉取
+      refreshStructuredNotes();
+      return;
+    }
+    state.notes.items.push(data.content);
+    state.notes.etag = null;
+    displayStructuredNotes(state.notes.items);
+  });
+
+  stream.onerror = () => {
+    console.warn('Notes stream error, browser will retry');
+  };
+
+  state.notesStream = stream;
+}
+
+function closeNotesStream() {
+  if (state.notesStream) {
+    state.notesStream.close();
+    state.notesStream = null;
+  }
+}
+
 function startAutoRefresh() {
   if (state.autoRefreshTimer) {
     clearInterval(state.autoRefreshTimer);
   }
 
+  connectNotesStream();
+
   state.autoRefreshTimer = setInterval(() => {
     if (state.isRecording) {
-      refreshStructuredNotes();
-
       // 检查心跳：如果超过 60 秒没收到 ping，认为连接可能已断
       const timeSinceLastPing = Date.now() - state.lastPingTime;
       if (timeSinceLastPing > 60000 && state.isConnected) {
@@ -766,6 +936,8 @@ function startAutoRefresh() {
 }
 
 function stopAutoRefresh() {
+  closeNotesStream();
+
   if (state.autoRefreshTimer) {
     clearInterval(state.autoRefreshTimer);
     state.autoRefreshTimer = null;
@@ -808,6 +980,9 @@ function setupEventListeners() {
   window.addEventListener('beforeunload', () => {
     disconnectWebSocket();
     stopAutoRefresh();
+    if (qaState.abortController) {
+      qaState.abortController.abort();
+    }
   });
 }
 
@@ -844,7 +1019,13 @@ async function checkServerConnection() {
     const response = await fetch(`${CONFIG.API_BASE_URL}/health`);
 
     if (response.ok) {
-      showToast('服务就绪', '后端服务连接正常', 'success');
+      const health = await response.json();
+      if (health.models_ready === false) {
+        // 模型仍在后台加载，开始录音时后端会等待其就绪
+        showToast('模型加载中', '后端已启动，模型仍在加载，可稍后开始录音', 'info');
+      } else {
+        showToast('服务就绪', '后端服务连接正常', 'success');
+      }
       updateStatus('就绪', 'connected');
 
       // 检查录音状态并恢复
@@ -920,6 +1101,7 @@ const qaState = {
   isOpen: false,
   qaHistory: [], // 保留所有历史问答记录
   isAsking: false,
+  abortController: null, // 当前流式回答（页面卸载时中止，服务端随之取消 LLM 请求）
   drawerWidth: 400, // 默认宽度
   minWidth: 300,
   maxWidth: 800,
@@ -1004,8 +1186,8 @@ function renderQAHistory() {
     html += `
       <div class="qa-item">
         <div class="qa-question">${escapeHtml(item.question)}</div>
-        <div class="qa-answer ${item.loading ? 'loading' : ''}">${
-          item.loading
+        <div class="qa-answer ${item.loading && !item.answer ? 'loading' : ''}">${
+          item.loading && !item.answer
             ? '<span>正在思考</span><span class="qa-loading-dots"><span></span><span></span><span></span></span>'
             : escapeHtml(item.answer)
         }</div>
@@ -1052,23 +1234,34 @@ async function submitQuestion() {
   qaElements.submitBtn.disabled = true;
   qaState.isAsking = true;
 
+  qaState.abortController = new AbortController();
+
   try {
-    const response = await fetch(`${CONFIG.API_BASE_URL}/api/qa/ask`, {
+    const response = await fetch(`${CONFIG.API_BASE_URL}/api/qa/ask/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({ question }),
+      signal: qaState.abortController.signal,
     });
 
     if (!response.ok) {
       throw new Error(`HTTP ${response.status}`);
     }
 
-    const data = await response.json();
+    // 逐段渲染：收到第一段文本后替换加载状态，之后只更新最后一条回答的文本
+    await readQAStream(response, (text) => {
+      const first = !qaItem.answer;
+      qaItem.answer += text;
+      if (first) {
+        renderQAHistory();
+      } else {
+        scheduleQAAnswerUpdate(qaItem);
+      }
+    });
 
     // 更新历史记录
-    qaItem.answer = data.answer;
     qaItem.loading = false;
     saveQAHistory(); // 保存到 localStorage
     renderQAHistory();
@@ -1076,14 +1269,18 @@ async function submitQuestion() {
   } catch (error) {
     console.error('Failed to ask question:', error);
 
-    // 显示错误消息
-    qaItem.answer = '抱歉，问答服务暂时不可用。请稍后再试。';
+    // 显示错误消息（已收到的部分保留）
+    qaItem.answer = qaItem.answer
+      ? `${qaItem.answer}\n\n（回答中断）`
+      : '抱歉，问答服务暂时不可用。请稍后再试。';
     qaItem.loading = false;
     saveQAHistory(); // 保存到 localStorage
     renderQAHistory();
 
     showToast('提问失败', '无法获取回答', 'error');
   } finally {
+    qaState.abortController = null;
+
     // 恢复输入框
     qaElements.input.disabled = false;
     qaElements.submitBtn.disabled = false;
@@ -1092,6 +1289,67 @@ async function submitQuestion() {
   }
 }
 
+/**
+ * 读取 /api/qa/ask/stream 的 SSE 响应（POST 请求无法使用 EventSource，手动按空行切分事件）
+ */
+async function readQAStream(response, onToken) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data += line.slice(5).trim();
+        }
+      });
+
+      if (event === 'token') {
+        onToken(JSON.parse(data).text);
+      } else if (event === 'error') {
+        throw new Error(JSON.parse(data).detail);
+      } else if (event === 'done') {
+        console.log('QA stream done:', JSON.parse(data));
+        return;
+      }
+    }
+  }
+}
+
+/**
+ * 流式回答时更新最后一条回答的文本（每帧最多一次，避免逐段重绘整个历史）
+ */
+let qaAnswerFrame = null;
+function scheduleQAAnswerUpdate(qaItem) {
+  if (qaAnswerFrame) {
+    return;
+  }
+  qaAnswerFrame = requestAnimationFrame(() => {
+    qaAnswerFrame = null;
+    const answers = qaElements.history.querySelectorAll('.qa-answer');
+    const el = answers[answers.length - 1];
+    if (el) {
+      el.textContent = qaItem.answer;
+      qaElements.history.scrollTop = qaElements.history.scrollHeight;
+    }
+  });
+}
+
 /**
  * 拖动调整面板宽度
  */
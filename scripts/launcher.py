@@ -73,6 +73,8 @@ def start_backend():
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.insert(0, project_root)
 
+    from src.config import WS_PER_MESSAGE_DEFLATE
+
     try:
         # 启动 FastAPI 服务
         cmd = [
@@ -81,7 +83,8 @@ def start_backend():
             "src.api.server:app",
             "--host", "0.0.0.0",
             "--port", str(BACKEND_PORT),
-            "--log-level", "info"
+            "--log-level", "info",
+            "--ws-per-message-deflate", str(WS_PER_MESSAGE_DEFLATE).lower(),
         ]
 
         process = subprocess.Popen(
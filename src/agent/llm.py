@@ -1,30 +1,257 @@
-from google import genai
-from openai import OpenAI
+"""
+LLM 客户端
+进程内共享的 OpenAI 兼容客户端：每个 provider 一个实例，配置来自 src/config.py
+
+- 连接池：同一 provider 的所有调用共用一个 OpenAI 客户端，复用其 keep-alive 连接池（不再每次调用都重新建立 TLS 连接）
+- 超时：每次请求 LLM_TIMEOUT_SEC，可按调用覆盖
+- 重试：429 / 5xx / 超时 / 连接错误时指数退避（带抖动，优先使用 Retry-After），最多 LLM_MAX_RETRIES 次
+- 并发：每个 provider 同时在途的请求不超过 LLM_MAX_CONCURRENCY（同步与异步调用各自计数）
+- 异步：agenerate() 使用 AsyncOpenAI，供事件循环中直接 await；astream() 逐块产出回复文本（流式）
+
+用法：
+    llm = get_llm("deepseek")
+    text = llm.generate(prompt)
+    text = await llm.agenerate(prompt)
+    async for delta in llm.astream(prompt): ...
+
+DSV3 / DBFlash16 保留为兼容入口，内部使用共享客户端。
+离线压测时设置 LLM_BASE_URL_OVERRIDE 指向本地模拟服务（python -m benchmarks.mock_llm_server）。
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from src.config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL,
+    DOUBAO_API_KEY, DOUBAO_BASE_URL, DOUBAO_MODEL,
+    LLM_TIMEOUT_SEC, LLM_MAX_RETRIES, LLM_BACKOFF_BASE_SEC, LLM_BACKOFF_MAX_SEC,
+    LLM_MAX_CONCURRENCY, LLM_BASE_URL_OVERRIDE,
+)
+
+
+# provider -> (base_url, api_key, 默认模型, api_key 对应的环境变量)
+PROVIDERS: Dict[str, Dict[str, str]] = {
+    "deepseek": {"base_url": DEEPSEEK_BASE_URL, "api_key": DEEPSEEK_API_KEY, "model": DEEPSEEK_MODEL,
+                 "key_env": "DEEPSEEK_API_KEY"},
+    "doubao": {"base_url": DOUBAO_BASE_URL, "api_key": DOUBAO_API_KEY, "model": DOUBAO_MODEL,
+               "key_env": "DOUBAO_API_KEY"},
+}
+
+
+def _retry_delay(attempt: int, error: Exception) -> Optional[float]:
+    """可重试的错误返回等待秒数，否则返回 None"""
+    if isinstance(error, APIStatusError):
+        if error.status_code != 429 and error.status_code < 500:
+            return None
+        retry_after = error.response.headers.get("retry-after") if error.response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX_SEC)
+            except ValueError:
+                pass
+    elif not isinstance(error, (APITimeoutError, APIConnectionError)):
+        return None
+    delay = min(LLM_BACKOFF_BASE_SEC * (2 ** attempt), LLM_BACKOFF_MAX_SEC)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, APIStatusError):
+        return f"HTTP {error.status_code}"
+    return type(error).__name__
+
+
+class LLMClient:
+    """一个 provider 的共享客户端（线程安全；异步部分只在一个事件循环中使用）"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str,
+                 timeout: float = LLM_TIMEOUT_SEC, max_retries: int = LLM_MAX_RETRIES,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+
+        if not api_key:
+            raise ValueError(f"LLM provider {name!r} has no API key")
+        self._api_key = api_key
+        # 重试由本类处理（统一退避策略并打印原因），SDK 自身不重试
+        self.client = OpenAI(base_url=base_url, api_key=self._api_key, timeout=timeout, max_retries=0)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _messages(self, prompt: str):
+        return [{"role": "user", "content": prompt}]
+
+    # ====== 同步 ======
+    def generate(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """单轮对话，返回回复文本（失败时抛出最后一次的异常）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._semaphore:
+                    completion = self.client.chat.completions.create(
+                        model=model or self.model,
+                        messages=self._messages(prompt),
+                        timeout=timeout or self.timeout,
+                    )
+                self.calls += 1
+                return completion.choices[0].message.content
+            except Exception as e:
+                delay = _retry_delay(attempt, e) if attempt < self.max_retries else None
+                if delay is None:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                print(f"LLM {self.name}: {_describe(e)}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    # ====== 异步 ======
+    def _ensure_async(self):
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                base_url=self.base_url, api_key=self._api_key, timeout=self.timeout, max_retries=0,
+            )
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client
+
+    async def agenerate(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """generate() 的异步版本"""
+        client = self._ensure_async()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._async_semaphore:
+                    completion = await client.chat.completions.create(
+                        model=model or self.model,
+                        messages=self._messages(prompt),
+                        timeout=timeout or self.timeout,
+                    )
+                self.calls += 1
+                return completion.choices[0].message.content
+            except Exception as e:
+                delay = _retry_delay(attempt, e) if attempt < self.max_retries else None
+                if delay is None:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                print(f"LLM {self.name}: {_describe(e)}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    async def astream(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        流式生成，逐块产出回复文本
+
+        只在收到第一块之前重试；调用方停止迭代（如客户端断开导致任务被取消）时关闭上游连接。
+        """
+        client = self._ensure_async()
+        async with self._async_semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    stream = await client.chat.completions.create(
+                        model=model or self.model,
+                        messages=self._messages(prompt),
+                        timeout=timeout or self.timeout,
+                        stream=True,
+                    )
+                    break
+                except Exception as e:
+                    delay = _retry_delay(attempt, e) if attempt < self.max_retries else None
+                    if delay is None:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                    print(f"LLM {self.name}: {_describe(e)}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                    await asyncio.sleep(delay)
+
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                self.calls += 1
+            finally:
+                # 被取消时也要关闭上游响应（shield：取消状态下仍能完成关闭）
+                await asyncio.shield(stream.close())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        self.client.close()
+
+
+# ====== 注册表 ======
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm(provider: str = "deepseek") -> LLMClient:
+    """取得 provider 的共享客户端（首次调用时创建）"""
+    client = _clients.get(provider)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if provider not in _clients:
+            if provider not in PROVIDERS:
+                raise ValueError(f"Unknown LLM provider {provider!r}, expected one of {sorted(PROVIDERS)}")
+            cfg = PROVIDERS[provider]
+            api_key = cfg["api_key"]
+            if not api_key:
+                # 本地模拟服务不校验 key
+                if not LLM_BASE_URL_OVERRIDE:
+                    raise RuntimeError(
+                        f"{cfg['key_env']} is not set: add it to .env (see .env.example) or the environment"
+                    )
+                api_key = "EMPTY"
+            _clients[provider] = LLMClient(
+                provider, LLM_BASE_URL_OVERRIDE or cfg["base_url"], api_key, cfg["model"],
+            )
+        return _clients[provider]
+
+
+# ====== 兼容入口 ======
 class DSV3:
-    def __init__(self,model_name='deepseek-v3-2-251201'):
-        self.client = OpenAI(base_url="https://ark.cn-beijing.volces.com/api/v3",
-                             api_key='223d6179-cf08-4fba-abfc-20e506ee24f7')
+    def __init__(self, model_name: str = DEEPSEEK_MODEL):
+        self.client = get_llm("deepseek")
         self.model_name = model_name
-    def generate(self,prompt:str) -> str:
-        completion = self.client.chat.completions.create(
-            model = self.model_name,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return completion.choices[0].message.content
+
+    def generate(self, prompt: str) -> str:
+        return self.client.generate(prompt, model=self.model_name)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self.client.agenerate(prompt, model=self.model_name)
+
+    def astream(self, prompt: str) -> AsyncIterator[str]:
+        return self.client.astream(prompt, model=self.model_name)
+
+
 class DBFlash16:
-    def __init__(self,model_name='doubao-seed-1-6-flash-250828'):
-        self.client = OpenAI(base_url="https://ark.cn-beijing.volces.com/api/v3",
-                             api_key='223d6179-cf08-4fba-abfc-20e506ee24f7')
+    def __init__(self, model_name: str = DOUBAO_MODEL):
+        self.client = get_llm("doubao")
         self.model_name = model_name
-    def generate(self,prompt:str) -> str:
-        completion = self.client.chat.completions.create(
-            model = self.model_name,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return completion.choices[0].message.content
-# a = DSV3()
-# print(a.generate('你好'))
\ No newline at end of file
+
+    def generate(self, prompt: str) -> str:
+        return self.client.generate(prompt, model=self.model_name)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self.client.agenerate(prompt, model=self.model_name)
+
+    def astream(self, prompt: str) -> AsyncIterator[str]:
+        return self.client.astream(prompt, model=self.model_name)
@@ -0,0 +1,352 @@
+"""
+Caption Hub
+字幕广播：一个广播任务接收转写服务的字幕，序列化一次后分发到每个 WebSocket 客户端的缓冲区
+
+- 字幕经服务回调（转写线程）以 publish_threadsafe() 投递到事件循环，不占用线程池
+- 每个客户端一个有界缓冲区：新 partial 到达时丢弃尚未发出的旧 partial（增量在发送时才相对客户端已有内容计算），
+  accurate 从不丢弃；accurate 积压超过上限说明客户端已跟不上，断开连接
+- 客户端可只订阅 partial 或 accurate（/ws/captions?types=accurate）
+- accurate 字幕带日志序号 seq（CaptionLog）；客户端以 ?since=<seq>&log=<log_id> 连接时，
+  先收到一帧 {"type": "catchup", ...} 补齐断线期间的字幕，再转为实时推送
+
+线路格式通过 WebSocket 子协议协商（未声明子协议的客户端沿用整行 JSON）：
+- captions.delta.json / captions.delta.msgpack：partial 只发送句子 id、稳定词数和相对客户端已有内容变化的后缀，
+  accurate 携带同一句子 id 以替换该 partial；msgpack 以二进制帧发送（需安装 msgpack）
+- permessage-deflate 由 uvicorn 在握手时与客户端协商（WS_PER_MESSAGE_DEFLATE）
+"""
+import asyncio
+import json
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, Iterable, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket
+
+from src.config import CAPTION_HUB_CLIENT_BUFFER, WS_HEARTBEAT_SEC
+from src.api.caption_log import CaptionLog
+from src.services.audio_service import CaptionOutput, lcp_wordlist
+from src.services.metrics import REGISTRY
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+CAPTION_TYPES: FrozenSet[str] = frozenset(("partial", "accurate"))
+
+SUBPROTOCOL_DELTA_JSON = "captions.delta.json"
+SUBPROTOCOL_DELTA_MSGPACK = "captions.delta.msgpack"
+
+HUB_DROPPED_TOTAL = REGISTRY.counter(
+    "classaudio_caption_hub_dropped",
+    "Stale partial captions dropped for slow WebSocket clients",
+)
+HUB_SLOW_DISCONNECTS_TOTAL = REGISTRY.counter(
+    "classaudio_caption_hub_slow_disconnects",
+    "WebSocket clients disconnected because their accurate backlog overflowed",
+)
+HUB_PUBLISHED_TOTAL = REGISTRY.counter(
+    "classaudio_caption_hub_published",
+    "Captions fanned out by the caption hub",
+    labelnames=("type",),
+)
+HUB_CATCHUP_CAPTIONS_TOTAL = REGISTRY.counter(
+    "classaudio_caption_hub_catchup_captions",
+    "Accurate captions replayed to reconnecting WebSocket clients",
+)
+HUB_SENT_BYTES_TOTAL = REGISTRY.counter(
+    "classaudio_caption_hub_sent_bytes",
+    "Caption payload bytes sent to WebSocket clients (before permessage-deflate)",
+    labelnames=("protocol",),
+)
+
+
+def caption_message(caption: CaptionOutput, seq: Optional[int] = None) -> str:
+    """WebSocket 消息（JSON 文本），格式与之前逐连接发送时一致；accurate 另带日志序号 seq"""
+    msg = {
+        "type": caption.type,
+        "text": caption.text,
+        "timestamp": caption.timestamp,
+    }
+    if caption.type == "accurate":
+        msg["no_speech_prob"] = caption.no_speech_prob
+        msg["avg_logprob"] = caption.avg_logprob
+        if seq is not None:
+            msg["seq"] = seq
+    return json.dumps(msg, ensure_ascii=False)
+
+
+def delta_message(prev: Optional[CaptionOutput], caption: CaptionOutput, seq: Optional[int] = None) -> Dict[str, Any]:
+    """
+    增量协议的消息字段
+
+    partial：客户端保留当前行的前 keep 个词，接上 suffix（空格分隔），前 stable 个词为稳定词；
+    prev 是该客户端上一次收到的 partial（同一句子 id 才能复用前缀）。
+    accurate：替换句子 id 相同的 partial。
+    """
+    if caption.type == "partial":
+        words = caption.words if caption.words is not None else caption.text.split()
+        keep = 0
+        if prev is not None and prev.caption_id == caption.caption_id and prev.words is not None:
+            keep = len(lcp_wordlist([prev.words, words]))
+        return {
+            "type": "partial",
+            "id": caption.caption_id,
+            "stable": caption.stable_words if caption.stable_words is not None else len(words),
+            "keep": keep,
+            "suffix": " ".join(words[keep:]),
+        }
+    return {
+        "type": "accurate",
+        "id": caption.caption_id,
+        "seq": seq,
+        "text": caption.text,
+        "timestamp": caption.timestamp,
+        "no_speech_prob": caption.no_speech_prob,
+        "avg_logprob": caption.avg_logprob,
+    }
+
+
+def encode_message(fields: Dict[str, Any], subprotocol: Optional[str]) -> Union[str, bytes]:
+    """按子协议编码：msgpack 为二进制帧，其余为 JSON 文本帧"""
+    if subprotocol == SUBPROTOCOL_DELTA_MSGPACK:
+        return msgpack.packb(fields, use_bin_type=True)
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+
+
+def negotiate_subprotocol(offered: Iterable[str]) -> Optional[str]:
+    """按客户端声明的顺序选择第一个支持的子协议；都不支持时返回 None（整行 JSON）"""
+    for name in offered:
+        if name == SUBPROTOCOL_DELTA_JSON:
+            return name
+        if name == SUBPROTOCOL_DELTA_MSGPACK and msgpack is not None:
+            return name
+    return None
+
+
+def parse_types(value: Optional[str]) -> FrozenSet[str]:
+    """解析订阅类型（逗号分隔），为空或无效时订阅全部"""
+    if not value:
+        return CAPTION_TYPES
+    types = frozenset(t.strip() for t in value.split(",")) & CAPTION_TYPES
+    return types or CAPTION_TYPES
+
+
+def parse_since(value: Optional[str]) -> Optional[int]:
+    """解析补发游标 ?since=<seq>，为空或无效时返回 None（不补发）"""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class HubCaption:
+    """广播中的一条字幕：整行 JSON 只序列化一次，增量消息按 (子协议, 客户端已有的 partial) 缓存"""
+
+    __slots__ = ("seq", "caption", "log_seq", "message", "_encoded")
+
+    def __init__(self, seq: int, caption: CaptionOutput, log_seq: Optional[int] = None):
+        self.seq = seq  # 广播序号（含 partial，只用于缓存）
+        self.caption = caption
+        self.log_seq = log_seq  # accurate 的日志序号
+        self.message = caption_message(caption, log_seq)
+        self._encoded: Dict[Tuple[str, int], Union[str, bytes]] = {}
+
+    def encode(self, subprotocol: str, prev: Optional["HubCaption"]) -> Union[str, bytes]:
+        # 同一时刻大多数客户端持有相同的上一条 partial，增量只需计算一次
+        key = (subprotocol, prev.seq if prev is not None and self.caption.type == "partial" else 0)
+        out = self._encoded.get(key)
+        if out is None:
+            fields = delta_message(prev.caption if prev is not None else None, self.caption, self.log_seq)
+            out = encode_message(fields, subprotocol)
+            self._encoded[key] = out
+        return out
+
+
+class CaptionSubscriber:
+    """单个客户端的待发送缓冲区（只在事件循环线程中访问）"""
+
+    def __init__(self, types: FrozenSet[str], max_accurate: int = CAPTION_HUB_CLIENT_BUFFER,
+                 subprotocol: Optional[str] = None):
+        self.types = types
+        self.max_accurate = max_accurate
+        self.subprotocol = subprotocol
+        self.partial_sent: Optional[HubCaption] = None  # 客户端当前显示的 partial（增量协议的基准）
+        self._items: Deque[HubCaption] = deque()
+        self._has_partial = False
+        self._accurate = 0
+        self._ready = asyncio.Event()
+        self.overflowed = False
+        self.dropped_partials = 0
+
+    def push(self, item: HubCaption):
+        kind = item.caption.type
+        if kind not in self.types or self.overflowed:
+            return
+
+        if kind == "partial":
+            if self._has_partial:
+                # 旧 partial 还没发出去就已过时
+                kept = deque(i for i in self._items if i.caption.type != "partial")
+                dropped = len(self._items) - len(kept)
+                self._items = kept
+                self.dropped_partials += dropped
+                HUB_DROPPED_TOTAL.inc(dropped)
+            self._has_partial = True
+        else:
+            self._accurate += 1
+            if self._accurate > self.max_accurate:
+                self.overflowed = True
+                HUB_SLOW_DISCONNECTS_TOTAL.inc()
+
+        self._items.append(item)
+        self._ready.set()
+
+    async def drain(self) -> Tuple[HubCaption, ...]:
+        """等待并取出全部待发送字幕"""
+        await self._ready.wait()
+        self._ready.clear()
+        items = tuple(self._items)
+        self._items.clear()
+        self._has_partial = False
+        self._accurate = 0
+        return items
+
+    def render(self, item: HubCaption) -> Union[str, bytes]:
+        """按该客户端的线路格式编码一条字幕（按发送顺序调用，同时推进增量基准）"""
+        if self.subprotocol is None:
+            return item.message
+
+        caption = item.caption
+        out = item.encode(self.subprotocol, self.partial_sent)
+        if caption.type == "partial":
+            self.partial_sent = item
+        elif self.partial_sent is not None and self.partial_sent.caption.caption_id == caption.caption_id:
+            # accurate 已替换客户端上的 partial
+            self.partial_sent = None
+        return out
+
+
+class CaptionHub:
+    """字幕广播器"""
+
+    def __init__(self, log: Optional[CaptionLog] = None):
+        self.log = log  # None 时 accurate 不带序号、不支持补发
+        self.subscribers: Set[CaptionSubscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ingress: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seq = 0
+
+    def start(self):
+        """在当前事件循环中启动广播任务"""
+        self._loop = asyncio.get_event_loop()
+        self._ingress = asyncio.Queue()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.log is not None:
+            self.log.close()
+
+    def publish_threadsafe(self, caption: CaptionOutput):
+        """从任意线程投递一条字幕（作为转写服务的 partial / accurate 回调）"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._ingress.put_nowait, caption)
+
+    async def _run(self):
+        while True:
+            caption = await self._ingress.get()
+            self._seq += 1
+            log_seq = self.log.append(caption) if self.log is not None and caption.type == "accurate" else None
+            item = HubCaption(self._seq, caption, log_seq)
+            HUB_PUBLISHED_TOTAL.labels(type=caption.type).inc()
+            for sub in self.subscribers:
+                sub.push(item)
+
+    def subscribe(self, types: FrozenSet[str] = CAPTION_TYPES,
+                  subprotocol: Optional[str] = None) -> CaptionSubscriber:
+        sub = CaptionSubscriber(types, subprotocol=subprotocol)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: CaptionSubscriber):
+        self.subscribers.discard(sub)
+
+
+async def serve_captions(websocket: WebSocket, hub: CaptionHub, types: FrozenSet[str],
+                         subprotocol: Optional[str] = None, since: Optional[int] = None,
+                         log_id: Optional[str] = None):
+    """
+    向一个已 accept 的 WebSocket 推送字幕，直到连接断开
+
+    subprotocol 为 accept 时选定的子协议（negotiate_subprotocol），None 表示整行 JSON。
+    since / log_id 为客户端已收到的最后一条 accurate 的游标；提供时先发送一帧补发：
+    {"type": "catchup", "log": log_id, "last_seq": 最新序号, "captions": [{"seq", "id", "text", "timestamp", ...}]}
+    心跳每 WS_HEARTBEAT_SEC 秒发送一次 {"type": "ping"}；accurate 积压溢出时以 1013 关闭连接。
+    """
+    sub = hub.subscribe(types, subprotocol)
+    # 订阅与快照之间没有 await：快照之后的 accurate 一定经由订阅缓冲区实时送达，不会重复或遗漏
+    catchup = None
+    if hub.log is not None and "accurate" in types:
+        cursor = hub.log.resolve_cursor(since, log_id)
+        if cursor is not None:
+            catchup = (cursor, hub.log.last_seq) + hub.log.snapshot(cursor)
+    send_lock = asyncio.Lock()
+    sent_bytes = HUB_SENT_BYTES_TOTAL.labels(protocol=subprotocol or "full")
+    ping = encode_message({"type": "ping", "timestamp": ""}, subprotocol)
+
+    async def send(message: Union[str, bytes]):
+        if isinstance(message, bytes):
+            sent_bytes.inc(len(message))
+            await websocket.send_bytes(message)
+        else:
+            sent_bytes.inc(len(message.encode("utf-8")))
+            await websocket.send_text(message)
+
+    async def send_catchup():
+        cursor, last_seq, entries, disk_until = catchup
+        if disk_until is not None:
+            older = await asyncio.get_event_loop().run_in_executor(None, hub.log.read_range, cursor, disk_until)
+            entries = older + entries
+        frame = {"type": "catchup", "log": hub.log.log_id, "last_seq": last_seq, "captions": entries}
+        HUB_CATCHUP_CAPTIONS_TOTAL.inc(len(entries))
+        async with send_lock:
+            await send(encode_message(frame, subprotocol))
+
+    async def send_captions():
+        if catchup is not None:
+            await send_catchup()
+        while True:
+            items = await sub.drain()
+            if sub.overflowed:
+                await websocket.close(code=1013, reason="Client too slow")
+                return
+            async with send_lock:
+                for item in items:
+                    await send(sub.render(item))
+
+    async def send_heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SEC)
+            async with send_lock:
+                await send(ping)
+
+    tasks = [asyncio.ensure_future(send_captions()), asyncio.ensure_future(send_heartbeat())]
+    try:
+        # 任一任务结束（连接断开导致发送异常、或慢客户端被关闭）即结束整个连接
+        done, _pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        hub.unsubscribe(sub)
@@ -0,0 +1,102 @@
+"""
+Caption Log
+accurate 字幕日志：为每条 accurate 字幕分配单调递增的序号，供 WebSocket 断线重连后补发
+
+- 内存中保留最近 CAPTION_LOG_MEMORY 条，全部条目同时交给后台写线程（CaptionWriter）追加写入本次服务的 JSONL 文件，
+  事件循环线程不做磁盘 IO
+- 客户端以 ?since=<seq>&log=<log_id> 重连：内存覆盖的部分直接取，更早的部分从文件读取
+- 每次服务启动一个新日志（log_id 为启动时间），序号从 1 开始；log_id 不匹配的游标视为 0
+- 只在事件循环线程中调用 append / snapshot；read_range 先等写线程写完再读文件，须放到线程池执行
+
+与录音会话文件（CAPTION_SESSION_DIR，AudioTranscriptionService 的 CaptionWriter）分开写，不复用后者：
+- 序号属于整个服务进程、跨越多次录音，重连游标指向它；会话文件每次录音一个，没有序号
+- ASR_PROCESS 模式下会话文件由子进程写入，序号则在主进程事件循环中分配，无法写进同一个文件
+- 会话文件是转写记录（按 CAPTION_FSYNC 落盘），本日志只是补发缓存（只 flush）
+每条 accurate 字幕因此多写一行（约 200 字节，写线程中完成）；CAPTION_LOG_DIR 置空时只保留内存部分，不写文件。
+"""
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.config import CAPTION_LOG_DIR, CAPTION_LOG_MEMORY
+from src.services.audio_service import CaptionOutput
+from src.services.caption_writer import CaptionWriter
+
+
+class CaptionLog:
+    """accurate 字幕序号日志"""
+
+    def __init__(self, log_dir: str = CAPTION_LOG_DIR, max_memory: int = CAPTION_LOG_MEMORY):
+        self.log_id = time.strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(log_dir, f"{self.log_id}.jsonl") if log_dir else None
+        self.last_seq = 0
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=max_memory)
+        # 只 flush 不 fsync（与之前同步写入时一致）；队列满时丢弃的条目只影响超出内存窗口的补发
+        self.writer = CaptionWriter(out_dir=log_dir, fsync="never", name="caption_log") if log_dir else None
+
+    def append(self, caption: CaptionOutput) -> int:
+        """记录一条 accurate 字幕，返回分配的序号"""
+        self.last_seq += 1
+        entry = {
+            "seq": self.last_seq,
+            "id": caption.caption_id,
+            "text": caption.text,
+            "timestamp": caption.timestamp,
+            "no_speech_prob": caption.no_speech_prob,
+            "avg_logprob": caption.avg_logprob,
+        }
+        self._recent.append(entry)
+        if self.writer is not None:
+            self.writer.write(self.log_id, entry)
+        return self.last_seq
+
+    def resolve_cursor(self, since: Optional[int], log_id: Optional[str]) -> Optional[int]:
+        """客户端游标换算为本日志的序号：未提供返回 None（不补发），来自其他日志或超前时从头补发"""
+        if since is None:
+            return None
+        if (log_id and log_id != self.log_id) or since > self.last_seq:
+            return 0
+        return max(0, since)
+
+    def snapshot(self, since: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        内存中序号大于 since 的条目
+
+        Returns:
+            (entries, disk_until)：disk_until 不为 None 时，(since, disk_until) 之间的条目需从文件读取
+        """
+        entries = [e for e in self._recent if e["seq"] > since]
+        first = self._recent[0]["seq"] if self._recent else self.last_seq + 1
+        disk_until = first if since + 1 < first else None
+        return entries, disk_until
+
+    def read_range(self, since: int, until: int) -> List[Dict[str, Any]]:
+        """从文件读取 since < seq < until 的条目（先等写线程写完此前入队的条目）；不写文件时为空"""
+        if self.writer is None:
+            return []
+        if not self.writer.sync(timeout=5.0):
+            print("Caption log writer did not catch up within 5s, catch-up may be incomplete")
+        out: List[Dict[str, Any]] = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    seq = entry.get("seq", 0)
+                    if seq >= until:
+                        break
+                    if seq > since:
+                        out.append(entry)
+        except OSError as e:
+            print(f"Caption log read error: {e}")
+        return out
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.end_session(self.log_id)
+        self.writer.sync(timeout=2.0)
@@ -0,0 +1,124 @@
+"""
+Notes Stream
+结构化笔记的增量拉取与推送
+
+- notes_etag / parse_cursor：/api/structured-content 的 ETag 与批次游标（?since=<批次数>&generation=<代号>）
+- NotesBroadcaster：LLM 线程处理完一个批次后经 publish_threadsafe() 投递到事件循环，分发给每个 SSE 订阅者
+- sse_notes()：/api/structured-content/stream 的事件流；先补发游标之后的批次，再实时推送
+
+SSE 事件：
+    event: batch   id: <代号>-<下标+1>   data: {"generation", "index", "content"}
+    event: reset   id: <代号>-0          data: {"generation"}            # 笔记被清空
+id 即客户端此时已有的批次数，EventSource 断线重连时带 Last-Event-ID，服务端据此从下一个批次继续。
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from src.config import WS_HEARTBEAT_SEC
+
+
+def notes_etag(generation: int, total: int) -> str:
+    return f'"{generation}-{total}"'
+
+
+def parse_cursor(since: Optional[int], generation: Optional[int], current_generation: int, total: int) -> Tuple[int, bool]:
+    """
+    客户端游标换算为起始下标
+
+    Returns:
+        (start, reset)：reset 为 True 表示游标来自其他代或超前，客户端应丢弃已有批次
+    """
+    if since is None:
+        return 0, False
+    if generation != current_generation or since < 0 or since > total:
+        return 0, True
+    return since, False
+
+
+def parse_last_event_id(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Last-Event-ID "<代号>-<批次数>" -> (since, generation)"""
+    try:
+        generation, count = value.split("-", 1)
+        return int(count), int(generation)
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def sse_event(event: str, event_id: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\nid: {event_id}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class NotesBroadcaster:
+    """新批次 / 清空事件的广播器（订阅者队列只在事件循环线程中访问）"""
+
+    def __init__(self):
+        self.subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        self._loop = asyncio.get_event_loop()
+
+    def publish_threadsafe(self, event: Dict[str, Any]):
+        """从任意线程投递事件：{"type": "batch", "generation", "index", "content"} 或 {"type": "reset", "generation"}"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: Dict[str, Any]):
+        for q in self.subscribers:
+            q.put_nowait(event)
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue()
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self.subscribers.discard(q)
+
+
+async def sse_notes(
+    broadcaster: NotesBroadcaster,
+    snapshot: Callable[[], Tuple[int, List[Dict[str, Any]]]],
+    since: Optional[int],
+    generation: Optional[int],
+    is_disconnected: Callable[[], Any],
+) -> AsyncIterator[str]:
+    """
+    笔记事件流
+
+    Args:
+        snapshot: 返回 (代号, 全部批次) 的函数（LLMProcessorService.content_snapshot）
+        since / generation: 客户端游标；未提供时从第一个批次开始补发
+        is_disconnected: 客户端断开检测（Request.is_disconnected）
+    """
+    # 先订阅再取快照：快照之后的批次一定在队列里，按下标去重
+    q = broadcaster.subscribe()
+    try:
+        current, content = snapshot()
+        start, reset = parse_cursor(since, generation, current, len(content))
+        if reset or since is None:
+            yield sse_event("reset", f"{current}-0", {"generation": current})
+        for index in range(start, len(content)):
+            yield sse_event("batch", f"{current}-{index + 1}", {"generation": current, "index": index, "content": content[index]})
+        next_index = len(content)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(q.get(), timeout=WS_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+
+            if event["type"] == "reset":
+                current, next_index = event["generation"], 0
+                yield sse_event("reset", f"{current}-0", {"generation": current})
+            elif event["generation"] == current and event["index"] >= next_index:
+                next_index = event["index"] + 1
+                yield sse_event("batch", f"{current}-{next_index}", {"generation": current, "index": event["index"], "content": event["content"]})
+    finally:
+        broadcaster.unsubscribe(q)
@@ -4,16 +4,24 @@ FastAPI Server for ClassAudio
 """
 import asyncio
 import json
+import os
 import sys
-import queue
-from typing import Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from src.services.audio_service import AudioTranscriptionService, CaptionOutput
+from src.config import START_WAIT_MODELS_SEC, ASR_PROCESS, WS_PER_MESSAGE_DEFLATE
+from src.services.audio_service import AudioTranscriptionService, CaptionOutput, ServiceBusyError
+from src.services.asr_process import ASRProcessClient
+from src.api.caption_hub import CaptionHub, serve_captions, parse_types, parse_since, negotiate_subprotocol
+from src.api.caption_log import CaptionLog
+from src.api.notes_stream import NotesBroadcaster, sse_notes, notes_etag, parse_cursor, parse_last_event_id
 from src.services.llm_service import LLMProcessorService
+from src.services.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE, WS_CLIENTS
 from src.agent.keywords import generate_prof_words
 
 # 修复 Windows 控制台编码问题
@@ -40,12 +48,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
 # ====== 全局服务实例 ======
 audio_service: AudioTranscriptionService = None
 llm_service: LLMProcessorService = None
+caption_hub = CaptionHub(CaptionLog())
+notes_broadcaster = NotesBroadcaster()
 
 
 # ====== 请求/响应模型 ======
@@ -77,6 +88,14 @@ class AnswerResponse(BaseModel):
     answer: str
 
 
+class FileTranscriptionResponse(BaseModel):
+    filename: str
+    audio_sec: float
+    elapsed_sec: float
+    rtf: float
+    captions: List[Dict[str, Any]]
+
+
 # ====== 生命周期事件 ======
 @app.on_event("startup")
 async def startup_event():
@@ -90,10 +109,15 @@ async def startup_event():
     # 初始化音频服务
     try:
         print("\n[1/2] Initializing Audio Service...")
-        audio_service = AudioTranscriptionService()
-        print("      Loading Whisper models (this may take a few minutes)...")
-        audio_service.initialize()
-        print("      ✓ Audio Service initialized successfully!")
+        if ASR_PROCESS:
+            # 转写服务运行在独立子进程，避免与事件循环/LLM 线程争用 GIL
+            audio_service = ASRProcessClient()
+            print(f"      ✓ ASR process started (pid={audio_service.process.pid})")
+        else:
+            audio_service = AudioTranscriptionService()
+        # 模型在后台并行加载，API 立即可用；进度见 /health
+        audio_service.initialize(background=True)
+        print("      ✓ Audio Service created, loading models in background (see /health)")
     except Exception as e:
         print(f"      ✗ Failed to initialize Audio Service: {e}")
         print("      WARNING: Audio transcription will not work!")
@@ -124,14 +148,32 @@ async def startup_event():
         traceback.print_exc()
         llm_service = None
 
+    # 字幕广播：转写服务的回调直接投递给 CaptionHub，WebSocket 客户端从各自的缓冲区读取
+    caption_hub.start()
+    if audio_service:
+        audio_service.output_queues_enabled = False
+        audio_service.set_partial_callback(caption_hub.publish_threadsafe)
+        audio_service.set_accurate_callback(caption_hub.publish_threadsafe)
+
     # 设置音频服务的回调：将 accurate 字幕传递给 LLM 服务
     if audio_service and llm_service:
         def on_accurate_caption(caption: CaptionOutput):
+            caption_hub.publish_threadsafe(caption)
             llm_service.add_transcript(caption.text)
 
         audio_service.set_accurate_callback(on_accurate_caption)
         print("\n      ✓ Services connected!")
 
+    # 结构化笔记推送：LLM 线程每处理完一个批次，推送给 /api/structured-content/stream 的订阅者
+    notes_broadcaster.start()
+    if llm_service:
+        def on_notes_batch(content: Dict[str, Any], index: int, generation: int):
+            notes_broadcaster.publish_threadsafe({
+                "type": "batch", "generation": generation, "index": index, "content": content,
+            })
+
+        llm_service.set_on_processed_callback(on_notes_batch)
+
     print("\n" + "=" * 60)
     if audio_service and llm_service:
         print("All services initialized successfully!")
@@ -150,9 +192,16 @@ async def shutdown_event():
 
     if audio_service:
         audio_service.stop_capture()
+        if isinstance(audio_service, ASRProcessClient):
+            audio_service.close()
+        else:
+            audio_service.caption_writer.sync(timeout=5.0)  # 写完会话文件
 
     if llm_service:
         llm_service.stop_async_processing()
+        llm_service.close_session()
+
+    await caption_hub.stop()
 
     print("Services stopped!")
 
@@ -169,10 +218,14 @@ async def root():
             "start": "/api/control/start",
             "stop": "/api/control/stop",
             "status": "/api/status",
+            "metrics": "/api/metrics",
             "content": "/api/structured-content",
+            "content_stream": "/api/structured-content/stream",
             "generate_keywords": "/api/keywords/generate",
             "set_keywords": "/api/keywords/set",
-            "ask_question": "/api/qa/ask"
+            "ask_question": "/api/qa/ask",
+            "ask_question_stream": "/api/qa/ask/stream",
+            "transcribe_file": "/api/transcribe/file"
         }
     }
 
@@ -180,11 +233,9 @@ async def root():
 @app.get("/api/status", response_model=StatsResponse)
 async def get_status():
     """获取服务状态"""
-    audio_stats = {
-        "is_running": audio_service.is_running if audio_service else False,
-        "partial_queue_size": audio_service.partial_output_q.qsize() if audio_service else 0,
-        "accurate_queue_size": audio_service.accurate_output_q.qsize() if audio_service else 0,
-    }
+    audio_stats = audio_service.status_snapshot() if audio_service else {"is_running": False}
+    audio_stats["caption_subscribers"] = len(caption_hub.subscribers)
+    audio_stats["caption_log"] = {"log": caption_hub.log.log_id, "last_seq": caption_hub.log.last_seq}
 
     llm_stats = llm_service.get_stats() if llm_service else {}
     # 添加 session_id 到 llm_stats
@@ -197,15 +248,45 @@ async def get_status():
     )
 
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    if isinstance(audio_service, ASRProcessClient):
+        content = audio_service.render_metrics()
+    else:
+        content = REGISTRY.render()
+    return Response(content=content, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+async def wait_models_ready(names):
+    """等待模型就绪（最长 START_WAIT_MODELS_SEC），加载失败返回 500，超时返回 503"""
+    ready = await asyncio.get_event_loop().run_in_executor(
+        None,
+        lambda: audio_service.wait_models_ready(names, timeout=START_WAIT_MODELS_SEC)
+    )
+    if ready:
+        return
+
+    status = audio_service.model_status()
+    failed = {n: status[n].get("error") for n in names if status[n]["state"] == "failed"}
+    if failed:
+        raise HTTPException(status_code=500, detail=f"Model loading failed: {failed}")
+    pending = {n: status[n]["state"] for n in names if status[n]["state"] != "ready"}
+    raise HTTPException(status_code=503, detail=f"Models not ready after {START_WAIT_MODELS_SEC:.0f}s: {pending}")
+
+
 @app.post("/api/control/start", response_model=StatusResponse)
 async def start_recording():
-    """开始录音和转写"""
+    """开始录音和转写（模型仍在加载时等待其就绪）"""
     if not audio_service:
         raise HTTPException(status_code=500, detail="Audio service not initialized")
 
     if not llm_service:
         raise HTTPException(status_code=500, detail="LLM service not initialized")
 
+    if not audio_service.is_running:
+        await wait_models_ready(("vad", "partial", "final"))
+
     try:
         # 只有在未录音时才启动新的 LLM 会话
         # 如果已经在录音中（例如前端刷新后重连），则不创建新 session
@@ -237,7 +318,13 @@ async def stop_recording():
         raise HTTPException(status_code=500, detail="Audio service not initialized")
 
     try:
-        audio_service.stop_capture()
+        # stop_capture 要等 final 线程解码完剩余的句子（最多 FINAL_DRAIN_TIMEOUT_SEC），不在事件循环上阻塞
+        await asyncio.get_event_loop().run_in_executor(None, audio_service.stop_capture)
+        if llm_service:
+            # 此时最后几句的 accurate 字幕都已进入 LLM 缓冲区；不足一个批次的也送去整理（不等超时）
+            flushed = llm_service.flush_transcripts()
+            if flushed:
+                print(f"Flushed {flushed} remaining transcripts to LLM")
         return StatusResponse(status="stopped", message="Audio capture stopped successfully")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stop: {str(e)}")
@@ -293,26 +380,67 @@ async def set_keywords(request: ProfWordsResponse):
 
 
 @app.get("/api/structured-content")
-async def get_structured_content(latest: int = 0):
+async def get_structured_content(
+    request: Request, latest: int = 0, since: Optional[int] = None, generation: Optional[int] = None,
+):
     """
     获取 LLM 整理的结构化内容
 
     Args:
-        latest: 返回最新的 N 条，0 表示返回全部
+        latest: 返回最新的 N 条，0 表示返回全部（提供 since 时忽略）
+        since: 增量游标，只返回下标 >= since 的批次（即客户端已有的批次数）
+        generation: 游标所属的代号（上次响应中的 generation）；与当前代不符时 reset=true 并返回全部
+
+    响应带 ETag "<代号>-<批次数>"；If-None-Match 与之相同时返回 304（没有新批次）
     """
     if not llm_service:
         raise HTTPException(status_code=500, detail="LLM service not initialized")
 
-    if latest > 0:
-        content = llm_service.get_latest_content(n=latest)
+    current, all_content = llm_service.content_snapshot()
+    total = len(all_content)
+    etag = notes_etag(current, total)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    start, reset = parse_cursor(since, generation, current, total)
+    if since is not None:
+        content = all_content[start:]
+    elif latest > 0:
+        content = all_content[-latest:]
     else:
-        content = llm_service.get_all_content()
+        content = all_content
 
     return JSONResponse(content={
-        "total": len(llm_service.get_all_content()),
+        "total": total,
         "returned": len(content),
+        "since": start if since is not None else total - len(content),
+        "generation": current,
+        "reset": reset,
         "content": content
-    })
+    }, headers={"ETag": etag})
+
+
+@app.get("/api/structured-content/stream")
+async def stream_structured_content(request: Request, since: Optional[int] = None, generation: Optional[int] = None):
+    """
+    结构化笔记的 SSE 推送（见 notes_stream）
+
+    先补发游标之后的批次，之后每处理完一个批次推送一条 batch 事件；笔记被清空时推送 reset。
+    EventSource 自动重连时以 Last-Event-ID 续传。
+    """
+    if not llm_service:
+        raise HTTPException(status_code=500, detail="LLM service not initialized")
+
+    # EventSource 自动重连时仍使用最初的 URL，Last-Event-ID 比查询参数新
+    last_since, last_generation = parse_last_event_id(request.headers.get("last-event-id"))
+    if last_since is not None:
+        since, generation = last_since, last_generation
+
+    return StreamingResponse(
+        sse_notes(notes_broadcaster, llm_service.content_snapshot, since, generation, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/structured-content/clear", response_model=StatusResponse)
@@ -322,6 +450,7 @@ async def clear_structured_content():
         raise HTTPException(status_code=500, detail="LLM service not initialized")
 
     llm_service.clear()
+    notes_broadcaster.publish_threadsafe({"type": "reset", "generation": llm_service.content_generation})
     return StatusResponse(status="cleared", message="LLM service data cleared")
 
 
@@ -355,106 +484,141 @@ async def ask_question(request: QuestionRequest):
         raise HTTPException(status_code=500, detail=f"Failed to answer question: {str(e)}")
 
 
+@app.post("/api/qa/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    流式问答（SSE）：模型每返回一段文本即推送，不等完整回答
+
+    事件：
+        event: token  data: {"text": "..."}
+        event: done   data: {"first_token_ms": ..., "total_ms": ...}
+        event: error  data: {"detail": "..."}
+    客户端断开时流被取消，上游 LLM 请求随之关闭。
+    """
+    if not llm_service:
+        raise HTTPException(status_code=500, detail="LLM service not initialized")
+
+    async def events():
+        t0 = time.perf_counter()
+        first_token_ms = None
+        try:
+            async for delta in llm_service.astream_answer(request.question):
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - t0) * 1000.0
+                yield f"event: token\ndata: {json.dumps({'text': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'回答问题时出错: {e}'}, ensure_ascii=False)}\n\n"
+            return
+        done = {"first_token_ms": first_token_ms, "total_ms": (time.perf_counter() - t0) * 1000.0}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/transcribe/file", response_model=FileTranscriptionResponse)
+async def transcribe_file(file: UploadFile = File(...), raw_sample_rate: Optional[int] = None):
+    """
+    离线转写上传的音频文件（WAV / FLAC / MP3 等，或原始 16-bit PCM）
+
+    与实时录音互斥，录音进行中时返回 409；文件无法解码时返回 400。
+
+    Args:
+        file: 上传的音频文件
+        raw_sample_rate: 原始 PCM 的采样率（默认 16000）
+    """
+    if not audio_service:
+        raise HTTPException(status_code=500, detail="Audio service not initialized")
+
+    if audio_service.is_running or audio_service.offline_mode:
+        raise HTTPException(status_code=409, detail="Audio service is busy (live capture or another file)")
+
+    await wait_models_ready(("vad", "final"))
+
+    suffix = os.path.splitext(file.filename or "")[1] or ".wav"
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with tmp:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                tmp.write(chunk)
+
+        result = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: audio_service.transcribe_file(tmp.name, raw_sample_rate=raw_sample_rate)
+        )
+    except ServiceBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        # 上传的文件无法解码
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to transcribe file: {str(e)}")
+    finally:
+        try:
+            os.remove(tmp.name)
+        except OSError:
+            pass
+
+    return FileTranscriptionResponse(
+        filename=file.filename or "",
+        audio_sec=result.audio_sec,
+        elapsed_sec=result.elapsed_sec,
+        rtf=result.rtf,
+        captions=[
+            {
+                "timestamp": c.timestamp,
+                "text": c.text,
+                "audio_start": c.audio_start,
+                "audio_end": c.audio_end,
+            }
+            for c in result.captions
+        ]
+    )
+
+
 # ====== WebSocket API ======
 @app.websocket("/ws/captions")
 async def websocket_captions(websocket: WebSocket):
     """
     WebSocket 端点：实时推送字幕
+    查询参数 types：订阅的字幕类型，逗号分隔（默认 "partial,accurate"）
+    查询参数 since / log：已收到的最后一条 accurate 的序号和日志 id，提供时先补发一帧 {"type": "catchup", ...}
     发送格式：
     {
         "type": "partial" | "accurate",
         "text": "字幕内容",
         "timestamp": "HH:MM:SS",
         "no_speech_prob": 0.1,  // 仅 accurate
-        "avg_logprob": -0.5     // 仅 accurate
+        "avg_logprob": -0.5,    // 仅 accurate
+        "seq": 42               // 仅 accurate：日志序号
     }
+    客户端声明子协议 captions.delta.json / captions.delta.msgpack 时改用增量格式（见 caption_hub）：
+    {"type": "partial", "id": 句子 id, "stable": 稳定词数, "keep": 保留的词数, "suffix": "新的后缀"}
+    {"type": "accurate", "id": 句子 id, "seq": 序号, "text": ..., "timestamp": ..., "no_speech_prob": ..., "avg_logprob": ...}
     """
-    await websocket.accept()
-    print("WebSocket client connected")
+    subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
+    WS_CLIENTS.inc()
+    print(f"WebSocket client connected (protocol={subprotocol or 'full'})")
 
     try:
-        # 心跳任务：每 30 秒发送一次 ping，保持连接活跃
-        async def send_heartbeat():
-            while True:
-                try:
-                    await asyncio.sleep(30)
-                    await websocket.send_json({
-                        "type": "ping",
-                        "timestamp": ""
-                    })
-                except Exception as e:
-                    print(f"Heartbeat error: {e}")
-                    break
-
-        # 启动三个异步任务：partial, accurate, heartbeat
-        async def send_partial():
-            while True:
-                try:
-                    # 非阻塞获取 partial 字幕
-                    caption = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        audio_service.get_partial_caption,
-                        True,  # block
-                        1.0    # timeout
-                    )
-
-                    await websocket.send_json({
-                        "type": caption.type,
-                        "text": caption.text,
-                        "timestamp": caption.timestamp
-                    })
-
-                except queue.Empty:
-                    # 队列为空（没有数据）是正常的，继续等待
-                    await asyncio.sleep(0.1)
-                    continue
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as e:
-                    print(f"Error sending partial: {e}")
-                    break
-
-        async def send_accurate():
-            while True:
-                try:
-                    # 非阻塞获取 accurate 字幕
-                    caption = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        audio_service.get_accurate_caption,
-                        True,  # block
-                        1.0    # timeout
-                    )
-
-                    await websocket.send_json({
-                        "type": caption.type,
-                        "text": caption.text,
-                        "timestamp": caption.timestamp,
-                        "no_speech_prob": caption.no_speech_prob,
-                        "avg_logprob": caption.avg_logprob
-                    })
-
-                except queue.Empty:
-                    # 队列为空（没有数据）是正常的，继续等待
-                    await asyncio.sleep(0.1)
-                    continue
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as e:
-                    print(f"Error sending accurate: {e}")
-                    break
-
-        # 并发运行三个任务
-        await asyncio.gather(
-            send_partial(),
-            send_accurate(),
-            send_heartbeat()
+        params = websocket.query_params
+        await serve_captions(
+            websocket, caption_hub, parse_types(params.get("types")), subprotocol,
+            since=parse_since(params.get("since")), log_id=params.get("log"),
         )
-
     except WebSocketDisconnect:
         print("WebSocket client disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
+        WS_CLIENTS.dec()
         try:
             await websocket.close()
         except Exception:
@@ -464,11 +628,14 @@ async def websocket_captions(websocket: WebSocket):
 # ====== 健康检查 ======
 @app.get("/health")
 async def health_check():
-    """健康检查"""
+    """健康检查（含各模型加载状态：pending / loading / warming / ready / failed）"""
+    models = audio_service.model_status() if audio_service else {}
     return {
         "status": "healthy",
         "audio_service": "initialized" if audio_service else "not initialized",
-        "llm_service": "initialized" if llm_service else "not initialized"
+        "llm_service": "initialized" if llm_service else "not initialized",
+        "models_ready": bool(models) and all(m["state"] == "ready" for m in models.values()),
+        "models": models,
     }
 
 
@@ -482,5 +649,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=False,  # 生产环境设为 False
-        log_level="info"
+        log_level="info",
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
     )
@@ -4,11 +4,16 @@ ClassAudio Configuration Example File
 """
 import os
 
+from dotenv import load_dotenv
+
 # ====== 路径配置 ======
 # BASE_DIR 现在指向项目根目录（src/ 的父目录）
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
+# 项目根目录的 .env（见 .env.example）读入环境变量，已存在的环境变量优先
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
 # VAD 模型路径
 VAD_DIR = os.path.join(DATA_DIR, "vad", "silero-vad-master")
 
@@ -25,7 +30,7 @@ MODEL_DIR_PARTIAL = os.path.join(DATA_DIR, "models", "faster-whisper-small.en")
 
 # 输出路径
 LOGS_DIR = os.path.join(DATA_DIR, "logs")
-OUT_TXT = os.path.join(LOGS_DIR, "captions.txt")
+CAPTION_SESSION_DIR = os.path.join(LOGS_DIR, "sessions")  # 每次录音一个 <开始时间>.jsonl（accurate 字幕、音频时间、解码耗时、置信度）
 TRANSCRIPT_LIST_JSON = os.path.join(DATA_DIR, "transcript_list.json")
 
 # ====== 音频配置 ======
@@ -44,33 +49,104 @@ MIN_SPEECH_MS = 250  # 最小语音持续时间
 MIN_SILENCE_MS = 800  # 最小静音持续时间
 MAX_UTT_S = 18  # 最大语音段长度（秒）
 
+# VAD 推理后端
+VAD_BACKEND = "onnx"  # "onnx"（ONNX Runtime CPU，无需 torch）或 "torch"（回退）
+VAD_ONNX_PATH = ""  # 留空则在 VAD_DIR 中自动查找 silero_vad.onnx，找不到时用 faster-whisper 自带的模型（一次推理整批块）
+VAD_ONNX_THREADS = 1  # ONNX Runtime 线程数
+VAD_BATCH_MAX = 16  # 每次从 audio_q 批量取出并推理的最大块数
+
 PADDING_MS = 200  # 前置填充
 PADDING_SAMPLES = int(SR * PADDING_MS / 1000)
 END_TAIL_MS = 200  # 尾部静音保留
 
+# 语音段缓冲区（预分配，句子之间复用）
+# （bench_utterance_buffer，18 秒的句子：旧的 list + concatenate 每句分配 26.5 MiB、CPU 112.6 ms；
+#  float32 缓冲区 0 MiB、7.3 ms；int16 缓冲区 0 MiB、29.9 ms）
+UTT_BUFFER_DTYPE = "float32"  # "float32"：零拷贝视图；"int16"：内存减半
+UTT_BUFFER_SAMPLES = int(SR * (MAX_UTT_S + (PADDING_MS + END_TAIL_MS) / 1000 + 1.0))
+
 # ====== Whisper 解码配置 (Final Model) ======
 LANGUAGE = "en"
 BEAM_SIZE = 8
 TEMPERATURE = 0.0
 PATIENCE = 1.2
-COMPUTE_TYPE_FINAL = "float16"  # GPU: float16, CPU: int8 或 float32
+COMPUTE_TYPE_FINAL = "auto"  # GPU: float16, CPU: int8 或 float32；"auto" 时启动自动选择
+
+# ====== 模型加载模式 ======
+# "dual": partial / final 各加载一个模型；"single": 只加载一个模型，两条路径共用（解码参数不变）
+WHISPER_MODEL_MODE = "dual"
+SINGLE_MODEL_SOURCE = "final"  # single 模式下共用哪个模型："final"（medium.en）或 "partial"（small.en）
+SINGLE_MODEL_NUM_WORKERS = 2  # 共用模型的并发解码数（partial 与 final 线程可同时解码）
+
+# ====== 模型后台加载 ======
+MODEL_LOAD_PARALLEL = True  # VAD / partial / final 模型并行加载（False 时按顺序加载）
+MODEL_WARMUP = True  # 加载后先解码一段静音，首句不再承担初始化开销
+MODEL_WARMUP_SEC = 1.0  # 预热音频长度（秒）
+START_WAIT_MODELS_SEC = 120.0  # 开始录音/文件转写时等待模型就绪的最长时间（秒）
+
+# ====== ASR 子进程 ======
+# True: 转写服务运行在独立子进程（独立解释器与 GIL），音频经共享内存环形缓冲区传入，字幕经管道传回
+ASR_PROCESS = False
+ASR_RING_BLOCKS = 256  # 共享内存环形缓冲区容量（音频块数，每块 BLOCK_MS 毫秒）
+ASR_STATUS_INTERVAL_SEC = 0.5  # 子进程状态/指标上报间隔
+ASR_COMMAND_TIMEOUT_SEC = 30.0  # 控制命令等待子进程应答的超时（文件转写不受限）
+
+# ====== WebSocket 字幕推送 ======
+CAPTION_HUB_CLIENT_BUFFER = 256  # 每个客户端最多积压的 accurate 字幕数，超过则断开（partial 只保留最新一条）
+WS_HEARTBEAT_SEC = 30  # 心跳间隔（秒）
+WS_PER_MESSAGE_DEFLATE = True  # 与客户端协商 permessage-deflate 压缩（增量字幕的重复字段压缩效果明显）
+CAPTION_LOG_DIR = os.path.join(LOGS_DIR, "caption_log")  # accurate 字幕序号日志（每次启动一个 JSONL，用于断线补发；置空则只保留内存中的部分）
+CAPTION_LOG_MEMORY = 2000  # 内存中保留的最近 accurate 条数，更早的补发从文件读取
+
+# ====== 字幕落盘（后台写线程）======
+CAPTION_FSYNC = "interval"  # "always" 每批 fsync | "interval" 至多每 CAPTION_FSYNC_INTERVAL_SEC 秒一次 | "never" 只 flush
+CAPTION_FSYNC_INTERVAL_SEC = 5.0
+CAPTION_WRITER_BATCH = 64  # 每次合并写入的最多记录数
+CAPTION_WRITER_QUEUE_MAX = 10000  # 写线程卡住时最多积压的记录数，超过则丢弃并计数
+
+# ====== 离线并行转写配置（长录音按 VAD 边界切分，多进程解码）======
+PARALLEL_WORKERS = 4  # 默认进程数
+PARALLEL_DEVICE = "cpu"
+PARALLEL_COMPUTE_TYPE = "int8"
+PARALLEL_MAX_MEMORY_MB = 8192  # 所有模型副本合计的内存上限
+PARALLEL_REPLICA_MB = 0  # 单个模型副本的内存（MB），0 表示按模型文件大小估算
+
+# ====== Final 解码配置 ======
+FINAL_SEPARATE_WORKER = True  # final 解码在独立线程中进行，长句解码不阻塞下一句的 partial
+# （bench_partial_freeze 桩模型 180 秒合成课堂：partial 冻结 p50/p95 同步 0.86s/2.77s，独立线程 0.71s/0.88s）
+FINAL_Q_MAX = 32  # 待 final 解码的句子队列上限
+FINAL_DRAIN_TIMEOUT_SEC = 60.0  # 停止录音时等待 final 线程解码完队列中剩余句子的上限
+FINAL_BATCHED = True  # final_q 积压时用 BatchedInferencePipeline 一次解码多句
+FINAL_BATCH_MIN_BACKLOG = 2  # 等待中的句子数达到该值时批量解码
+FINAL_BATCH_MAX = 8  # 单批最多句子数
+FINAL_BATCH_MAX_CLIP_SEC = 30.0  # 超过该长度的句子单独解码（批量管线每个样本只解码前 30 秒）
 
 # ====== Partial 字幕配置 ======
 PARTIAL_UPDATE_MS = 300  # partial 更新间隔（毫秒）
 PARTIAL_MIN_SEC = 0.8  # partial 最小音频长度
-PARTIAL_TAIL_SEC = 10.0  # partial 解码尾部长度
+PARTIAL_TAIL_SEC = 10.0  # partial 解码尾部长度（上限；增量模式下有已提交前缀时窗口总是覆盖全部未提交部分）
+PARTIAL_INCREMENTAL = True  # 只解码未提交部分（按词时间戳定位已提交前缀的结束位置）
+PARTIAL_OVERLAP_SEC = 1.0  # 增量解码时回退到已提交前缀之前的重叠长度，用于 merge_with_overlap 拼接
+PARTIAL_ADAPTIVE = True  # 按实测解码耗时和事件积压自适应调整 partial 间隔与窗口
+PARTIAL_MAX_UPDATE_MS = 2000  # 自适应间隔上限（毫秒）
+PARTIAL_DUTY = 0.5  # partial 解码最多占用的实时时间比例
+PARTIAL_MAX_BACKLOG_MS = 400  # evt_q 积压的音频超过该值时跳过 partial
+PARTIAL_EMA_ALPHA = 0.3  # 解码耗时滑动平均系数
 PARTIAL_BEAM_SIZE = 4
 PARTIAL_PATIENCE = 1.0
 STABLE_HYPS = 3  # 稳定假设数量
 COMMITTED_PROMPT_WORDS = 60
 PREV_SENT_TAIL_CHARS = 240
 
-COMPUTE_TYPE_PARTIAL = "float16"
+COMPUTE_TYPE_PARTIAL = "auto"
 
 # ====== 输出过滤配置 ======
 MIN_CHARS_TO_PRINT = 3  # 最小字符数
 MAX_NO_SPEECH_PROB = 0.6  # 最大非语音概率
 MIN_AVG_LOGPROB = -1.0  # 最小平均对数概率
+# 上面两项取自 TranscriptionInfo，faster-whisper 的 info 不含这两个字段，默认不生效；
+# 设为 True 时改用各分段的值（按时长加权）汇总，过滤随之生效（阈值尚未用真实课堂录音校准）
+FINAL_SEGMENT_QUALITY = False
 
 # ====== 专业词汇提示词 ======
 # 默认提示词（当用户未设置课堂主题时使用）
@@ -92,15 +168,50 @@ DOUBAO_API_KEY = os.getenv("DOUBAO_API_KEY", "YOUR_DOUBAO_API_KEY_HERE")
 DOUBAO_BASE_URL = os.getenv("DOUBAO_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
 DOUBAO_MODEL = os.getenv("DOUBAO_MODEL", "doubao-seed-1-6-flash-250828")
 
+# LLM 客户端（src/agent/llm.py）：每个 provider 一个进程内共享的连接池客户端
+LLM_TIMEOUT_SEC = 60.0  # 单次请求超时
+LLM_MAX_RETRIES = 3  # 429 / 5xx / 超时 / 连接错误时的重试次数（指数退避）
+LLM_BACKOFF_BASE_SEC = 1.0
+LLM_BACKOFF_MAX_SEC = 30.0
+LLM_MAX_CONCURRENCY = 4  # 每个 provider 同时在途的请求数上限
+# 设置后所有 provider 改用该地址，如本地模拟服务 http://127.0.0.1:8001/v1（python -m benchmarks.mock_llm_server）
+LLM_BASE_URL_OVERRIDE = os.getenv("LLM_BASE_URL_OVERRIDE", "")
+
 # LLM 处理配置
-LLM_CHUNK_SIZE = 4  # 每次处理的转写文本数量
+# 批次切分（见 transcript_chunker）：token 达到上限立即处理；最早一条等待超过 MAX_WAIT 时处理；
+# 停顿超过 SILENCE 且 token 不少于 MIN_TOKENS 时处理；停止录音时处理剩余内容
+LLM_CHUNK_SIZE = 0  # 达到该条数立即处理（旧的固定条数策略，0 关闭）
+# 默认值按 sim_llm_chunking 调整：笔记延迟 p50 不高于旧的每 4 条策略（20 分钟合成课堂 14.3s vs 15.9s），
+# 代价是 LLM 调用次数更多（59 vs 37）
+LLM_CHUNK_MIN_TOKENS = 30
+LLM_CHUNK_MAX_TOKENS = 200
+LLM_CHUNK_MAX_WAIT_SEC = 20.0
+LLM_CHUNK_SILENCE_SEC = 2.5
 LLM_OUTPUT_JSON = os.path.join(LOGS_DIR, "llmcontent-latest.json")
+# 流水线：同时在途的批次数上限（1 为严格串行）。后续批次不等前一批返回，先用当时已知的最新 supplement 发出；
+# 前一批返回后若真实 supplement 与所用的差异（条目 Jaccard 距离）超过阈值，则用真实 supplement 重跑该批次
+LLM_PIPELINE_DEPTH = 1
+LLM_RECONCILE_THRESHOLD = 0.5
+LLM_STOP_DRAIN_TIMEOUT_SEC = 120.0  # 停止处理时等待在途批次返回并保存的上限（之后才压缩会话文件）
+
+# 问答上下文（见 retrieval_index）：笔记条目和转写原文建 BM25 索引，全部内容超过预算时只发送与问题最相关的片段
+QA_CONTEXT_MAX_TOKENS = 1500  # 提示词中课堂内容的 token 上限
+QA_TOP_K = 24  # 检索候选片段数
+QA_CAPTION_PASSAGE_TOKENS = 80  # 转写原文按约该 token 数合并为一个检索片段
 
 # 确保 logs 目录存在
 os.makedirs(LOGS_DIR, exist_ok=True)
 
 # ====== GPU 配置 ======
-DEVICE = "cuda"  # 使用 CUDA 加速，CPU 设为 "cpu"
+DEVICE = "auto"  # "cuda" / "cpu"，"auto" 时检测 CUDA 并自动选择
+
+# ====== 硬件自动配置 ======
+# DEVICE 或 COMPUTE_TYPE_* 为 "auto" 时，启动时计时解码样本音频选出运行配置，按机器指纹缓存
+HW_PROFILE_CACHE = os.path.join(DATA_DIR, "hw_profile.json")
+HW_PROFILE_CLIP = os.path.join(DATA_DIR, "profile", "clip.wav")  # 16k 单声道 WAV；缺失时用合成信号并告警（RTF 偏乐观），放入真实样本后自动重新测量
+HW_PROFILE_CLIP_SEC = 10.0  # 计时使用的音频长度
+HW_PROFILE_TARGET_RTF = 0.5  # 目标实时率：达标配置中选占用线程最少的，都不达标时选最快的并给出警告
+HW_PROFILE_PARTIAL_CORE_SHARE = 0.5  # dual 模式下分给 partial 模型的物理核比例（其余给 final，两者并发解码）
 
 # ====== 本地配置覆盖 ======
 # 如果存在 config_local.py，则导入并覆盖上述配置
@@ -0,0 +1,559 @@
+"""
+ASR Process
+在独立子进程中运行转写服务（独立解释器与 GIL），主进程只负责采集音频和转发字幕
+
+- 音频：主进程的声卡回调把音频块写入共享内存环形缓冲区（ShmAudioRing），子进程轮询读取
+- 字幕与状态：子进程经管道发回 CaptionOutput 和定期的状态快照（含指标）
+- 控制：主进程经管道发送命令（start_capture / stop_capture / set_prof_words / transcribe_file ...）
+
+ASRProcessClient 与 AudioTranscriptionService 接口一致，服务端代码无需区分。
+"""
+import itertools
+import multiprocessing as mp
+import pickle
+import queue
+import signal
+import threading
+import time
+import types
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import sounddevice as sd
+
+from src.config import (
+    SR, CHANNELS, BLOCK_MS, BLOCK_SAMPLES,
+    ASR_RING_BLOCKS, ASR_STATUS_INTERVAL_SEC, ASR_COMMAND_TIMEOUT_SEC, FINAL_DRAIN_TIMEOUT_SEC,
+)
+from src.services.audio_service import (
+    AudioTranscriptionService, CaptionOutput, FileTranscriptionResult, ServiceBusyError,
+    safe_put_drop_oldest, setup_logger,
+)
+from src.services.model_loader import MODEL_NAMES
+from src.services.metrics import REGISTRY, QUEUE_DROPS_TOTAL
+
+
+# ====== 共享内存环形缓冲区 ======
+class ShmAudioRing:
+    """
+    单生产者 / 单消费者的音频块环形缓冲区（int16，每块 block_samples 个采样）
+
+    头部：[0] 已写入块数（单调递增），[1] 声卡输入溢出次数。
+    写入方先写数据再递增计数；读取方落后超过容量时跳到最新的 capacity 块，其余记为丢弃。
+    """
+
+    HEADER_BYTES = 64
+
+    def __init__(self, capacity: int = ASR_RING_BLOCKS, block_samples: int = BLOCK_SAMPLES,
+                 name: Optional[str] = None):
+        self.capacity = capacity
+        self.block_samples = block_samples
+        size = self.HEADER_BYTES + capacity * block_samples * 2
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.header = np.ndarray((self.HEADER_BYTES // 8,), dtype=np.uint64, buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, block_samples), dtype=np.int16, buffer=self.shm.buf,
+                               offset=self.HEADER_BYTES)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_count(self) -> int:
+        return int(self.header[0])
+
+    @property
+    def overflow_count(self) -> int:
+        return int(self.header[1])
+
+    def write(self, block: np.ndarray):
+        """写入一块（生产者，声卡回调中调用）"""
+        n = self.write_count
+        slot = self.data[n % self.capacity]
+        k = min(block.size, self.block_samples)
+        slot[:k] = block[:k]
+        if k < self.block_samples:
+            slot[k:] = 0
+        self.header[0] = n + 1
+
+    def mark_overflow(self):
+        self.header[1] += 1
+
+    def read(self, start: int) -> Tuple[List[np.ndarray], int, int]:
+        """
+        读取 start 之后写入的全部块（消费者）
+
+        Returns:
+            (blocks, next_start, dropped)
+        """
+        end = self.write_count
+        dropped = 0
+        if end - start > self.capacity:
+            dropped = end - start - self.capacity
+            start = end - self.capacity
+
+        blocks = [self.data[i % self.capacity].copy() for i in range(start, end)]
+
+        # 拷贝期间被生产者覆盖的块作废
+        overwritten = self.write_count - self.capacity - start
+        if overwritten > 0:
+            blocks = blocks[overwritten:]
+            dropped += overwritten
+        return blocks, end, dropped
+
+    def close(self):
+        # 先释放对共享内存的引用，否则 close() 会因导出的缓冲区报错
+        del self.header, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+_OVERFLOW_STATUS = types.SimpleNamespace(input_overflow=True)
+
+
+class ShmRingInputStream:
+    """
+    子进程中 sd.InputStream 的替身：从环形缓冲区读取音频块并按声卡回调的方式交付
+
+    只交付 start() 之后写入的音频；主进程上报的输入溢出以 status.input_overflow 传给回调。
+    """
+
+    def __init__(self, ring: ShmAudioRing, *, samplerate: int, channels: int, dtype: str,
+                 blocksize: int, callback: Callable):
+        if samplerate != SR or channels != 1 or dtype != "int16" or blocksize != ring.block_samples:
+            raise ValueError("ShmRingInputStream only supports 16k mono int16 with the ring's block size")
+        self.ring = ring
+        self.callback = callback
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._read = 0
+        self._overflows = 0
+
+    @classmethod
+    def factory(cls, ring: ShmAudioRing):
+        def make(**kwargs):
+            return cls(ring, **kwargs)
+        return make
+
+    def start(self):
+        self._read = self.ring.write_count
+        self._overflows = self.ring.overflow_count
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ShmRingReader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        poll_sec = BLOCK_MS / 1000.0 / 4
+        while not self._stop.is_set():
+            blocks, self._read, dropped = self.ring.read(self._read)
+            if dropped:
+                QUEUE_DROPS_TOTAL.labels(queue="shm_ring").inc(dropped)
+            if not blocks:
+                time.sleep(poll_sec)
+                continue
+
+            status = None
+            overflows = self.ring.overflow_count
+            if overflows != self._overflows:
+                self._overflows = overflows
+                status = _OVERFLOW_STATUS
+
+            for block in blocks:
+                self.callback(block.reshape(-1, 1), block.size, None, status)
+                status = None
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def close(self):
+        pass
+
+
+# ====== 子进程 ======
+def default_service_factory() -> AudioTranscriptionService:
+    return AudioTranscriptionService()
+
+
+def _child_main(ring_name: str, capacity: int, block_samples: int, cmd_conn, msg_conn,
+                service_factory: Callable[[], AudioTranscriptionService]):
+    """子进程入口：运行转写服务，经管道收发命令、字幕和状态"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理，再经 close() 关闭子进程
+
+    ring = ShmAudioRing(capacity, block_samples, name=ring_name)
+    service = service_factory()
+    service.input_stream_factory = ShmRingInputStream.factory(ring)
+
+    send_lock = threading.Lock()
+    stop = threading.Event()
+
+    def send(msg):
+        with send_lock:
+            try:
+                msg_conn.send(msg)
+            except (OSError, ValueError):
+                stop.set()
+
+    def forward(get_caption, lock: threading.Lock):
+        while not stop.is_set():
+            with lock:
+                try:
+                    caption = get_caption(True, 0.5)
+                except queue.Empty:
+                    continue
+                send(("caption", caption))
+
+    # 转发 accurate 字幕与 stop_capture 的应答之间保持顺序
+    accurate_lock = threading.Lock()
+
+    def stop_capture():
+        service.stop_capture()
+        # 停止时解码完的最后几句先于应答发出：主进程收到应答后立即把 LLM 缓冲区送去处理
+        with accurate_lock:
+            while True:
+                try:
+                    caption = service.get_accurate_caption(False)
+                except queue.Empty:
+                    break
+                send(("caption", caption))
+
+    def report():
+        while not stop.is_set():
+            snapshot = service.status_snapshot()
+            snapshot["offline_mode"] = service.offline_mode
+            snapshot["metrics"] = REGISTRY.render()
+            send(("status", snapshot))
+            stop.wait(ASR_STATUS_INTERVAL_SEC)
+
+    def initialize():
+        # service_factory 已注入模型（基准测试）时不再加载
+        if not service.wait_models_ready(timeout=0):
+            service.initialize(background=True)
+
+    commands: Dict[str, Callable] = {
+        "initialize": initialize,
+        "start_capture": service.start_capture,
+        "stop_capture": stop_capture,
+        "set_prof_words": service.set_prof_words,
+        "transcribe_file": service.transcribe_file,
+    }
+
+    def run(req_id: int, method: str, args: tuple):
+        try:
+            result = commands[method](*args)
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            send(("reply", req_id, False, e))
+            return
+        send(("reply", req_id, True, result))
+
+    threading.Thread(target=forward, args=(service.get_partial_caption, threading.Lock()), daemon=True).start()
+    threading.Thread(target=forward, args=(service.get_accurate_caption, accurate_lock), daemon=True).start()
+    threading.Thread(target=report, daemon=True).start()
+
+    # 命令各自在线程中执行：文件转写耗时很长，不能阻塞其他命令
+    while True:
+        try:
+            msg = cmd_conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:  # 关闭
+            break
+        threading.Thread(target=run, args=msg, daemon=True).start()
+
+    stop.set()
+    if service.is_running:
+        service.stop_capture()
+    service.caption_writer.sync(timeout=5.0)  # 退出前写完会话文件
+    ring.close()
+
+
+# ====== 主进程代理 ======
+class ASRProcessClient:
+    """
+    子进程转写服务的主进程代理（接口与 AudioTranscriptionService 一致）
+
+    主进程持有声卡输入流（input_stream_factory，默认 sd.InputStream），回调只把音频块写入共享内存；
+    字幕由接收线程放入 partial_output_q / accurate_output_q 并调用回调。
+    """
+
+    def __init__(self, service_factory: Callable[[], AudioTranscriptionService] = default_service_factory):
+        self.ring = ShmAudioRing()
+
+        ctx = mp.get_context("spawn")
+        cmd_recv, self._cmd_send = ctx.Pipe(duplex=False)
+        self._msg_recv, msg_send = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(
+            target=_child_main,
+            args=(self.ring.name, self.ring.capacity, self.ring.block_samples, cmd_recv, msg_send, service_factory),
+            name="ASRProcess",
+            daemon=True,
+        )
+        self.process.start()
+        # 关闭本进程持有的另一端，子进程退出时接收线程才能收到 EOF
+        cmd_recv.close()
+        msg_send.close()
+
+        # 输出队列（外部消费）
+        self.partial_output_q = queue.Queue(maxsize=100)
+        self.accurate_output_q = queue.Queue(maxsize=100)
+
+        # 控制
+        self.is_running = False
+        self.offline_mode = False
+        self.audio_stream = None
+        self.input_stream_factory: Callable[..., Any] = sd.InputStream
+        self.dynamic_prof_words: Optional[str] = None
+
+        # 回调
+        self.partial_callback: Optional[Callable[[CaptionOutput], None]] = None
+        self.accurate_callback: Optional[Callable[[CaptionOutput], None]] = None
+        self.output_queues_enabled = True
+
+        # 子进程状态快照
+        self._status: Dict[str, Any] = {}
+        self._status_cond = threading.Condition()
+        self._exited = False
+
+        # 命令应答
+        self._req_ids = itertools.count(1)
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._send_lock = threading.Lock()
+
+        self.logger = setup_logger('ASRProcess', 'logs/asr_process.log')
+        self.logger.info(f"ASR process started (pid={self.process.pid}, ring={self.ring.name})")
+
+        self._receiver = threading.Thread(target=self._receive, name="ASRProcessReceiver", daemon=True)
+        self._receiver.start()
+
+    # ====== 管道 ======
+    def _call(self, method: str, *args, timeout: Optional[float] = ASR_COMMAND_TIMEOUT_SEC):
+        """向子进程发送命令并等待应答；子进程中的异常在此重新抛出"""
+        if self._exited:
+            raise RuntimeError("ASR process has exited")
+
+        req_id = next(self._req_ids)
+        slot: Dict[str, Any] = {"done": threading.Event()}
+        self._pending[req_id] = slot
+        with self._send_lock:
+            self._cmd_send.send((req_id, method, args))
+
+        if not slot["done"].wait(timeout):
+            self._pending.pop(req_id, None)
+            raise TimeoutError(f"ASR process did not answer '{method}' within {timeout}s")
+        if not slot["ok"]:
+            raise slot["payload"]
+        return slot["payload"]
+
+    def _receive(self):
+        while True:
+            try:
+                msg = self._msg_recv.recv()
+            except (EOFError, OSError):
+                break
+
+            kind = msg[0]
+            if kind == "caption":
+                self._on_caption(msg[1])
+            elif kind == "status":
+                with self._status_cond:
+                    self._status = msg[1]
+                    self._status_cond.notify_all()
+            elif kind == "reply":
+                slot = self._pending.pop(msg[1], None)
+                if slot is not None:
+                    slot["ok"], slot["payload"] = msg[2], msg[3]
+                    slot["done"].set()
+
+        # 子进程退出：模型标记为失败，唤醒所有等待者
+        self.logger.error(f"ASR process exited (exitcode={self.process.exitcode})")
+        with self._status_cond:
+            self._exited = True
+            self._status["model_status"] = {
+                name: {"state": "failed", "error": "ASR process exited"} for name in MODEL_NAMES
+            }
+            self._status_cond.notify_all()
+        for slot in list(self._pending.values()):
+            slot["ok"], slot["payload"] = False, RuntimeError("ASR process exited")
+            slot["done"].set()
+        self._pending.clear()
+        self.is_running = False
+
+    def _on_caption(self, caption: CaptionOutput):
+        if caption.type == "partial":
+            q, callback = self.partial_output_q, self.partial_callback
+        else:
+            q, callback = self.accurate_output_q, self.accurate_callback
+        if self.output_queues_enabled:
+            safe_put_drop_oldest(q, caption, name=f"{caption.type}_output")
+
+        if callback:
+            try:
+                callback(caption)
+            except Exception as e:
+                print(f"{caption.type.capitalize()} callback error: {e}")
+
+    # ====== 模型 ======
+    def initialize(self, background: bool = False):
+        """在子进程中加载模型；background=False 时阻塞到加载结束"""
+        self._call("initialize")
+        if background:
+            return
+        if not self.wait_models_ready():
+            raise RuntimeError(f"Failed to load models: {self.model_status()}")
+
+    def model_status(self) -> Dict[str, Dict[str, Any]]:
+        with self._status_cond:
+            status = self._status.get("model_status")
+        return status or {name: {"state": "pending"} for name in MODEL_NAMES}
+
+    def wait_models_ready(self, names: Tuple[str, ...] = MODEL_NAMES, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._status_cond:
+            while True:
+                status = self._status.get("model_status", {})
+                states = [status.get(n, {}).get("state", "pending") for n in names]
+                if all(s == "ready" for s in states):
+                    return True
+                if "failed" in states:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._status_cond.wait(remaining)
+
+    # ====== 状态 ======
+    def status_snapshot(self) -> Dict[str, Any]:
+        with self._status_cond:
+            snapshot = {k: v for k, v in self._status.items() if k not in ("metrics", "offline_mode")}
+        snapshot.update({
+            "is_running": self.is_running,
+            "partial_queue_size": self.partial_output_q.qsize(),
+            "accurate_queue_size": self.accurate_output_q.qsize(),
+            "model_status": self.model_status(),
+            "process": {"pid": self.process.pid, "alive": self.process.is_alive()},
+        })
+        return snapshot
+
+    def render_metrics(self) -> str:
+        """本进程与子进程的指标（同名指标以子进程为准）"""
+        with self._status_cond:
+            child = self._status.get("metrics", "")
+        names = {line.split()[2] for line in child.splitlines() if line.startswith("# TYPE ")}
+        return REGISTRY.render(skip=names) + child
+
+    # ====== 与 AudioTranscriptionService 一致的接口 ======
+    def set_partial_callback(self, callback: Callable[[CaptionOutput], None]):
+        self.partial_callback = callback
+
+    def set_accurate_callback(self, callback: Callable[[CaptionOutput], None]):
+        self.accurate_callback = callback
+
+    def set_prof_words(self, prof_words: str):
+        self.dynamic_prof_words = prof_words
+        self._call("set_prof_words", prof_words)
+
+    def start_capture(self):
+        """启动子进程转写，再打开声卡输入流写入共享内存"""
+        if self.is_running:
+            self.logger.warning("Service is already running!")
+            print("Service is already running!")
+            return
+        if self.offline_mode:
+            raise ServiceBusyError("File transcription in progress, try again later.")
+
+        self._call("start_capture")
+
+        ring = self.ring
+
+        def audio_callback(indata, frames, time_info, status):
+            if status and getattr(status, "input_overflow", False):
+                ring.mark_overflow()
+            if frames <= 0:
+                return
+            ring.write(indata[:, 0])
+
+        try:
+            self.audio_stream = self.input_stream_factory(
+                samplerate=SR,
+                channels=CHANNELS,
+                dtype="int16",
+                blocksize=BLOCK_SAMPLES,
+                callback=audio_callback,
+            )
+            self.audio_stream.start()
+        except Exception:
+            self.audio_stream = None
+            self._call("stop_capture")
+            raise
+
+        self.is_running = True
+        self.logger.info("Audio capture started (ASR process)")
+        print("Audio capture started!")
+
+    def stop_capture(self):
+        if not self.is_running:
+            return
+
+        if self.audio_stream:
+            self.audio_stream.stop()
+            self.audio_stream.close()
+            self.audio_stream = None
+
+        try:
+            # 子进程要等 final 线程解码完剩余的句子
+            self._call("stop_capture", timeout=ASR_COMMAND_TIMEOUT_SEC + FINAL_DRAIN_TIMEOUT_SEC)
+        finally:
+            self.is_running = False
+        self.logger.info("Audio capture stopped (ASR process)")
+        print("Audio capture stopped!")
+
+    def transcribe_file(self, path: str, raw_sample_rate: Optional[int] = None) -> FileTranscriptionResult:
+        """离线转写音频文件（在子进程中执行，阻塞直到完成）"""
+        if self.is_running:
+            raise ServiceBusyError("Live capture is running. Stop it before transcribing a file.")
+        self.offline_mode = True
+        try:
+            return self._call("transcribe_file", path, raw_sample_rate, timeout=None)
+        finally:
+            self.offline_mode = False
+
+    def get_partial_caption(self, block: bool = True, timeout: Optional[float] = None) -> CaptionOutput:
+        return self.partial_output_q.get(block=block, timeout=timeout)
+
+    def get_accurate_caption(self, block: bool = True, timeout: Optional[float] = None) -> CaptionOutput:
+        return self.accurate_output_q.get(block=block, timeout=timeout)
+
+    def close(self):
+        """停止捕获并关闭子进程"""
+        try:
+            self.stop_capture()
+        except Exception as e:
+            self.logger.warning(f"Stop before close failed: {e}")
+
+        if not self._exited:
+            try:
+                with self._send_lock:
+                    self._cmd_send.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout=5.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2.0)
+        self.ring.close()
+        self.logger.info("ASR process closed")
@@ -5,12 +5,13 @@ Audio Transcription Service
 import os
 import sys
 import time
+import bisect
 import queue
 import threading
 import logging
 from datetime import datetime
 from dataclasses import dataclass
-from typing import List, Optional, Deque, Callable
+from typing import Any, Dict, List, Optional, Deque, Callable, Tuple
 from collections import deque
 
 import numpy as np
@@ -18,22 +19,43 @@ import sounddevice as sd
 from faster_whisper import WhisperModel
 
 from src.config import (
-    VAD_DIR, MODEL_DIR_FINAL, MODEL_DIR_PARTIAL,
     SR, CHANNELS, BLOCK_MS, BLOCK_SAMPLES,
     AUDIO_Q_MAX, UTT_Q_MAX,
     VAD_THRESHOLD, MIN_SPEECH_MS, MIN_SILENCE_MS, MAX_UTT_S,
-    PADDING_MS, PADDING_SAMPLES, END_TAIL_MS,
-    LANGUAGE, BEAM_SIZE, TEMPERATURE, PATIENCE, COMPUTE_TYPE_FINAL,
-    PARTIAL_UPDATE_MS, PARTIAL_MIN_SEC, PARTIAL_TAIL_SEC,
+    PADDING_MS, PADDING_SAMPLES, END_TAIL_MS, VAD_BATCH_MAX,
+    LANGUAGE, BEAM_SIZE, TEMPERATURE, PATIENCE,
+    PARTIAL_MIN_SEC,
+    PARTIAL_INCREMENTAL, PARTIAL_OVERLAP_SEC,
     PARTIAL_BEAM_SIZE, PARTIAL_PATIENCE, STABLE_HYPS,
     COMMITTED_PROMPT_WORDS, PREV_SENT_TAIL_CHARS,
-    COMPUTE_TYPE_PARTIAL, MIN_CHARS_TO_PRINT,
-    MAX_NO_SPEECH_PROB, MIN_AVG_LOGPROB, DEFAULT_PROF_WORDS,
-    OUT_TXT, DEVICE
+    MIN_CHARS_TO_PRINT,
+    MAX_NO_SPEECH_PROB, MIN_AVG_LOGPROB, FINAL_SEGMENT_QUALITY, DEFAULT_PROF_WORDS,
+    UTT_BUFFER_DTYPE, UTT_BUFFER_SAMPLES,
+    FINAL_SEPARATE_WORKER, FINAL_Q_MAX,
+    FINAL_BATCHED, FINAL_BATCH_MIN_BACKLOG, FINAL_BATCH_MAX, FINAL_BATCH_MAX_CLIP_SEC, FINAL_DRAIN_TIMEOUT_SEC,
 )
+from src.services.utterance_buffer import UtteranceBuffer
+from src.services.vad_engine import VADEngine
+from src.services.partial_scheduler import PartialScheduler
+from src.services.model_loader import ModelLoadReport, ModelLoader, MODEL_NAMES
+from src.services.audio_source import read_audio_file, iter_blocks
+from src.services.caption_writer import CaptionWriter
+from src.services.metrics import (
+    VAD_INFERENCE_SECONDS, VAD_BATCH_BLOCKS, DECODE_SECONDS, DECODE_AUDIO_SECONDS,
+    EVENT_QUEUE_LAG_SECONDS, QUEUE_DROPS_TOTAL, QUEUE_SIZE, INPUT_OVERFLOWS_TOTAL,
+    CAPTIONS_TOTAL, FINAL_REJECTED_TOTAL, FINAL_QUEUE_WAIT_SECONDS, FINAL_BATCH_SIZE,
+)
+
+
+# final_q 的停止标记：之前排队的句子全部解码完后 final 线程退出
+_FINAL_STOP = object()
 
 
 # ====== 数据结构 ======
+class ServiceBusyError(RuntimeError):
+    """实时捕获与离线文件转写互斥，另一项任务正在进行"""
+
+
 @dataclass
 class State:
     """VAD 状态"""
@@ -46,9 +68,51 @@ class State:
 @dataclass
 class UTTEvent:
     """语音事件"""
-    kind: str  # "START" | "CHUNK" | "END"
+    kind: str  # "START" | "CHUNK" | "END" | "EOF"
     audio: Optional[np.ndarray] = None  # float32 1D
     t: float = 0.0
+    pos: int = 0  # 事件对应的采样位置（相对音频流开始）
+
+
+@dataclass
+class FinalJob:
+    """待 final 解码的整句音频"""
+    audio: np.ndarray  # float32 1D（独立副本）
+    start_pos: int  # 句子起点（采样）
+    end_pos: int  # 句子终点（采样）
+    t: float  # 入队时间 time.monotonic()
+
+
+@dataclass
+class DecodeInfo:
+    """
+    一次解码的质量信息
+
+    取自 TranscriptionInfo（faster-whisper 不提供这两项，通常为 None）；
+    FINAL_SEGMENT_QUALITY 开启时由各分段按时长加权汇总（会启用 check_final_text 的两项过滤）
+    """
+    no_speech_prob: Optional[float] = None
+    avg_logprob: Optional[float] = None
+    info: Any = None  # 原始 TranscriptionInfo
+
+    @classmethod
+    def from_segments(cls, segments: list, info: Any = None) -> "DecodeInfo":
+        no_speech = getattr(info, "no_speech_prob", None)
+        logprob = getattr(info, "avg_logprob", None)
+        if not FINAL_SEGMENT_QUALITY:
+            return cls(no_speech_prob=no_speech, avg_logprob=logprob, info=info)
+        weighted = [
+            (max(float(s.end) - float(s.start), 1e-3), s.no_speech_prob, s.avg_logprob)
+            for s in segments
+            if getattr(s, "no_speech_prob", None) is not None and getattr(s, "avg_logprob", None) is not None
+        ]
+        if weighted:
+            total = sum(w for w, _, _ in weighted)
+            if no_speech is None:
+                no_speech = sum(w * p for w, p, _ in weighted) / total
+            if logprob is None:
+                logprob = sum(w * lp for w, _, lp in weighted) / total
+        return cls(no_speech_prob=no_speech, avg_logprob=logprob, info=info)
 
 
 @dataclass
@@ -59,6 +123,28 @@ class CaptionOutput:
     timestamp: str
     no_speech_prob: Optional[float] = None
     avg_logprob: Optional[float] = None
+    audio_start: Optional[float] = None  # 语音段起止（秒，相对音频流开始）
+    audio_end: Optional[float] = None
+    emit_t: Optional[float] = None  # 产生时刻 time.monotonic()（跨进程可比，用于测量投递延迟）
+    caption_id: Optional[int] = None  # 句子 id（句子起点采样数）；accurate 替换同一 id 的 partial
+    timings: Optional[Dict[str, float]] = None  # 仅 accurate：final 解码耗时（秒）queue / decode，批量解码另有 batch
+    words: Optional[List[str]] = None  # 仅 partial：整行词序列（稳定词 + 未稳定词）
+    stable_words: Optional[int] = None  # 仅 partial：words 中前多少个词已稳定
+
+
+@dataclass
+class FileTranscriptionResult:
+    """离线文件转写结果"""
+    path: str
+    captions: List[CaptionOutput]
+    audio_sec: float
+    elapsed_sec: float
+    workers: int = 1
+
+    @property
+    def rtf(self) -> float:
+        """实时率（处理耗时 / 音频时长），< 1 表示快于实时"""
+        return self.elapsed_sec / self.audio_sec if self.audio_sec > 0 else 0.0
 
 
 # ====== 工具函数 ======
@@ -67,19 +153,41 @@ def int16_to_float32(x: np.ndarray) -> np.ndarray:
     return (x.astype(np.float32)) / 32768.0
 
 
-def safe_put_drop_oldest(q: queue.Queue, item):
-    """安全放入队列，队列满时丢弃最老的项"""
+def format_media_time(sec: float) -> str:
+    """将音频内时间（秒）格式化为 HH:MM:SS"""
+    sec = int(max(0.0, sec))
+    return f"{sec // 3600:02d}:{(sec % 3600) // 60:02d}:{sec % 60:02d}"
+
+
+def safe_put_drop_oldest(q: queue.Queue, item, name: Optional[str] = None) -> bool:
+    """
+    安全放入队列，队列满时丢弃最老的项
+
+    Args:
+        q: 目标队列
+        item: 要放入的项
+        name: 队列名，给出时把丢弃计入 classaudio_queue_dropped_items_total{queue=name}
+
+    Returns:
+        是否发生了丢弃
+    """
     try:
         q.put_nowait(item)
+        return False
     except queue.Full:
-        try:
-            q.get_nowait()
-        except queue.Empty:
-            pass
-        try:
-            q.put_nowait(item)
-        except queue.Full:
-            pass
+        pass
+
+    try:
+        q.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        pass
+    if name:
+        QUEUE_DROPS_TOTAL.labels(queue=name).inc()
+    return True
 
 
 def load_silero_vad_local(vad_dir: str):
@@ -180,6 +288,17 @@ def format_subtitle_line(stable_words: List[str], unstable_words: List[str]) ->
     return ""
 
 
+def check_final_text(text: str, no_speech_prob: Optional[float], avg_logprob: Optional[float]) -> Optional[str]:
+    """检查 final 结果是否可输出，返回拒绝原因（None 表示接受）"""
+    if not text or len(text) < MIN_CHARS_TO_PRINT:
+        return f"text too short ({len(text or '')} chars)"
+    if no_speech_prob is not None and no_speech_prob > MAX_NO_SPEECH_PROB:
+        return f"no_speech_prob too high ({no_speech_prob:.3f})"
+    if avg_logprob is not None and avg_logprob < MIN_AVG_LOGPROB:
+        return f"avg_logprob too low ({avg_logprob:.3f})"
+    return None
+
+
 def transcribe_once(
     model: WhisperModel,
     audio: np.ndarray,
@@ -203,8 +322,196 @@ def transcribe_once(
         condition_on_previous_text=condition_on_previous_text,
         initial_prompt=initial_prompt,
     )
+    segments = list(segments)
     text = "".join([s.text for s in segments]).strip()
-    return text, info
+    return text, DecodeInfo.from_segments(segments, info)
+
+
+def transcribe_batch(
+    pipeline,
+    audios: List[np.ndarray],
+    *,
+    language: str,
+    beam_size: int,
+    temperature: float,
+    patience: float,
+    initial_prompt: str,
+    batch_size: int,
+) -> List[Tuple[str, "DecodeInfo"]]:
+    """
+    一次批量推理解码多句音频（faster-whisper BatchedInferencePipeline）
+
+    各句首尾相接拼成一段，用 clip_timestamps 标出每句的范围，每句成为批中的一个样本；
+    输出分段按时间中点归回所属的句子。
+
+    Args:
+        pipeline: BatchedInferencePipeline
+        audios: 每句 float32 音频（单句不超过 30 秒）
+
+    Returns:
+        与 audios 一一对应的 [(text, DecodeInfo), ...]
+    """
+    offsets = [0]
+    for a in audios:
+        offsets.append(offsets[-1] + a.size)
+    audio_cat = np.concatenate(audios).astype(np.float32, copy=False)
+    clips = [{"start": offsets[i] / SR, "end": offsets[i + 1] / SR} for i in range(len(audios))]
+
+    segments, info = pipeline.transcribe(
+        audio_cat,
+        language=language,
+        beam_size=beam_size,
+        temperature=temperature,
+        patience=patience,
+        initial_prompt=initial_prompt,
+        clip_timestamps=clips,
+        vad_filter=False,
+        batch_size=batch_size,
+    )
+
+    per_utt: List[list] = [[] for _ in audios]
+    bounds = [o / SR for o in offsets]
+    for seg in segments:
+        mid = (seg.start + seg.end) / 2
+        i = max(0, min(len(audios) - 1, bisect.bisect_right(bounds, mid) - 1))
+        per_utt[i].append(seg)
+
+    return [
+        ("".join(s.text for s in segs).strip(), DecodeInfo.from_segments(segs, info))
+        for segs in per_utt
+    ]
+
+
+def transcribe_words(
+    model: WhisperModel,
+    audio: np.ndarray,
+    *,
+    language: str,
+    beam_size: int,
+    temperature: float,
+    patience: float,
+    initial_prompt: str,
+    condition_on_previous_text: bool,
+    vad_filter: bool,
+) -> Tuple[List[str], List[float], Any]:
+    """
+    单次转写并返回逐词结束时间
+
+    Returns:
+        (words, word_ends, info)，word_ends 为相对 audio 开头的秒数，与 words 一一对应
+    """
+    segments, info = model.transcribe(
+        audio,
+        language=language,
+        beam_size=beam_size,
+        temperature=temperature,
+        patience=patience,
+        vad_filter=vad_filter,
+        condition_on_previous_text=condition_on_previous_text,
+        initial_prompt=initial_prompt,
+        word_timestamps=True,
+    )
+    words: List[str] = []
+    word_ends: List[float] = []
+    for seg in segments:
+        seg_words = getattr(seg, "words", None)
+        if seg_words:
+            for w in seg_words:
+                pieces = words_split(w.word)
+                words.extend(pieces)
+                word_ends.extend([float(w.end)] * len(pieces))
+        else:
+            # 没有词级时间戳时退化为段结束时间
+            pieces = words_split(seg.text)
+            words.extend(pieces)
+            word_ends.extend([float(seg.end)] * len(pieces))
+    return words, word_ends, info
+
+
+class SpeechSegmenter:
+    """
+    VAD 状态机：根据逐块语音概率把音频流切分为 START / CHUNK / END 事件
+    实时 VAD 线程与离线切分共用同一套阈值逻辑
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.block_ms = int(1000 * BLOCK_SAMPLES / SR)
+        self.pre_cache_blocks = max(1, PADDING_SAMPLES // BLOCK_SAMPLES)
+        self.end_tail_blocks = max(1, int(END_TAIL_MS / self.block_ms))
+        self.logger = logger
+        self.pos = 0  # 已处理的采样数
+        self.reset()
+
+    def reset(self):
+        """重置状态机（保留采样位置）"""
+        self.st = State()
+        self.pre_cache: List[np.ndarray] = []
+        self.tail_silence_kept = 0
+
+    def _log(self, msg: str):
+        if self.logger:
+            self.logger.info(msg)
+
+    def push(self, block_f32: np.ndarray, speech_prob: float) -> List[UTTEvent]:
+        """输入一个音频块及其语音概率，返回产生的事件"""
+        events: List[UTTEvent] = []
+        st = self.st
+        block_pos = self.pos
+        self.pos += block_f32.size
+
+        self.pre_cache.append(block_f32)
+        if len(self.pre_cache) > self.pre_cache_blocks:
+            self.pre_cache.pop(0)
+
+        is_speech = speech_prob >= VAD_THRESHOLD
+
+        if not st.in_speech:
+            if is_speech:
+                st.speech_ms += self.block_ms
+                if st.speech_ms >= MIN_SPEECH_MS:
+                    st.in_speech = True
+                    st.silence_ms = 0
+                    st.utt_ms = 0
+                    self.tail_silence_kept = 0
+
+                    start_audio = np.concatenate(self.pre_cache, axis=0) if self.pre_cache else None
+                    start_pos = self.pos - (start_audio.size if start_audio is not None else 0)
+                    events.append(UTTEvent(kind="START", audio=start_audio, t=time.monotonic(), pos=start_pos))
+                    self._log(f"Speech START detected (speech_ms={st.speech_ms})")
+            else:
+                st.speech_ms = 0
+        else:
+            st.utt_ms += self.block_ms
+
+            if is_speech:
+                st.silence_ms = 0
+                self.tail_silence_kept = 0
+                events.append(UTTEvent(kind="CHUNK", audio=block_f32, t=time.monotonic(), pos=block_pos))
+            else:
+                st.silence_ms += self.block_ms
+                if self.tail_silence_kept < self.end_tail_blocks:
+                    self.tail_silence_kept += 1
+                    events.append(UTTEvent(kind="CHUNK", audio=block_f32, t=time.monotonic(), pos=block_pos))
+
+            end_by_silence = st.silence_ms >= MIN_SILENCE_MS
+            too_long = st.utt_ms >= int(MAX_UTT_S * 1000)
+
+            if end_by_silence or too_long:
+                reason = "silence" if end_by_silence else "too_long"
+                self._log(f"Speech END detected (reason={reason}, utt_ms={st.utt_ms}, silence_ms={st.silence_ms})")
+                events.append(UTTEvent(kind="END", audio=None, t=time.monotonic(), pos=self.pos))
+                self.reset()
+
+        return events
+
+    def flush(self) -> List[UTTEvent]:
+        """音频流结束：若仍在语音中则补发 END"""
+        events: List[UTTEvent] = []
+        if self.st.in_speech:
+            self._log(f"Speech END detected (reason=eof, utt_ms={self.st.utt_ms})")
+            events.append(UTTEvent(kind="END", audio=None, t=time.monotonic(), pos=self.pos))
+        self.reset()
+        return events
 
 
 # ====== 主服务类 ======
@@ -216,13 +523,16 @@ class AudioTranscriptionService:
 
     def __init__(self):
         """初始化服务"""
-        self.vad_model = None
+        self.vad_engine: Optional[VADEngine] = None
         self.partial_model = None
         self.final_model = None
+        self.model_report: Optional[ModelLoadReport] = None
+        self.model_loader: Optional[ModelLoader] = None
 
         # 队列
         self.audio_q = queue.Queue(maxsize=AUDIO_Q_MAX)
         self.evt_q = queue.Queue(maxsize=UTT_Q_MAX)
+        self.final_q = queue.Queue(maxsize=FINAL_Q_MAX)  # 待 final 解码的整句（FinalJob，None 为 EOF，_FINAL_STOP 为停止）
 
         # 输出队列（外部消费）
         self.partial_output_q = queue.Queue(maxsize=100)  # partial 字幕
@@ -232,14 +542,39 @@ class AudioTranscriptionService:
         self.stop_event = threading.Event()
         self.is_running = False
 
+        # 离线文件转写：事件不丢弃、跳过 partial、结果收集到列表
+        self.offline_mode = False
+        self.offline_lock = threading.Lock()
+        self._offline_done = threading.Event()
+        self._offline_captions: List[CaptionOutput] = []
+
         # 线程
         self.vad_thread = None
         self.transcriber_thread = None
+        self.final_thread = None
         self.audio_stream = None
 
+        # final 解码是否在独立线程中进行（False 时在转写线程内同步解码）
+        self.separate_final_worker = FINAL_SEPARATE_WORKER
+        self._final_pipeline = None  # 批量 final 解码管线（懒加载）
+        self._final_pipeline_model = None
+        self.prev_sent_tail = ""
+
+        # partial 解码调度（自适应间隔/窗口）
+        self.partial_scheduler = PartialScheduler()
+
+        # 音频输入流工厂（默认麦克风；基准测试可替换为回放源）
+        self.input_stream_factory: Callable[..., Any] = sd.InputStream
+
+        # accurate 字幕落盘（后台写线程，每次录音一个会话文件）
+        self.caption_writer = CaptionWriter()
+        self.capture_session: Optional[str] = None
+
         # 回调
         self.partial_callback: Optional[Callable[[CaptionOutput], None]] = None
         self.accurate_callback: Optional[Callable[[CaptionOutput], None]] = None
+        # False 时字幕只经回调输出，不再写入 partial_output_q / accurate_output_q（API 服务由 CaptionHub 广播）
+        self.output_queues_enabled = True
 
         # 日志
         self.logger = setup_logger('AudioService', 'logs/audio_service.log')
@@ -249,29 +584,83 @@ class AudioTranscriptionService:
         # 动态专业词汇提示词
         self.dynamic_prof_words: Optional[str] = None
 
-    def initialize(self):
-        """初始化模型（耗时操作，建议在启动时调用）"""
-        print("Loading VAD model...")
-        self.vad_model = load_silero_vad_local(VAD_DIR)
-        try:
-            self.vad_model.eval()
-        except Exception:
-            pass
-
-        print("Loading Whisper Partial model...")
-        self.partial_model = WhisperModel(
-            MODEL_DIR_PARTIAL,
-            device=DEVICE,
-            compute_type=COMPUTE_TYPE_PARTIAL,
-        )
+        # 队列长度指标（导出时读取，evt_q 被替换后仍然有效）
+        QUEUE_SIZE.labels(queue="audio").set_function(lambda: self.audio_q.qsize())
+        QUEUE_SIZE.labels(queue="event").set_function(lambda: self.evt_q.qsize())
+        QUEUE_SIZE.labels(queue="final").set_function(lambda: self.final_q.qsize())
+        QUEUE_SIZE.labels(queue="partial_output").set_function(lambda: self.partial_output_q.qsize())
+        QUEUE_SIZE.labels(queue="accurate_output").set_function(lambda: self.accurate_output_q.qsize())
+
+    def initialize(self, background: bool = False):
+        """
+        加载并预热模型（VAD / partial / final 并行加载）
+
+        Args:
+            background: True 时在后台线程加载并立即返回，用 wait_models_ready() 等待；
+                        False 时阻塞到加载结束，任一模型失败则抛出 RuntimeError
+        """
+        if self.model_loader is None:
+            self.model_loader = ModelLoader(on_ready=self._on_model_ready)
+            self.model_report = self.model_loader.report
+
+        if background:
+            self.model_loader.start()
+            return
 
-        print("Loading Whisper Final model...")
-        self.final_model = WhisperModel(
-            MODEL_DIR_FINAL,
-            device=DEVICE,
-            compute_type=COMPUTE_TYPE_FINAL,
+        self.model_loader.start().join()
+        errors = self.model_loader.errors()
+        if errors:
+            raise RuntimeError(f"Failed to load models: {errors}")
+
+        print(
+            f"All models loaded successfully! (mode={self.model_report.mode}, "
+            f"wall={self.model_report.wall_sec:.1f}s, rss={self.model_report.rss_mb} MB)"
         )
-        print("All models loaded successfully!")
+        if self.model_report.saved_mb:
+            print(f"Single-model mode: ~{self.model_report.saved_mb:.0f} MB saved")
+
+    def _on_model_ready(self, name: str, obj: Any):
+        """模型加载并预热完成（在加载线程中调用）"""
+        if name == "vad":
+            self.vad_engine = obj
+        elif name == "partial":
+            self.partial_model = obj
+        elif name == "final":
+            self.final_model = obj
+            self._get_final_pipeline()  # 提前构建批量解码管线
+
+    def wait_models_ready(self, names: Tuple[str, ...] = MODEL_NAMES, timeout: Optional[float] = None) -> bool:
+        """
+        等待指定模型就绪
+
+        Returns:
+            全部就绪为 True；超时或有模型加载失败时为 False
+        """
+        if self.model_loader is None:
+            # 未经 initialize() 直接注入模型（基准测试）
+            return all(self._model_ref(n) is not None for n in names)
+        return self.model_loader.wait(names, timeout)
+
+    def model_status(self) -> Dict[str, Dict[str, Any]]:
+        """各模型加载状态：pending / loading / warming / ready / failed"""
+        if self.model_loader is None:
+            return {n: {"state": "ready" if self._model_ref(n) is not None else "pending"} for n in MODEL_NAMES}
+        return self.model_loader.snapshot()
+
+    def status_snapshot(self) -> Dict[str, Any]:
+        """服务状态（用于 /api/status）"""
+        return {
+            "is_running": self.is_running,
+            "partial_queue_size": self.partial_output_q.qsize(),
+            "accurate_queue_size": self.accurate_output_q.qsize(),
+            "event_queue_size": self.evt_q.qsize(),
+            "partial_scheduler": self.partial_scheduler.snapshot(),
+            "model_status": self.model_status(),
+            "models": self.model_report.to_dict() if self.model_report else {},
+        }
+
+    def _model_ref(self, name: str):
+        return {"vad": self.vad_engine, "partial": self.partial_model, "final": self.final_model}[name]
 
     def set_partial_callback(self, callback: Callable[[CaptionOutput], None]):
         """设置 partial 字幕回调"""
@@ -293,38 +682,30 @@ class AudioTranscriptionService:
             print("Service is already running!")
             return
 
-        if self.vad_model is None or self.partial_model is None or self.final_model is None:
+        if self.offline_mode:
+            raise ServiceBusyError("File transcription in progress, try again later.")
+
+        if self.vad_engine is None or self.partial_model is None or self.final_model is None:
             raise RuntimeError("Models not initialized. Call initialize() first.")
 
         self.logger.info("Starting audio capture service...")
 
         self.stop_event.clear()
         self.is_running = True
+        self.capture_session = time.strftime("%Y%m%d_%H%M%S")
 
-        # 启动 VAD 线程
-        self.vad_thread = threading.Thread(
-            target=self._vad_segmenter,
-            daemon=True
-        )
-        self.vad_thread.start()
-        self.logger.info("VAD thread started")
-
-        # 启动转写线程
-        self.transcriber_thread = threading.Thread(
-            target=self._transcriber,
-            daemon=True
-        )
-        self.transcriber_thread.start()
-        self.logger.info("Transcriber thread started")
+        self._start_worker_threads()
 
         # 启动音频流
         def audio_callback(indata, frames, time_info, status):
+            if status and getattr(status, "input_overflow", False):
+                INPUT_OVERFLOWS_TOTAL.inc()
             if frames <= 0:
                 return
             block = indata[:, 0].copy()
-            safe_put_drop_oldest(self.audio_q, block)
+            safe_put_drop_oldest(self.audio_q, block, name="audio")
 
-        self.audio_stream = sd.InputStream(
+        self.audio_stream = self.input_stream_factory(
             samplerate=SR,
             channels=CHANNELS,
             dtype="int16",
@@ -351,11 +732,182 @@ class AudioTranscriptionService:
             self.audio_stream = None
             self.logger.info("Audio stream stopped")
 
-        time.sleep(0.3)
+        # 等 final 线程解码完已切分的句子，返回时所有 accurate 字幕都已经回调输出
+        self._join_worker_threads()
         self.is_running = False
+        self.caption_writer.end_session(self.capture_session)
         self.logger.info("Audio capture service stopped")
         print("Audio capture stopped!")
 
+    def _start_worker_threads(self):
+        """启动 VAD 和转写线程"""
+        # 新的音频流，清空 VAD 循环状态
+        self.vad_engine.reset()
+
+        # 启动 VAD 线程
+        self.vad_thread = threading.Thread(
+            target=self._vad_segmenter,
+            daemon=True
+        )
+        self.vad_thread.start()
+        self.logger.info("VAD thread started")
+
+        # 启动 final 解码线程（先于转写线程，转写线程放入句子时它已在运行）
+        if self.separate_final_worker:
+            dropped = self._clear_queue(self.final_q)
+            if dropped:
+                self.logger.warning(f"Discarded {dropped} items left in final queue by the previous run")
+            self.final_thread = threading.Thread(
+                target=self._final_decoder,
+                daemon=True
+            )
+            self.final_thread.start()
+            self.logger.info("Final decoder thread started")
+
+        # 启动转写线程
+        self.transcriber_thread = threading.Thread(
+            target=self._transcriber,
+            daemon=True
+        )
+        self.transcriber_thread.start()
+        self.logger.info("Transcriber thread started")
+
+    def _join_worker_threads(self):
+        """
+        等待工作线程退出（调用前已设置 stop_event）
+
+        VAD / 转写线程随 stop_event 退出。转写线程退出时才放入 _FINAL_STOP（排在它放入的所有句子之后，
+        正在进行的 partial 解码结束后放入的句子也不会落在停止标记后面）；final 线程解码完停止标记之前的
+        句子后退出（最多等待 FINAL_DRAIN_TIMEOUT_SEC）。
+        """
+        for t in (self.vad_thread, self.transcriber_thread):
+            if t is not None:
+                t.join(timeout=2.0)
+
+        if self.final_thread is None:
+            return
+        if self.transcriber_thread is not None and self.transcriber_thread.is_alive():
+            self.logger.info("Transcriber still finishing a decode, final decoder waits for its stop marker")
+        pending = self.final_q.qsize()
+        if pending:
+            self.logger.info(f"Draining {pending} utterances waiting for final decode")
+        self.final_thread.join(timeout=FINAL_DRAIN_TIMEOUT_SEC)
+        if self.final_thread.is_alive():
+            self.logger.warning(
+                f"Final decoder still busy after {FINAL_DRAIN_TIMEOUT_SEC}s, {self.final_q.qsize()} items left in queue"
+            )
+
+    def _put_final(self, item) -> bool:
+        """放入 final_q：final 线程存活期间阻塞等待（停止录音时已切分的句子也不丢弃）"""
+        while self.final_thread is not None and self.final_thread.is_alive():
+            try:
+                self.final_q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        self.transcriber_logger.warning("Final decoder not running, utterance dropped")
+        return False
+
+    def _put_event(self, evt: UTTEvent):
+        """放入语音事件：实时模式丢弃最老的项，离线模式阻塞等待（不丢数据）"""
+        if not self.offline_mode:
+            safe_put_drop_oldest(self.evt_q, evt, name="event")
+            return
+        self._put_blocking(self.evt_q, evt)
+
+    def _put_blocking(self, q: queue.Queue, item) -> bool:
+        """阻塞放入队列，stop_event 置位时放弃；返回是否放入成功"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _clear_queue(q: queue.Queue) -> int:
+        """清空队列，返回丢弃的项数"""
+        dropped = 0
+        while True:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                return dropped
+
+    def _end_pending(self) -> bool:
+        """evt_q 中是否已有等待处理的 END 事件（此时 partial 结果会被 final 立即覆盖）"""
+        with self.evt_q.mutex:
+            return any(getattr(e, "kind", None) == "END" for e in self.evt_q.queue)
+
+    def transcribe_file(self, path: str, raw_sample_rate: Optional[int] = None) -> FileTranscriptionResult:
+        """
+        离线转写音频文件（阻塞）
+
+        复用 VAD 分段和 final 解码逻辑，以 CPU 允许的最快速度喂入音频，跳过 partial 解码。
+        与实时捕获互斥。
+
+        Args:
+            path: 音频文件路径（WAV / FLAC / MP3 等，或原始 16-bit PCM）
+            raw_sample_rate: 原始 PCM 的采样率
+
+        Returns:
+            FileTranscriptionResult
+        """
+        if self.vad_engine is None or self.final_model is None:
+            raise RuntimeError("Models not initialized. Call initialize() first.")
+
+        audio = read_audio_file(path, raw_sample_rate=raw_sample_rate)
+        audio_sec = audio.size / SR
+
+        if not self.offline_lock.acquire(blocking=False):
+            raise ServiceBusyError("Another file transcription is in progress.")
+        try:
+            if self.is_running:
+                raise ServiceBusyError("Live capture is running. Stop it before transcribing a file.")
+
+            self.logger.info(f"Offline transcription: {path} ({audio_sec:.1f}s)")
+            t0 = time.perf_counter()
+
+            self.offline_mode = True
+            self._offline_captions = []
+            self._offline_done.clear()
+            self._clear_queue(self.audio_q)
+            self._clear_queue(self.evt_q)
+            self.stop_event.clear()
+            self._start_worker_threads()
+
+            try:
+                # 阻塞式喂入，VAD/转写跟不上时在这里形成背压
+                for block in iter_blocks(audio):
+                    if not self._put_blocking(self.audio_q, block):
+                        break
+                self._put_blocking(self.audio_q, None)  # 结束标记
+
+                while not self._offline_done.wait(timeout=0.5):
+                    if self.stop_event.is_set() or not self.transcriber_thread.is_alive():
+                        break
+            finally:
+                self.stop_event.set()
+                self._join_worker_threads()
+                self.offline_mode = False
+
+            elapsed = time.perf_counter() - t0
+            result = FileTranscriptionResult(
+                path=path,
+                captions=list(self._offline_captions),
+                audio_sec=audio_sec,
+                elapsed_sec=elapsed,
+            )
+            self.logger.info(
+                f"Offline transcription done: {len(result.captions)} captions, "
+                f"elapsed={elapsed:.1f}s, RTF={result.rtf:.3f}"
+            )
+            return result
+        finally:
+            self.offline_lock.release()
+
     def get_partial_caption(self, block=True, timeout=None):
         """获取 partial 字幕（从队列）"""
         return self.partial_output_q.get(block=block, timeout=timeout)
@@ -364,75 +916,251 @@ class AudioTranscriptionService:
         """获取 accurate 字幕（从队列）"""
         return self.accurate_output_q.get(block=block, timeout=timeout)
 
-    def _vad_segmenter(self):
-        """VAD 分段器（在后台线程运行）"""
-        import torch
+    def _drain_audio_blocks(self, timeout: float = 0.1) -> List[np.ndarray]:
+        """从 audio_q 批量取出已排队的音频块（至少等待一个）"""
+        try:
+            batch = [self.audio_q.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < VAD_BATCH_MAX and batch[-1] is not None:
+            try:
+                batch.append(self.audio_q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _emit_accurate(self, caption: CaptionOutput):
+        """输出 accurate 字幕：实时模式推送队列/回调并交给写线程落盘，离线模式只收集结果"""
+        if self.offline_mode:
+            self._offline_captions.append(caption)
+            return
 
-        block_ms = int(1000 * BLOCK_SAMPLES / SR)
-        pre_cache_blocks = max(1, PADDING_SAMPLES // BLOCK_SAMPLES)
-        end_tail_blocks = max(1, int(END_TAIL_MS / block_ms))
+        CAPTIONS_TOTAL.labels(type="accurate").inc()
+        if self.output_queues_enabled:
+            safe_put_drop_oldest(self.accurate_output_q, caption, name="accurate_output")
 
-        st = State()
-        pre_cache: List[np.ndarray] = []
-        tail_silence_kept = 0
+        # 调用回调
+        if self.accurate_callback:
+            try:
+                self.accurate_callback(caption)
+            except Exception as e:
+                print(f"Accurate callback error: {e}")
 
-        while not self.stop_event.is_set():
+        # 保存到会话文件（只入队，不在解码线程上等磁盘）；没有录音会话时（回放 / 基准测试直接驱动线程）不写
+        if self.capture_session is None:
+            return
+        self.caption_writer.write(self.capture_session, {
+            "time": time.time(),
+            "timestamp": caption.timestamp,
+            "text": caption.text,
+            "caption_id": caption.caption_id,
+            "audio_start": caption.audio_start,
+            "audio_end": caption.audio_end,
+            "no_speech_prob": caption.no_speech_prob,
+            "avg_logprob": caption.avg_logprob,
+            "timings": caption.timings,
+        })
+
+    def _final_prompt(self) -> str:
+        # 使用动态生成的 prof_words，如果没有则使用默认的
+        return self.dynamic_prof_words if self.dynamic_prof_words else DEFAULT_PROF_WORDS
+
+    def _decode_final(self, job: FinalJob):
+        """final 解码一句并输出 accurate 字幕"""
+        self.transcriber_logger.debug("Starting final decode...")
+
+        DECODE_AUDIO_SECONDS.labels(stage="final").observe(job.audio.size / SR)
+        t0 = time.monotonic()
+        with DECODE_SECONDS.labels(stage="final").time():
+            text, info = transcribe_once(
+                self.final_model,
+                job.audio,
+                language=LANGUAGE,
+                beam_size=BEAM_SIZE,
+                temperature=TEMPERATURE,
+                patience=PATIENCE,
+                initial_prompt=self._final_prompt(),
+                condition_on_previous_text=True,
+                vad_filter=True,
+            )
+        self._emit_final(job, text, info, {"queue": t0 - job.t, "decode": time.monotonic() - t0})
+
+    def _decode_final_batch(self, jobs: List[FinalJob]):
+        """积压时一次批量推理解码多句，按原顺序输出"""
+        self.transcriber_logger.info(f"Batched final decode: {len(jobs)} utterances")
+
+        for job in jobs:
+            DECODE_AUDIO_SECONDS.labels(stage="final").observe(job.audio.size / SR)
+        FINAL_BATCH_SIZE.observe(len(jobs))
+        t0 = time.monotonic()
+        with DECODE_SECONDS.labels(stage="final_batch").time():
+            results = transcribe_batch(
+                self._get_final_pipeline(),
+                [job.audio for job in jobs],
+                language=LANGUAGE,
+                beam_size=BEAM_SIZE,
+                temperature=TEMPERATURE,
+                patience=PATIENCE,
+                initial_prompt=self._final_prompt(),
+                batch_size=FINAL_BATCH_MAX,
+            )
+        decode_sec = time.monotonic() - t0
+        for job, (text, info) in zip(jobs, results):
+            self._emit_final(job, text, info, {"queue": t0 - job.t, "decode": decode_sec, "batch": len(jobs)})
+
+    def _emit_final(self, job: FinalJob, text: str, info: Any, timings: Optional[Dict[str, float]] = None):
+        """过滤 final 结果并输出 accurate 字幕"""
+        no_speech_prob = getattr(info, "no_speech_prob", None)
+        avg_logprob = getattr(info, "avg_logprob", None)
+
+        text = (text or "").strip()
+
+        no_speech_str = f"{no_speech_prob:.3f}" if no_speech_prob is not None else "N/A"
+        logprob_str = f"{avg_logprob:.3f}" if avg_logprob is not None else "N/A"
+        self.transcriber_logger.info(f"Final text: '{text}' (no_speech={no_speech_str}, logprob={logprob_str})")
+
+        reject_reason = check_final_text(text, no_speech_prob, avg_logprob)
+        if reject_reason is not None:
+            FINAL_REJECTED_TOTAL.inc()
+            self.transcriber_logger.debug(f"Rejected: {reject_reason}")
+            return
+
+        self.transcriber_logger.info(f"Accepted final text: {text}")
+        audio_start = job.start_pos / SR
+        now = format_media_time(audio_start) if self.offline_mode else time.strftime("%H:%M:%S")
+
+        caption = CaptionOutput(
+            type="accurate",
+            text=text,
+            timestamp=now,
+            no_speech_prob=no_speech_prob,
+            avg_logprob=avg_logprob,
+            audio_start=audio_start,
+            audio_end=job.end_pos / SR,
+            emit_t=time.monotonic(),
+            caption_id=job.start_pos,
+            timings=timings,
+        )
+        self._emit_accurate(caption)
+
+        self.prev_sent_tail = (self.prev_sent_tail + " " + text).strip()[-PREV_SENT_TAIL_CHARS:]
+
+    def _get_final_pipeline(self):
+        """
+        final 模型的批量推理管线（懒加载）
+
+        Returns:
+            BatchedInferencePipeline；未启用、模型不是 WhisperModel 或 faster-whisper 版本过旧时为 None
+        """
+        if not FINAL_BATCHED or not isinstance(self.final_model, WhisperModel):
+            return None
+        if self._final_pipeline is None or self._final_pipeline_model is not self.final_model:
             try:
-                try:
-                    block_i16 = self.audio_q.get(timeout=0.1)
-                except queue.Empty:
+                from faster_whisper import BatchedInferencePipeline
+            except ImportError:
+                self.transcriber_logger.warning("BatchedInferencePipeline unavailable, batched final decode disabled")
+                return None
+            self._final_pipeline = BatchedInferencePipeline(model=self.final_model)
+            self._final_pipeline_model = self.final_model
+        return self._final_pipeline
+
+    def _take_final_backlog(self, first: FinalJob) -> Tuple[List[FinalJob], bool]:
+        """
+        final_q 积压时取出后续等待的句子组成一批
+
+        Returns:
+            (jobs, eof)：eof 表示批后紧跟着 EOF 标记
+        """
+        jobs = [first]
+        if self.final_q.qsize() + 1 < FINAL_BATCH_MIN_BACKLOG or self._get_final_pipeline() is None:
+            return jobs, False
+        # 超长句留给单句解码（批量管线每个样本只解码前 30 秒）
+        if first.audio.size / SR > FINAL_BATCH_MAX_CLIP_SEC:
+            return jobs, False
+
+        # 本线程是 final_q 唯一的消费者，先看队首再取出是安全的
+        while len(jobs) < FINAL_BATCH_MAX:
+            with self.final_q.mutex:
+                if not self.final_q.queue:
+                    break
+                head = self.final_q.queue[0]
+            if head is _FINAL_STOP or (head is not None and head.audio.size / SR > FINAL_BATCH_MAX_CLIP_SEC):
+                break
+            nxt = self.final_q.get_nowait()
+            if nxt is None:
+                return jobs, True
+            jobs.append(nxt)
+        return jobs, False
+
+    def _final_decoder(self):
+        """
+        final 解码器（在后台线程运行）：按入队顺序解码（积压时批量），保证 accurate 字幕有序
+
+        不看 stop_event：转写线程退出时放入 _FINAL_STOP，排在它之前的句子都解码完才退出。
+        """
+        while True:
+            try:
+                job: Optional[FinalJob] = self.final_q.get()
+                if job is _FINAL_STOP:
+                    self.transcriber_logger.info("Final queue drained, final decoder exiting")
+                    return
+
+                if job is None:
+                    self.transcriber_logger.info("Received EOF, offline transcription finished")
+                    self._offline_done.set()
                     continue
 
-                block_f32 = int16_to_float32(block_i16)
+                jobs, eof = self._take_final_backlog(job)
+                now_t = time.monotonic()
+                for j in jobs:
+                    FINAL_QUEUE_WAIT_SECONDS.observe(now_t - j.t)
 
-                pre_cache.append(block_f32)
-                if len(pre_cache) > pre_cache_blocks:
-                    pre_cache.pop(0)
+                if len(jobs) > 1:
+                    self._decode_final_batch(jobs)
+                else:
+                    self._decode_final(job)
 
-                x = torch.from_numpy(block_f32)
-                with torch.no_grad():
-                    prob = self.vad_model(x, SR)
-                    speech_prob = float(prob.item()) if hasattr(prob, "item") else float(prob)
+                if eof:
+                    self.transcriber_logger.info("Received EOF, offline transcription finished")
+                    self._offline_done.set()
 
-                is_speech = speech_prob >= VAD_THRESHOLD
+            except Exception as e:
+                # 捕获所有异常，防止线程崩溃
+                self.transcriber_logger.error(f"Final decoder error: {e}", exc_info=True)
+                print(f"ERROR in final decoder: {e}")
+                import traceback
+                traceback.print_exc()
+                continue
 
-                if not st.in_speech:
-                    if is_speech:
-                        st.speech_ms += block_ms
-                        if st.speech_ms >= MIN_SPEECH_MS:
-                            st.in_speech = True
-                            st.silence_ms = 0
-                            st.utt_ms = 0
-                            tail_silence_kept = 0
+    def _vad_segmenter(self):
+        """VAD 分段器（在后台线程运行）"""
+        segmenter = SpeechSegmenter(logger=self.vad_logger)
 
-                            start_audio = np.concatenate(pre_cache, axis=0) if pre_cache else None
-                            safe_put_drop_oldest(self.evt_q, UTTEvent(kind="START", audio=start_audio, t=time.monotonic()))
-                            self.vad_logger.info(f"Speech START detected (speech_ms={st.speech_ms})")
-                    else:
-                        st.speech_ms = 0
-                else:
-                    st.utt_ms += block_ms
+        while not self.stop_event.is_set():
+            try:
+                batch = self._drain_audio_blocks()
+                if not batch:
+                    continue
 
-                    if is_speech:
-                        st.silence_ms = 0
-                        tail_silence_kept = 0
-                        safe_put_drop_oldest(self.evt_q, UTTEvent(kind="CHUNK", audio=block_f32, t=time.monotonic()))
-                    else:
-                        st.silence_ms += block_ms
-                        if tail_silence_kept < end_tail_blocks:
-                            tail_silence_kept += 1
-                            safe_put_drop_oldest(self.evt_q, UTTEvent(kind="CHUNK", audio=block_f32, t=time.monotonic()))
-
-                    end_by_silence = st.silence_ms >= MIN_SILENCE_MS
-                    too_long = st.utt_ms >= int(MAX_UTT_S * 1000)
-
-                    if end_by_silence or too_long:
-                        reason = "silence" if end_by_silence else "too_long"
-                        self.vad_logger.info(f"Speech END detected (reason={reason}, utt_ms={st.utt_ms}, silence_ms={st.silence_ms})")
-                        safe_put_drop_oldest(self.evt_q, UTTEvent(kind="END", audio=None, t=time.monotonic()))
-                        st = State()
-                        pre_cache = []
-                        tail_silence_kept = 0
+                # None 为离线文件的结束标记
+                eof = batch[-1] is None
+                if eof:
+                    batch = batch[:-1]
+
+                # 一次转换、一次推理调用，覆盖所有排队的块
+                if batch:
+                    blocks_f32 = int16_to_float32(np.stack(batch, axis=0))
+                    VAD_BATCH_BLOCKS.observe(len(batch))
+                    with VAD_INFERENCE_SECONDS.time():
+                        speech_probs = self.vad_engine.score(blocks_f32)
+                    for block_f32, speech_prob in zip(blocks_f32, speech_probs):
+                        for evt in segmenter.push(block_f32, speech_prob):
+                            self._put_event(evt)
+
+                if eof:
+                    for evt in segmenter.flush():
+                        self._put_event(evt)
+                    self._put_event(UTTEvent(kind="EOF", audio=None, t=time.monotonic(), pos=segmenter.pos))
 
             except Exception as e:
                 # 捕获所有异常，防止线程崩溃
@@ -441,39 +1169,60 @@ class AudioTranscriptionService:
                 import traceback
                 traceback.print_exc()
                 # 重置状态，继续运行
-                st = State()
-                pre_cache = []
-                tail_silence_kept = 0
+                segmenter.reset()
                 continue
 
     def _transcriber(self):
-        """转写器（在后台线程运行）"""
-        prev_sent_tail = ""
-        blocks: List[np.ndarray] = []
+        """转写器（在后台线程运行）；退出时向 final_q 放入 _FINAL_STOP，排在自己放入的所有句子之后"""
+        try:
+            self._transcriber_loop()
+        finally:
+            if self.separate_final_worker:
+                self._put_final(_FINAL_STOP)
+
+    def _transcriber_loop(self):
+        """转写主循环：VAD 事件 -> partial 解码；句子结束时交给 final"""
+        utt_buf = UtteranceBuffer(UTT_BUFFER_SAMPLES, dtype=UTT_BUFFER_DTYPE)
+        partial_min_samples = int(PARTIAL_MIN_SEC * SR)
+        partial_overlap_samples = int(PARTIAL_OVERLAP_SEC * SR)
         committed_words: List[str] = []
+        committed_ends: List[int] = []  # 已提交词的结束位置（句内绝对采样数，含缓冲区已丢弃部分）
         committed_len = 0
         recent_hyps: Deque[List[str]] = deque(maxlen=STABLE_HYPS)
-        last_partial_t = 0.0
+        utt_start_pos = 0
+        scheduler = self.partial_scheduler
 
         def reset_sentence():
-            nonlocal blocks, committed_words, committed_len, recent_hyps, last_partial_t
-            blocks = []
+            nonlocal committed_words, committed_ends, committed_len, recent_hyps
+            utt_buf.clear()
             committed_words = []
+            committed_ends = []
             committed_len = 0
             recent_hyps = deque(maxlen=STABLE_HYPS)
-            last_partial_t = 0.0
-
-        def build_partial_audio_tail() -> np.ndarray:
-            if not blocks:
-                return np.zeros((0,), dtype=np.float32)
-            tail_blocks = int(PARTIAL_TAIL_SEC * SR / BLOCK_SAMPLES)
-            tail = blocks[-tail_blocks:] if tail_blocks > 0 else blocks
-            return np.concatenate(tail, axis=0) if tail else np.zeros((0,), dtype=np.float32)
+            scheduler.reset_sentence()
+
+        def build_partial_audio_tail(tail_sec: float) -> Tuple[np.ndarray, int]:
+            """
+            partial 解码窗口（至少 PARTIAL_MIN_SEC）
+
+            增量模式下从已提交前缀结束处回退 overlap 开始，总是覆盖全部未提交部分，
+            否则 merge_with_overlap 拼接的尾部与已提交的词对不上；
+            尚无已提交前缀时取最后 tail_sec（由调度器给出，不超过 PARTIAL_TAIL_SEC）
+
+            Returns:
+                (音频, 窗口起点的句内绝对采样数)
+            """
+            n = len(utt_buf)
+            if PARTIAL_INCREMENTAL and committed_ends:
+                committed_end = committed_ends[-1] - utt_buf.dropped_samples
+                n_window = min(n, max(n - committed_end + partial_overlap_samples, partial_min_samples))
+            else:
+                n_window = min(n, max(int(tail_sec * SR), partial_min_samples))
+            # 零拷贝视图（int16 存储时写入预分配暂存区）
+            return utt_buf.tail(n_window), utt_buf.dropped_samples + n - n_window
 
         def build_full_audio() -> np.ndarray:
-            if not blocks:
-                return np.zeros((0,), dtype=np.float32)
-            return np.concatenate(blocks, axis=0)
+            return utt_buf.full()
 
         def build_partial_prompt(committed_words_local: List[str]) -> str:
             # 使用动态生成的 prof_words，如果没有则使用默认的
@@ -483,24 +1232,22 @@ class AudioTranscriptionService:
                 return (prof_words + "\n\nCommitted (tail):\n" + committed_tail).strip()
             return prof_words
 
-        def should_do_partial(now_t: float) -> bool:
-            nonlocal last_partial_t
-            if last_partial_t == 0.0:
-                return True
-            return (now_t - last_partial_t) * 1000.0 >= PARTIAL_UPDATE_MS
-
         def do_partial_decode():
-            nonlocal committed_words, committed_len, recent_hyps, last_partial_t
+            nonlocal committed_words, committed_ends, committed_len, recent_hyps
+
+            # 离线文件转写只需要 final 结果
+            if self.offline_mode:
+                return
 
-            full_dur_sec = (len(blocks) * BLOCK_SAMPLES) / SR
+            full_dur_sec = len(utt_buf) / SR
             if full_dur_sec < PARTIAL_MIN_SEC:
                 return
 
-            t_check = time.monotonic()
-            if not should_do_partial(t_check):
+            decision = scheduler.decide(time.monotonic(), self.evt_q.qsize(), self._end_pending)
+            if not decision.run:
                 return
 
-            audio_tail = build_partial_audio_tail()
+            audio_tail, window_start = build_partial_audio_tail(decision.tail_sec)
             if audio_tail.size <= 0:
                 return
 
@@ -508,29 +1255,38 @@ class AudioTranscriptionService:
 
             self.transcriber_logger.debug(f"Partial decode: audio_tail size={audio_tail.size}, dur={audio_tail.size/SR:.2f}s")
 
-            text, _info = transcribe_once(
-                self.partial_model,
-                audio_tail,
-                language=LANGUAGE,
-                beam_size=PARTIAL_BEAM_SIZE,
-                temperature=TEMPERATURE,
-                patience=PARTIAL_PATIENCE,
-                initial_prompt=prompt,
-                condition_on_previous_text=False,
-                vad_filter=True,
-            )
+            DECODE_AUDIO_SECONDS.labels(stage="partial").observe(audio_tail.size / SR)
+            t_decode = time.monotonic()
+            with DECODE_SECONDS.labels(stage="partial").time():
+                tail_words, tail_ends, _info = transcribe_words(
+                    self.partial_model,
+                    audio_tail,
+                    language=LANGUAGE,
+                    beam_size=PARTIAL_BEAM_SIZE,
+                    temperature=TEMPERATURE,
+                    patience=PARTIAL_PATIENCE,
+                    initial_prompt=prompt,
+                    condition_on_previous_text=False,
+                    vad_filter=True,
+                )
 
-            last_partial_t = time.monotonic()
+            t_done = time.monotonic()
+            scheduler.record(t_done - t_decode, audio_tail.size / SR, t_done)
 
-            if not text:
+            if not tail_words:
                 self.transcriber_logger.debug("Partial decode returned empty text")
                 return
 
-            self.transcriber_logger.debug(f"Partial text: {text[:50]}...")
+            self.transcriber_logger.debug(f"Partial text: {' '.join(tail_words)[:50]}...")
 
-            tail_words = words_split(text)
             hyp_words = merge_with_overlap(committed_words[:committed_len], tail_words)
 
+            # merge_with_overlap 返回 committed + tail[k:]，新增部分对应 tail 的末尾若干词
+            n_new = len(hyp_words) - committed_len
+            hyp_ends = committed_ends[:committed_len]
+            if n_new > 0:
+                hyp_ends = hyp_ends + [window_start + int(t * SR) for t in tail_ends[-n_new:]]
+
             recent_hyps.append(hyp_words)
             if len(recent_hyps) >= 2:
                 lcp = lcp_wordlist(list(recent_hyps))
@@ -542,6 +1298,11 @@ class AudioTranscriptionService:
 
             committed_len = new_committed_len
             committed_words = hyp_words[:committed_len]
+            # 结束位置单调不减，避免时间戳抖动让窗口回退
+            committed_ends = hyp_ends[:committed_len]
+            for i in range(1, committed_len):
+                if committed_ends[i] < committed_ends[i - 1]:
+                    committed_ends[i] = committed_ends[i - 1]
 
             unstable_words = hyp_words[committed_len:]
 
@@ -551,9 +1312,15 @@ class AudioTranscriptionService:
                 caption = CaptionOutput(
                     type="partial",
                     text=line,
-                    timestamp=time.strftime("%H:%M:%S")
+                    timestamp=time.strftime("%H:%M:%S"),
+                    emit_t=time.monotonic(),
+                    caption_id=utt_start_pos,
+                    words=hyp_words,
+                    stable_words=committed_len,
                 )
-                safe_put_drop_oldest(self.partial_output_q, caption)
+                CAPTIONS_TOTAL.labels(type="partial").inc()
+                if self.output_queues_enabled:
+                    safe_put_drop_oldest(self.partial_output_q, caption, name="partial_output")
 
                 # 调用回调
                 if self.partial_callback:
@@ -562,85 +1329,24 @@ class AudioTranscriptionService:
                     except Exception as e:
                         print(f"Partial callback error: {e}")
 
-        def finalize_sentence():
-            nonlocal prev_sent_tail
-
-            audio_full = build_full_audio()
-            dur_sec = audio_full.size / SR
+        def finalize_sentence(end_pos: int):
+            dur_sec = len(utt_buf) / SR
 
-            self.transcriber_logger.info(f"Finalizing: audio dur={dur_sec:.2f}s, blocks={len(blocks)}")
+            self.transcriber_logger.info(f"Finalizing: audio dur={dur_sec:.2f}s, samples={len(utt_buf)}")
+            if utt_buf.dropped_samples:
+                self.transcriber_logger.warning(f"Utterance buffer overflow, dropped {utt_buf.dropped_samples} oldest samples")
 
             if dur_sec < 0.6:
                 self.transcriber_logger.info("Audio too short (<0.6s), skipping")
                 reset_sentence()
                 return
 
-            # 使用动态生成的 prof_words，如果没有则使用默认的
-            prompt = self.dynamic_prof_words if self.dynamic_prof_words else DEFAULT_PROF_WORDS
-
-            self.transcriber_logger.debug("Starting final decode...")
-
-            text, info = transcribe_once(
-                self.final_model,
-                audio_full,
-                language=LANGUAGE,
-                beam_size=BEAM_SIZE,
-                temperature=TEMPERATURE,
-                patience=PATIENCE,
-                initial_prompt=prompt,
-                condition_on_previous_text=True,
-                vad_filter=True,
-            )
-
-            no_speech_prob = getattr(info, "no_speech_prob", None)
-            avg_logprob = getattr(info, "avg_logprob", None)
-
-            text = (text or "").strip()
-
-            no_speech_str = f"{no_speech_prob:.3f}" if no_speech_prob is not None else "N/A"
-            logprob_str = f"{avg_logprob:.3f}" if avg_logprob is not None else "N/A"
-            self.transcriber_logger.info(f"Final text: '{text}' (no_speech={no_speech_str}, logprob={logprob_str})")
-
-            ok = True
-            if not text or len(text) < MIN_CHARS_TO_PRINT:
-                ok = False
-                self.transcriber_logger.debug(f"Rejected: text too short ({len(text)} chars)")
-            if no_speech_prob is not None and no_speech_prob > MAX_NO_SPEECH_PROB:
-                ok = False
-                self.transcriber_logger.debug(f"Rejected: no_speech_prob too high ({no_speech_prob:.3f})")
-            if avg_logprob is not None and avg_logprob < MIN_AVG_LOGPROB:
-                ok = False
-                self.transcriber_logger.debug(f"Rejected: avg_logprob too low ({avg_logprob:.3f})")
-
-            if ok:
-                self.transcriber_logger.info(f"Accepted final text: {text}")
-                now = time.strftime("%H:%M:%S")
-
-                # 输出 accurate 字幕
-                caption = CaptionOutput(
-                    type="accurate",
-                    text=text,
-                    timestamp=now,
-                    no_speech_prob=no_speech_prob,
-                    avg_logprob=avg_logprob
-                )
-                safe_put_drop_oldest(self.accurate_output_q, caption)
-
-                # 调用回调
-                if self.accurate_callback:
-                    try:
-                        self.accurate_callback(caption)
-                    except Exception as e:
-                        print(f"Accurate callback error: {e}")
-
-                # 保存到文件
-                os.makedirs(os.path.dirname(OUT_TXT), exist_ok=True)
-                line_out = f"[{now}] {text}"
-                with open(OUT_TXT, "a", encoding="utf-8") as f:
-                    f.write(line_out + "\n")
-                    f.flush()
-
-                prev_sent_tail = (prev_sent_tail + " " + text).strip()[-PREV_SENT_TAIL_CHARS:]
+            # 复制整句音频后立即开始下一句；final 解码在独立线程中按顺序进行
+            job = FinalJob(audio=utt_buf.copy(), start_pos=utt_start_pos, end_pos=end_pos, t=time.monotonic())
+            if self.separate_final_worker:
+                self._put_final(job)
+            else:
+                self._decode_final(job)
 
             reset_sentence()
 
@@ -653,25 +1359,35 @@ class AudioTranscriptionService:
                 except queue.Empty:
                     continue
 
+                EVENT_QUEUE_LAG_SECONDS.labels(kind=evt.kind).observe(time.monotonic() - evt.t)
+
                 if evt.kind == "START":
                     self.transcriber_logger.info("Received START event")
                     reset_sentence()
+                    utt_start_pos = evt.pos
                     if evt.audio is not None and evt.audio.size > 0:
-                        blocks.append(evt.audio.astype(np.float32, copy=False))
+                        utt_buf.append(evt.audio)
                         self.transcriber_logger.debug(f"START audio size: {evt.audio.size}")
                     do_partial_decode()
 
                 elif evt.kind == "CHUNK":
                     if evt.audio is None or evt.audio.size == 0:
                         continue
-                    blocks.append(evt.audio.astype(np.float32, copy=False))
-                    total_samples = sum(b.size for b in blocks)
-                    self.transcriber_logger.debug(f"CHUNK added, total blocks: {len(blocks)}, total samples: {total_samples}")
+                    utt_buf.append(evt.audio)
+                    self.transcriber_logger.debug(f"CHUNK added, total samples: {len(utt_buf)}")
                     do_partial_decode()
 
                 elif evt.kind == "END":
                     self.transcriber_logger.info("Received END event, finalizing...")
-                    finalize_sentence()
+                    finalize_sentence(evt.pos)
+
+                elif evt.kind == "EOF":
+                    if self.separate_final_worker:
+                        # 等 final 线程处理完之前的所有句子
+                        self._put_final(None)
+                    else:
+                        self.transcriber_logger.info("Received EOF event, offline transcription finished")
+                        self._offline_done.set()
 
             except Exception as e:
                 # 捕获所有异常，防止线程崩溃
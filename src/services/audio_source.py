@@ -0,0 +1,87 @@
+"""
+Audio Source
+离线音频文件读取，统一转换为 16k 单声道 int16
+
+- 容器格式（WAV 含 float / 24-bit、FLAC、MP3、M4A 等）：faster_whisper.decode_audio 经 PyAV（FFmpeg）解码，
+  混音为单声道并用 libswresample 重采样（带抗混叠滤波，44.1k / 48k 录音不会混叠到语音频段）
+- 原始 PCM（int16 小端）：按给定采样率读取，采样率不是 16k 时同样经 PyAV 重采样
+"""
+import os
+from typing import Iterator, Optional
+
+import av
+import numpy as np
+from faster_whisper import decode_audio
+
+from src.config import SR, BLOCK_SAMPLES
+
+
+RAW_PCM_EXTS = {".pcm", ".raw", ".s16", ".s16le"}
+
+
+def _float_to_int16(x: np.ndarray) -> np.ndarray:
+    return (np.clip(x, -1.0, 32767 / 32768) * 32768.0).astype(np.int16)
+
+
+def _resample_int16(x: np.ndarray, src_sr: int, dst_sr: int = SR) -> np.ndarray:
+    """单声道 int16 重采样（PyAV / libswresample）"""
+    if src_sr == dst_sr or x.size == 0:
+        return x
+    frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(x).reshape(1, -1), format="s16", layout="mono")
+    frame.sample_rate = src_sr
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=dst_sr)
+    # resample(None) 取出滤波器中剩余的尾部采样
+    frames = list(resampler.resample(frame)) + list(resampler.resample(None))
+    if not frames:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in frames]).astype(np.int16, copy=False)
+
+
+def _read_raw_pcm(path: str, sample_rate: int, channels: int) -> np.ndarray:
+    x = np.fromfile(path, dtype="<i2")
+    x = x[:x.size - x.size % channels].reshape(-1, channels)
+    if channels > 1:
+        x = np.rint(x.astype(np.float32).mean(axis=1)).astype(np.int16)
+    else:
+        x = x[:, 0]
+    return _resample_int16(np.ascontiguousarray(x), sample_rate, SR)
+
+
+def read_audio_file(path: str, raw_sample_rate: Optional[int] = None, raw_channels: int = 1) -> np.ndarray:
+    """
+    读取音频文件
+
+    Args:
+        path: 文件路径（.wav / .flac / .mp3 等 FFmpeg 支持的格式，或 .pcm 原始数据）
+        raw_sample_rate: 原始 PCM（int16 小端）的采样率，默认 SR
+        raw_channels: 原始 PCM 的声道数
+
+    Returns:
+        16k 单声道 int16 音频
+
+    Raises:
+        FileNotFoundError: 文件不存在
+        ValueError: 文件无法解码
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Audio file not found: {path}")
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_PCM_EXTS:
+        return _read_raw_pcm(path, raw_sample_rate or SR, raw_channels)
+
+    try:
+        audio = decode_audio(path, sampling_rate=SR)
+    except av.error.FFmpegError as e:
+        raise ValueError(f"Cannot decode audio file {os.path.basename(path)}: {e}") from e
+    return _float_to_int16(audio)
+
+
+def iter_blocks(audio_i16: np.ndarray, block_samples: int = BLOCK_SAMPLES) -> Iterator[np.ndarray]:
+    """按 VAD 块大小切分音频，最后一块补零"""
+    n = audio_i16.size
+    for i in range(0, n, block_samples):
+        block = audio_i16[i:i + block_samples]
+        if block.size < block_samples:
+            block = np.pad(block, (0, block_samples - block.size))
+        yield block
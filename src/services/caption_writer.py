@@ -0,0 +1,174 @@
+"""
+Caption Writer
+accurate 字幕落盘：后台线程按会话写入 JSONL，转写线程只做一次非阻塞入队
+
+- 每次 start_capture 为一个会话，写入 CAPTION_SESSION_DIR/<session>.jsonl
+- 写线程一次取出队列中的全部记录（最多 CAPTION_WRITER_BATCH 条）合并写入并 flush
+- fsync 策略 CAPTION_FSYNC："always" 每批写入后 fsync；"interval" 至多每 CAPTION_FSYNC_INTERVAL_SEC 秒一次；
+  "never" 只 flush，交给操作系统
+- 磁盘卡顿时记录在队列中积压，队列满（CAPTION_WRITER_QUEUE_MAX）才丢弃并计数
+"""
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import (
+    CAPTION_SESSION_DIR, CAPTION_FSYNC, CAPTION_FSYNC_INTERVAL_SEC,
+    CAPTION_WRITER_BATCH, CAPTION_WRITER_QUEUE_MAX,
+)
+from src.services.metrics import QUEUE_DROPS_TOTAL, QUEUE_SIZE, CAPTION_WRITE_SECONDS
+
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+_END = object()  # 控制项：结束会话（flush + fsync + 关闭文件）
+_SYNC = object()  # 控制项：写完此前的所有记录后通知等待者
+
+
+class CaptionWriter:
+    """按会话写 JSONL 的后台写线程"""
+
+    def __init__(
+        self,
+        out_dir: str = CAPTION_SESSION_DIR,
+        fsync: str = CAPTION_FSYNC,
+        fsync_interval: float = CAPTION_FSYNC_INTERVAL_SEC,
+        batch: int = CAPTION_WRITER_BATCH,
+        max_queue: int = CAPTION_WRITER_QUEUE_MAX,
+        name: str = "caption_writer",
+    ):
+        """
+        Args:
+            name: 线程名和队列指标的 queue 标签（同一进程中有多个写线程时区分）
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"CAPTION_FSYNC must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.out_dir = out_dir
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.batch = batch
+        self.name = name
+        # 项为 (session, record) 或 (控制项, 参数)
+        self.q: "queue.Queue[Tuple[Any, Any]]" = queue.Queue(maxsize=max_queue)
+        self._files: Dict[str, Any] = {}
+        self._last_fsync = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        QUEUE_SIZE.labels(queue=name).set_function(lambda: self.q.qsize())
+
+    def path_for(self, session: str) -> str:
+        return os.path.join(self.out_dir, f"{session}.jsonl")
+
+    # ====== 生产者（任意线程，不阻塞）======
+    def write(self, session: str, record: Dict[str, Any]) -> bool:
+        """入队一条记录，返回是否成功（队列满时丢弃）"""
+        self._ensure_started()
+        try:
+            self.q.put_nowait((session, record))
+            return True
+        except queue.Full:
+            QUEUE_DROPS_TOTAL.labels(queue=self.name).inc()
+            return False
+
+    def end_session(self, session: str):
+        """会话结束：写完已入队的记录后 fsync 并关闭文件（之后到达的迟到记录会重新以追加方式打开）"""
+        self._ensure_started()
+        self._put_control(_END, session)
+
+    def sync(self, timeout: Optional[float] = None) -> bool:
+        """等待此前入队的记录全部写入（关闭服务、测试用）"""
+        self._ensure_started()
+        done = threading.Event()
+        self._put_control(_SYNC, done)
+        return done.wait(timeout)
+
+    def _put_control(self, kind: object, arg: Any):
+        # 控制项不能丢：队列满时等写线程腾出位置
+        self.q.put((kind, arg))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    # ====== 写线程 ======
+    def _run(self):
+        while True:
+            items = [self.q.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(items)
+            except Exception as e:
+                # 写失败不影响转写，下一批重新打开文件
+                print(f"Caption writer error: {e}")
+                self._close_all()
+                for kind, arg in items:
+                    if kind is _SYNC:
+                        arg.set()
+
+    def _write_batch(self, items: List[Tuple[Any, Any]]):
+        t0 = time.monotonic()
+        lines: Dict[str, List[str]] = {}
+        for kind, arg in items:
+            if kind is _END:
+                self._flush_lines(lines)
+                lines = {}
+                self._close(arg)
+            elif kind is _SYNC:
+                self._flush_lines(lines)
+                lines = {}
+                self._fsync_all()
+                arg.set()
+            else:
+                lines.setdefault(kind, []).append(json.dumps(arg, ensure_ascii=False) + "\n")
+        self._flush_lines(lines)
+
+        if self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            self._fsync_all()
+        CAPTION_WRITE_SECONDS.observe(time.monotonic() - t0)
+
+    def _flush_lines(self, lines: Dict[str, List[str]]):
+        for session, chunk in lines.items():
+            f = self._files.get(session)
+            if f is None:
+                os.makedirs(self.out_dir, exist_ok=True)
+                f = self._files[session] = open(self.path_for(session), "a", encoding="utf-8")
+            f.write("".join(chunk))
+            f.flush()
+
+    def _fsync_all(self):
+        self._last_fsync = time.monotonic()
+        if self.fsync == "never":
+            return
+        for f in self._files.values():
+            os.fsync(f.fileno())
+
+    def _close(self, session: str):
+        f = self._files.pop(session, None)
+        if f is None:
+            return
+        try:
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+
+    def _close_all(self):
+        for session in list(self._files):
+            try:
+                self._close(session)
+            except OSError:
+                pass
@@ -0,0 +1,347 @@
+"""
+Hardware Profile
+启动时自动选择 Whisper 的 device / compute_type / cpu_threads
+
+DEVICE 或 COMPUTE_TYPE_* 配置为 "auto" 时，对每个候选配置加载模型并计时解码一段样本音频，
+在达到目标实时率（HW_PROFILE_TARGET_RTF）的配置中选占用线程最少的；都达不到时选 RTF 最低的。
+结果按机器指纹缓存到磁盘，之后启动直接复用。
+
+dual 模式下 partial 与 final 并发解码，物理核按 HW_PROFILE_PARTIAL_CORE_SHARE 分给两个模型，
+各自只在自己的份额内选线程数，避免两个模型都按全部核计时、运行时相互抢占。
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import platform
+import threading
+import wave
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import (
+    SR, DEVICE, LANGUAGE, TEMPERATURE, DEFAULT_PROF_WORDS,
+    HW_PROFILE_CACHE, HW_PROFILE_CLIP, HW_PROFILE_CLIP_SEC, HW_PROFILE_TARGET_RTF,
+    HW_PROFILE_PARTIAL_CORE_SHARE,
+)
+
+
+logger = logging.getLogger('HWProfile')
+
+CPU_COMPUTE_TYPES = ("int8", "int8_float32", "float32")
+CUDA_COMPUTE_TYPES = ("float16", "int8_float16", "int8")
+
+_cache_lock = threading.Lock()
+_profile_lock = threading.Lock()  # 并行加载多个模型时逐个测量，避免相互抢占导致计时失真
+
+
+@dataclass
+class RuntimeChoice:
+    """一个模型的运行配置"""
+    device: str
+    compute_type: str
+    cpu_threads: int = 0  # 0 表示 CTranslate2 默认
+    num_workers: int = 1
+    rtf: Optional[float] = None  # 样本音频上的实测实时率
+    source: str = "config"  # "config" | "cache" | "profiled"
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        """WhisperModel 构造参数"""
+        return {
+            "device": self.device,
+            "compute_type": self.compute_type,
+            "cpu_threads": self.cpu_threads,
+            "num_workers": self.num_workers,
+        }
+
+
+# ====== 硬件探测 ======
+def cuda_device_count() -> int:
+    try:
+        import ctranslate2
+        return int(ctranslate2.get_cuda_device_count())
+    except Exception:
+        return 0
+
+
+def physical_cores() -> int:
+    try:
+        import psutil
+        n = psutil.cpu_count(logical=False)
+        if n:
+            return int(n)
+    except ImportError:
+        pass
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def core_budgets(share: float = HW_PROFILE_PARTIAL_CORE_SHARE) -> Dict[str, int]:
+    """
+    各模型可用的 CPU 线程数（按加载计划中的 key）
+
+    dual 模式下 partial 与 final 分物理核（两者都至少 1 个）；single 模式下共用模型占全部物理核
+    """
+    cores = physical_cores()
+    partial = min(max(1, round(cores * share)), max(1, cores - 1))
+    return {"partial": partial, "final": max(1, cores - partial), "shared": cores}
+
+
+def machine_fingerprint() -> str:
+    """机器指纹：CPU 型号/核数、GPU 数量与型号、CTranslate2 版本"""
+    parts = [
+        platform.system(),
+        platform.machine(),
+        platform.processor(),
+        str(os.cpu_count()),
+        str(physical_cores()),
+    ]
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    parts.append(line.split(":", 1)[1].strip())
+                    break
+    except OSError:
+        pass
+
+    n_cuda = cuda_device_count()
+    parts.append(f"cuda={n_cuda}")
+    try:
+        import ctranslate2
+        parts.append(ctranslate2.__version__)
+        if n_cuda:
+            parts.append(",".join(sorted(ctranslate2.get_supported_compute_types("cuda"))))
+    except Exception:
+        pass
+
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+# ====== 样本音频 ======
+def _has_profile_clip() -> bool:
+    """HW_PROFILE_CLIP 是否为可用的 16k 单声道 16-bit WAV"""
+    if not os.path.isfile(HW_PROFILE_CLIP):
+        return False
+    try:
+        with wave.open(HW_PROFILE_CLIP, "rb") as wf:
+            return (wf.getframerate() == SR and wf.getnchannels() == 1
+                    and wf.getsampwidth() == 2 and wf.getnframes() > 0)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def load_profile_clip(seconds: float = HW_PROFILE_CLIP_SEC) -> Tuple[np.ndarray, bool]:
+    """
+    读取样本音频（HW_PROFILE_CLIP，16k 单声道 WAV）
+
+    文件不存在或格式不对时用合成信号代替（解码输出很短，测得的耗时偏乐观），
+    并在控制台明确提示；第二个返回值标记是否为真实语音
+
+    Returns:
+        (音频, 是否为真实语音)
+    """
+    n = int(seconds * SR)
+    if _has_profile_clip():
+        with wave.open(HW_PROFILE_CLIP, "rb") as wf:
+            x = np.frombuffer(wf.readframes(n), dtype="<i2").astype(np.float32) / 32768.0
+        return x, True
+    if os.path.isfile(HW_PROFILE_CLIP):
+        reason = f"must be 16 kHz mono 16-bit WAV: {HW_PROFILE_CLIP}"
+    else:
+        reason = f"not found: {HW_PROFILE_CLIP}"
+
+    # 与 "Profiling ..." 一样直接打印：HWProfile logger 没有挂控制台 handler
+    print(f"WARNING: profile clip {reason}; profiling on a synthetic signal, "
+          f"measured RTF will be optimistic. Put a short 16 kHz mono speech WAV there for real numbers.")
+
+    rng = np.random.default_rng(0)
+    t = np.arange(n) / SR
+    envelope = 0.55 + 0.45 * np.abs(np.sin(2 * np.pi * 2.0 * t))
+    return (0.1 * envelope * rng.standard_normal(n)).astype(np.float32), False
+
+
+# ====== 候选与计时 ======
+def candidate_choices(device: str, compute_type: str, num_workers: int,
+                      max_threads: Optional[int] = None) -> List[RuntimeChoice]:
+    """
+    按配置中非 auto 的部分固定，其余展开为候选
+
+    max_threads: 该模型可用的 CPU 线程数（默认全部物理核）；每个 worker 各用 cpu_threads 个线程，
+        候选的 cpu_threads * num_workers 不超过该值
+    """
+    if device == "auto":
+        devices = ["cuda"] if cuda_device_count() > 0 else ["cpu"]
+    else:
+        devices = [device]
+
+    out: List[RuntimeChoice] = []
+    for dev in devices:
+        if compute_type != "auto":
+            types: Tuple[str, ...] = (compute_type,)
+        else:
+            types = CUDA_COMPUTE_TYPES if dev == "cuda" else CPU_COMPUTE_TYPES
+
+        if dev == "cpu":
+            cores = max(1, (max_threads or physical_cores()) // max(1, num_workers))
+            threads = sorted({cores, max(1, cores // 2)}, reverse=True)
+        else:
+            threads = [0]
+
+        for ct in types:
+            for th in threads:
+                out.append(RuntimeChoice(device=dev, compute_type=ct, cpu_threads=th, num_workers=num_workers))
+    return out
+
+
+def time_choice(model_dir: str, choice: RuntimeChoice, clip: np.ndarray, beam_size: int) -> Optional[float]:
+    """加载模型并计时解码样本音频，返回 RTF（失败返回 None）"""
+    from faster_whisper import WhisperModel
+
+    try:
+        model = WhisperModel(model_dir, **choice.model_kwargs())
+    except Exception as e:
+        logger.info(f"  {choice.device}/{choice.compute_type}: unsupported ({e})")
+        return None
+
+    def decode():
+        segments, _info = model.transcribe(
+            clip,
+            language=LANGUAGE,
+            beam_size=beam_size,
+            temperature=TEMPERATURE,
+            initial_prompt=DEFAULT_PROF_WORDS,
+            condition_on_previous_text=False,
+            vad_filter=False,
+        )
+        for _ in segments:
+            pass
+
+    try:
+        decode()  # 预热
+        t0 = time.perf_counter()
+        decode()
+        rtf = (time.perf_counter() - t0) / (clip.size / SR)
+    except Exception as e:
+        logger.info(f"  {choice.device}/{choice.compute_type}: decode failed ({e})")
+        return None
+    finally:
+        del model
+    return rtf
+
+
+# ====== 缓存 ======
+def _read_cache() -> Dict[str, Any]:
+    try:
+        with open(HW_PROFILE_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(data: Dict[str, Any]):
+    os.makedirs(os.path.dirname(HW_PROFILE_CACHE), exist_ok=True)
+    tmp = HW_PROFILE_CACHE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, HW_PROFILE_CACHE)
+
+
+# ====== 入口 ======
+def resolve_runtime(
+    model_dir: str,
+    compute_type: str,
+    *,
+    beam_size: int,
+    device: str = DEVICE,
+    num_workers: int = 1,
+    max_threads: Optional[int] = None,
+    force: bool = False,
+) -> RuntimeChoice:
+    """
+    确定一个模型的运行配置
+
+    Args:
+        model_dir: 模型目录
+        compute_type: 配置的 compute_type（"auto" 表示自动选择）
+        beam_size: 计时解码使用的 beam（与该模型的实际用途一致）
+        device: 配置的 device（"auto" 表示自动选择）
+        num_workers: 并发解码数（只影响多线程同时调用，不参与计时）
+        max_threads: 该模型可用的 CPU 线程数（见 core_budgets()；默认全部物理核）
+        force: 忽略缓存重新测量
+
+    Returns:
+        RuntimeChoice
+    """
+    if device != "auto" and compute_type != "auto":
+        return RuntimeChoice(device=device, compute_type=compute_type, num_workers=num_workers)
+
+    fingerprint = machine_fingerprint()
+    budget = max_threads or physical_cores()
+    # 缓存 key 带上样本类型：之后放入真实语音样本会重新测量，不沿用合成信号的结果
+    clip_kind = "clip" if _has_profile_clip() else "synthetic"
+    key = (
+        f"{os.path.basename(os.path.normpath(model_dir))}|{device}|{compute_type}|beam{beam_size}"
+        f"|threads{budget}x{num_workers}|rtf{HW_PROFILE_TARGET_RTF}|{clip_kind}"
+    )
+
+    with _cache_lock:
+        cached = _read_cache().get(fingerprint, {}).get(key)
+    if cached and not force:
+        choice = RuntimeChoice(**{**cached, "num_workers": num_workers, "source": "cache"})
+        logger.info(f"Runtime for {key}: {choice.device}/{choice.compute_type} threads={choice.cpu_threads} (cached)")
+        return choice
+
+    with _profile_lock:
+        clip, _ = load_profile_clip()
+        candidates = candidate_choices(device, compute_type, num_workers, max_threads=budget)
+        print(f"Profiling {len(candidates)} runtime configurations for {os.path.basename(model_dir)} "
+              f"(budget {budget} threads, {clip_kind})...")
+
+        measured: List[RuntimeChoice] = []
+        for choice in candidates:
+            rtf = time_choice(model_dir, choice, clip, beam_size)
+            if rtf is None:
+                continue
+            choice.rtf = round(rtf, 4)
+            logger.info(f"  {choice.device}/{choice.compute_type} threads={choice.cpu_threads}: RTF={rtf:.3f}")
+            measured.append(choice)
+
+        if not measured:
+            raise RuntimeError(f"No usable runtime configuration for {model_dir}")
+        # 达标的配置中选线程最少的（同线程数取 RTF 最低），把剩余的核留给另一个模型和 VAD；
+        # 都不达标时退回 RTF 最低的配置
+        meeting = [c for c in measured if c.rtf <= HW_PROFILE_TARGET_RTF]
+        if meeting:
+            best = min(meeting, key=lambda c: (c.cpu_threads, c.rtf))
+        else:
+            best = min(measured, key=lambda c: c.rtf)
+            logger.warning(
+                f"Fastest configuration for {os.path.basename(model_dir)} has RTF={best.rtf:.3f} "
+                f"(target {HW_PROFILE_TARGET_RTF}); captions may fall behind real time"
+            )
+
+    best.source = "profiled"
+    with _cache_lock:
+        data = _read_cache()
+        data.setdefault(fingerprint, {})[key] = asdict(best)
+        _write_cache(data)
+
+    print(f"Selected {best.device}/{best.compute_type} threads={best.cpu_threads} (RTF={best.rtf:.3f})")
+    return best
+
+
+if __name__ == "__main__":
+    # 手动重新测量：python -m src.services.hw_profile
+    from src.config import WHISPER_MODEL_MODE
+    from src.services.model_loader import whisper_load_plan
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(f"Machine fingerprint: {machine_fingerprint()}")
+    budgets = core_budgets()
+    for name, model_dir, ct, beam, workers, _targets in whisper_load_plan(WHISPER_MODEL_MODE):
+        choice = resolve_runtime(model_dir, ct, beam_size=beam, num_workers=workers,
+                                 max_threads=budgets[name], force=True)
+        print(f"{name}: {asdict(choice)}")
@@ -2,17 +2,73 @@
 LLM Processor Service
 LLM 处理服务，接收转写文本并生成结构化笔记
 """
+import asyncio
 import json
 import queue
 import threading
 import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Callable
+from typing import AsyncIterator, Deque, List, Dict, Any, Optional, Callable, Tuple
 
 from src.agent.llm import DSV3
 from src.agent.prompt import promptv2
 from src.agent.func import transript_chunk, pre, extract_json_object
-from src.config import LLM_CHUNK_SIZE, LLM_OUTPUT_JSON
+from src.config import (
+    LLM_CHUNK_SIZE, LLM_PIPELINE_DEPTH, LLM_RECONCILE_THRESHOLD, LLM_STOP_DRAIN_TIMEOUT_SEC,
+    QA_CONTEXT_MAX_TOKENS, QA_TOP_K, QA_CAPTION_PASSAGE_TOKENS,
+)
+from src.services.metrics import (
+    LLM_REQUEST_SECONDS, LLM_FIRST_TOKEN_SECONDS, QUEUE_SIZE, LLM_NOTE_LAG_SECONDS, LLM_SPECULATION_TOTAL, LLM_LAG_SAVED_SECONDS_TOTAL,
+    QA_CONTEXT_TOKENS,
+)
+from src.services.notes_store import NotesStore, load_contents
+from src.services.retrieval_index import RetrievalIndex, Passage
+from src.services.transcript_chunker import TranscriptChunker, estimate_tokens
+
+
+NO_CONTENT_ANSWER = "抱歉，当前还没有转写内容。请先开始转写。"
+
+_QA_LABELS = {"coursework": "课程安排", "knowledge": "知识点", "question": "问题", "caption": "转写原文"}
+
+
+def supplement_divergence(a: str, b: str) -> float:
+    """
+    两个 supplement（JSON 字符串）的差异：ongoing + carryover_raw 条目集合的 Jaccard 距离，0 为相同，1 为完全不同
+    """
+    if a == b:
+        return 0.0
+
+    def items(s: str) -> set:
+        try:
+            sup = json.loads(s) if s else {}
+        except ValueError:
+            return {s}
+        if not isinstance(sup, dict):
+            return {s}
+        return {json.dumps(x, ensure_ascii=False, sort_keys=True)
+                for key in ("ongoing", "carryover_raw") for x in (sup.get(key) or [])}
+
+    set_a, set_b = items(a), items(b)
+    union = set_a | set_b
+    if not union:
+        return 0.0
+    return 1.0 - len(set_a & set_b) / len(union)
+
+
+class _PendingBatch:
+    """流水线中在途的一个批次"""
+
+    def __init__(self, chunk: List[str], arrived: float, enqueued: float, supplement: str, speculative: bool,
+                 future: Future):
+        self.chunk = chunk
+        self.arrived = arrived  # 批次中第一条字幕的到达时间（monotonic）
+        self.enqueued = enqueued  # 进入 process_queue 的时间
+        self.supplement = supplement  # 发出时使用的 prev_supplement
+        self.speculative = speculative  # 发出时前面还有未完成的批次
+        self.future = future
 
 
 class LLMProcessorService:
@@ -21,34 +77,57 @@ class LLMProcessorService:
     接收 accurate 转写文本，批量处理后生成结构化内容
     """
 
-    def __init__(self, chunk_size: int = LLM_CHUNK_SIZE):
+    def __init__(
+        self,
+        chunk_size: int = LLM_CHUNK_SIZE,
+        pipeline_depth: int = LLM_PIPELINE_DEPTH,
+        reconcile_threshold: float = LLM_RECONCILE_THRESHOLD,
+        qa_max_tokens: int = QA_CONTEXT_MAX_TOKENS,
+        qa_top_k: int = QA_TOP_K,
+    ):
         """
         初始化 LLM 处理服务
 
         Args:
-            chunk_size: 每次处理的转写文本数量
+            chunk_size: 达到该条数立即处理（0 时只按 token / 等待时间 / 停顿切分，见 TranscriptChunker）
+            pipeline_depth: 同时在途的批次数上限（1 为严格串行，见 _pipelined_processor）
+            reconcile_threshold: supplement 差异超过该值时重跑推测发出的批次
+            qa_max_tokens / qa_top_k: 问答提示词中课堂内容的 token 预算和检索候选片段数
         """
         self.llm_client = DSV3()
         self.chunk_size = chunk_size
-
-        # 缓冲区
-        self.transcript_buffer: List[str] = []
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.reconcile_threshold = reconcile_threshold
+        self.qa_max_tokens = qa_max_tokens
+        self.qa_top_k = qa_top_k
+        self._serial_done = 0.0  # 严格串行时上一批的预计完成时间（估算流水线节省的延迟）
+
+        # 缓冲区及切分策略
+        self.chunker = TranscriptChunker(max_captions=chunk_size)
         self.prev_supplement = ''  # 上一个 chunk 的 supplement
 
-        # 结果存储
+        # 问答检索索引：笔记条目随批次保存加入，转写原文合并到约 QA_CAPTION_PASSAGE_TOKENS 后加入
+        self.qa_index = RetrievalIndex()
+        self._caption_window: List[str] = []  # 尚未加入索引的最近转写
+        self._caption_window_tokens = 0
+
+        # 结果存储（只追加；clear / load 时整体替换为新列表，读取方取切片快照即可，不需要加锁）
         self.structured_content: List[Dict[str, Any]] = []
         self.all_supplements: List[str] = []
+        # clear / load 时递增；客户端的批次游标只在同一代内有效（初值取启动时间，重启后旧游标自然失效）
+        self.content_generation = int(time.time())
 
-        # 线程安全
+        # 线程安全（保护转写缓冲区和结果的追加）
         self.lock = threading.Lock()
 
         # 异步处理队列
         self.process_queue = queue.Queue()
         self.stop_event = threading.Event()
         self.process_thread: Optional[threading.Thread] = None
+        QUEUE_SIZE.labels(queue="llm_process").set_function(lambda: self.process_queue.qsize())
 
-        # 回调
-        self.on_processed_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+        # 回调：(content, 批次下标, 代号)
+        self.on_processed_callback: Optional[Callable[[Dict[str, Any], int, int], None]] = None
 
         # 是否启用自动保存
         self.auto_save = True
@@ -56,11 +135,23 @@ class LLMProcessorService:
         # 会话管理：每次开始转写时生成新的文件名
         self.session_start_time: Optional[str] = None
         self.save_path: Optional[str] = None
+        self.store: Optional[NotesStore] = None  # 会话 JSONL（每个批次追加一行）
 
-    def set_on_processed_callback(self, callback: Callable[[Dict[str, Any]], None]):
-        """设置处理完成回调"""
+    def set_on_processed_callback(self, callback: Callable[[Dict[str, Any], int, int], None]):
+        """设置处理完成回调（参数为本批次的 content、从 0 开始的批次下标和所属代号）"""
         self.on_processed_callback = callback
 
+    def _generate(self, prompt: str, kind: str) -> str:
+        """调用 LLM 并记录耗时（kind: batch / qa）"""
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            resp = self.llm_client.generate(prompt)
+            outcome = "ok"
+            return resp
+        finally:
+            LLM_REQUEST_SECONDS.labels(kind=kind, outcome=outcome).observe(time.perf_counter() - t0)
+
     def start_session(self):
         """
         开始新的转写会话
@@ -72,8 +163,11 @@ class LLMProcessorService:
         logs_dir = os.path.join("data", "logs")
         os.makedirs(logs_dir, exist_ok=True)
 
-        # 生成文件路径: data/logs/20260118_143025_content.json
-        self.save_path = os.path.join(logs_dir, f"{self.session_start_time}_content.json")
+        # 生成文件路径: data/logs/20260118_143025_content.jsonl
+        self.save_path = os.path.join(logs_dir, f"{self.session_start_time}_content.jsonl")
+        if self.store is not None:
+            self.store.close()
+        self.store = NotesStore(self.save_path)
 
         print(f"Started new session: {self.session_start_time}")
         print(f"Content will be saved to: {self.save_path}")
@@ -90,10 +184,12 @@ class LLMProcessorService:
         print("LLM async processing started!")
 
     def stop_async_processing(self):
-        """停止异步处理线程"""
+        """停止异步处理线程（等待正在调用的批次返回并保存，之后才能 close_session）"""
         self.stop_event.set()
         if self.process_thread:
-            self.process_thread.join(timeout=2.0)
+            self.process_thread.join(timeout=LLM_STOP_DRAIN_TIMEOUT_SEC + 5.0)
+            if self.process_thread.is_alive():
+                print("Warning: LLM processing thread still running, later batches may miss the session file")
         print("LLM async processing stopped!")
 
     def add_transcript(self, text: str):
@@ -104,16 +200,45 @@ class LLMProcessorService:
             text: accurate 转写文本
         """
         with self.lock:
-            self.transcript_buffer.append(text)
-
-            # 检查是否达到批次大小
-            if len(self.transcript_buffer) >= self.chunk_size:
-                # 提取要处理的 chunk
-                chunk = self.transcript_buffer[:self.chunk_size]
-                self.transcript_buffer = self.transcript_buffer[self.chunk_size:]
+            self._index_caption(text)
+            # 达到条数或 token 上限时立即切出批次
+            chunk = self.chunker.add(text, time.monotonic())
+            if chunk:
+                self._enqueue_chunk(chunk)
+
+    def flush_transcripts(self) -> int:
+        """把缓冲区中剩余的转写文本作为一个批次送去处理（停止录音时调用），返回条数"""
+        with self.lock:
+            chunk = self.chunker.flush()
+            if chunk:
+                self._enqueue_chunk(chunk)
+        return len(chunk) if chunk else 0
 
-                # 放入处理队列
-                self.process_queue.put(chunk)
+    def _poll_chunker(self):
+        """处理线程定时调用：等待超时或讲课停顿时切出批次"""
+        with self.lock:
+            chunk = self.chunker.poll(time.monotonic())
+            if chunk:
+                self._enqueue_chunk(chunk)
+
+    def _index_caption(self, text: str):
+        """转写原文攒到约 QA_CAPTION_PASSAGE_TOKENS 后作为一个片段加入问答索引（调用方持有 self.lock）"""
+        self._caption_window.append(text)
+        self._caption_window_tokens += estimate_tokens(text)
+        if self._caption_window_tokens >= QA_CAPTION_PASSAGE_TOKENS:
+            self.qa_index.add(" ".join(self._caption_window), "caption")
+            self._caption_window = []
+            self._caption_window_tokens = 0
+
+    def _index_content(self, content: Dict[str, Any], batch_no: int):
+        """一个批次的笔记条目逐条加入问答索引（调用方持有 self.lock）"""
+        for kind in ("coursework", "knowledge", "question"):
+            for item in content.get(kind) or []:
+                self.qa_index.add(str(item), kind, batch_no)
+
+    def _enqueue_chunk(self, chunk: List[str]):
+        # 附批次中第一条字幕的到达时间和入队时间，用于统计笔记延迟（调用方持有 self.lock）
+        self.process_queue.put((chunk, self.chunker.first_time, time.monotonic()))
 
     def process_batch_sync(self, chunk: List[str]) -> Dict[str, Any]:
         """
@@ -125,58 +250,85 @@ class LLMProcessorService:
         Returns:
             结构化内容
         """
+        result = self._call_batch(chunk, self.prev_supplement)
+        if result is None:
+            return {
+                "content": {"coursework": [], "knowledge": [], "question": []},
+                "supplement": {"ongoing": [], "carryover_raw": []}
+            }
+        content, supplement = result
+        self._store_batch(content, supplement)
+        return content
+
+    def _call_batch(self, chunk: List[str], prev_supplement: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        以给定的 prev_supplement 调用 LLM 处理一个批次（不修改服务状态，可在多个线程并发调用）
+
+        Returns:
+            (content, supplement JSON 字符串)；无法解析响应时返回 None
+        """
         # 合并 chunk
         transcript_text = ' '.join(chunk)
 
         # 构建提示词
-        prompt_trans = pre(self.prev_supplement) + transript_chunk(transcript_text)
+        prompt_trans = pre(prev_supplement) + transript_chunk(transcript_text)
         full_prompt = promptv2 + prompt_trans
 
         # 调用 LLM
         print(f"Processing {len(chunk)} transcripts with LLM...")
-        resp = self.llm_client.generate(full_prompt)
+        resp = self._generate(full_prompt, kind="batch")
 
         # 提取 JSON
         resp_json = extract_json_object(resp)
 
         if resp_json is None:
             print("Warning: Failed to extract JSON from LLM response")
-            return {
-                "content": {"coursework": [], "knowledge": [], "question": []},
-                "supplement": {"ongoing": [], "carryover_raw": []}
-            }
+            return None
 
         # 提取结果
         content = resp_json.get('content', {"coursework": [], "knowledge": [], "question": []})
         supplement = resp_json.get('supplement', {"ongoing": [], "carryover_raw": []})
+        return content, json.dumps(supplement)
 
+    def _store_batch(self, content: Dict[str, Any], supplement: str):
+        """按批次顺序保存结果：更新 prev_supplement、追加、落盘、回调"""
         # 更新 prev_supplement
-        self.prev_supplement = json.dumps(supplement)
+        self.prev_supplement = supplement
 
         # 存储结果
         with self.lock:
             self.structured_content.append(content)
             self.all_supplements.append(self.prev_supplement)
+            batch_no = len(self.structured_content)
+            generation = self.content_generation
+            self._index_content(content, batch_no)
 
-        # 自动保存
-        if self.auto_save:
-            self.save_to_file()
+        # 自动保存：只追加本批次一行（不持锁，读取方不等待写盘）
+        if self.auto_save and self.store is not None:
+            try:
+                self.store.append_batch(batch_no, content, self.prev_supplement)
+            except OSError as e:
+                print(f"Failed to save batch {batch_no}: {e}")
 
         # 回调
         if self.on_processed_callback:
             try:
-                self.on_processed_callback(content)
+                self.on_processed_callback(content, batch_no - 1, generation)
             except Exception as e:
                 print(f"Callback error: {e}")
 
         print(f"Processed batch successfully! Total batches: {len(self.structured_content)}")
-        return content
 
     def _async_processor(self):
         """异步处理器（在后台线程运行）"""
+        if self.pipeline_depth > 1:
+            self._pipelined_processor()
+            return
+
         while not self.stop_event.is_set():
+            self._poll_chunker()
             try:
-                chunk = self.process_queue.get(timeout=0.5)
+                chunk, arrived, _enqueued = self.process_queue.get(timeout=0.5)
             except queue.Empty:
                 continue
 
@@ -184,11 +336,104 @@ class LLMProcessorService:
                 self.process_batch_sync(chunk)
             except Exception as e:
                 print(f"Error processing batch: {e}")
+            LLM_NOTE_LAG_SECONDS.observe(time.monotonic() - arrived)
+
+    # ====== 流水线处理 ======
+    def _pipelined_processor(self):
+        """
+        流水线处理：最多 pipeline_depth 个批次同时调用 LLM，结果仍按批次顺序保存
+
+        每个批次的提示词依赖前一批返回的 supplement。前一批未返回时，后续批次推测性地使用
+        发出时已知的最新 supplement（即最近一个已保存批次的）。轮到它保存时与前一批的真实
+        supplement 比较：差异不超过 reconcile_threshold 直接采用，否则用真实 supplement 重跑。
+        """
+        executor = ThreadPoolExecutor(max_workers=self.pipeline_depth, thread_name_prefix="LLMBatch")
+        pending: Deque[_PendingBatch] = deque()
+        try:
+            while not self.stop_event.is_set():
+                self._poll_chunker()
+
+                # 按顺序保存已返回的批次（先于发出新批次，使其能用上最新的 supplement）
+                while pending and pending[0].future.done():
+                    try:
+                        self._finish_pending(pending.popleft())
+                    except Exception as e:
+                        print(f"Error processing batch: {e}")
+
+                # 补满窗口
+                if len(pending) < self.pipeline_depth:
+                    try:
+                        chunk, arrived, enqueued = self.process_queue.get(timeout=0.05 if pending else 0.5)
+                    except queue.Empty:
+                        continue
+                    supplement = self.prev_supplement
+                    future = executor.submit(self._timed_call, chunk, supplement)
+                    pending.append(_PendingBatch(chunk, arrived, enqueued, supplement, bool(pending), future))
+                else:
+                    wait([pending[0].future], timeout=0.5)
+        finally:
+            self._drain_pending(pending)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _drain_pending(self, pending: Deque[_PendingBatch]):
+        """停止时按顺序等待在途批次返回并保存（总共最多 LLM_STOP_DRAIN_TIMEOUT_SEC）"""
+        if pending:
+            print(f"Waiting for {len(pending)} in-flight LLM batches...")
+        deadline = time.monotonic() + LLM_STOP_DRAIN_TIMEOUT_SEC
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not wait([pending[0].future], timeout=remaining).done:
+                break
+            try:
+                self._finish_pending(pending.popleft())
+            except Exception as e:
+                print(f"Error processing batch: {e}")
+        if pending:
+            print(f"Warning: dropped {len(pending)} LLM batches still in flight after {LLM_STOP_DRAIN_TIMEOUT_SEC}s")
+            pending.clear()
+
+    def _timed_call(self, chunk: List[str], supplement: str) -> Tuple[Optional[Tuple[Dict[str, Any], str]], float]:
+        t0 = time.monotonic()
+        result = self._call_batch(chunk, supplement)
+        return result, time.monotonic() - t0
+
+    def _finish_pending(self, batch: _PendingBatch):
+        """保存一个已返回的批次；所用 supplement 与真实的差异过大时先重跑"""
+        try:
+            result, call_sec = batch.future.result()
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            result, call_sec = None, 0.0
+
+        if not batch.speculative:
+            outcome = "exact"
+        elif supplement_divergence(batch.supplement, self.prev_supplement) <= self.reconcile_threshold:
+            outcome = "accepted"
+        else:
+            outcome = "rerun"
+            print("Speculative supplement diverged, re-running batch with the actual one...")
+            result, call_sec = self._timed_call(batch.chunk, self.prev_supplement)
+        LLM_SPECULATION_TOTAL.labels(outcome=outcome).inc()
+
+        if result is not None:
+            self._store_batch(*result)
+
+        # 延迟：实际值，以及同样的调用耗时下严格串行的预计完成时间
+        now = time.monotonic()
+        LLM_NOTE_LAG_SECONDS.observe(now - batch.arrived)
+        self._serial_done = max(self._serial_done, batch.enqueued) + call_sec
+        if self._serial_done > now:
+            LLM_LAG_SAVED_SECONDS_TOTAL.inc(self._serial_done - now)
 
     def get_all_content(self) -> List[Dict[str, Any]]:
-        """获取所有结构化内容"""
+        """获取所有结构化内容（快照）"""
+        return self.structured_content[:]
+
+    def content_snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(代号, 结构化内容快照)：两者一致，用于增量拉取和 ETag"""
         with self.lock:
-            return self.structured_content.copy()
+            generation, content = self.content_generation, self.structured_content
+        return generation, content[:]
 
     def get_latest_content(self, n: int = 1) -> List[Dict[str, Any]]:
         """
@@ -200,50 +445,84 @@ class LLMProcessorService:
         Returns:
             最新的 n 条内容
         """
-        with self.lock:
-            return self.structured_content[-n:] if self.structured_content else []
+        content = self.structured_content
+        return content[-n:] if content else []
 
     def save_to_file(self, filepath: Optional[str] = None):
         """
-        保存结构化内容到文件
+        导出结构化内容为 JSON（content 列表，indent=2）
+
+        批次在处理时已追加到会话 JSONL，这里只用于显式导出，不在每个批次后调用。
 
         Args:
-            filepath: 保存路径，默认使用会话路径
+            filepath: 保存路径，默认为会话 JSONL 同名的 .json
         """
-        save_path = filepath or self.save_path
+        save_path = filepath or (os.path.splitext(self.save_path)[0] + ".json" if self.save_path else None)
 
         if not save_path:
             print("Warning: No save path set. Call start_session() first.")
             return
 
-        with self.lock:
-            with open(save_path, "w", encoding="utf-8") as f:
-                json.dump(self.structured_content, f, ensure_ascii=False, indent=2)
+        content = self.get_all_content()
+        tmp = save_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, save_path)
 
-        print(f"Saved {len(self.structured_content)} batches to {save_path}")
+        print(f"Saved {len(content)} batches to {save_path}")
+
+    def close_session(self):
+        """结束会话：压缩会话 JSONL（去掉 clear 之前的记录）并导出 JSON"""
+        if self.store is None:
+            return
+        try:
+            kept, dropped = self.store.compact()
+            if os.path.isfile(self.store.path):
+                out = self.store.export_json()
+                print(f"Session notes compacted ({kept} batches, {dropped} lines dropped), exported to {out}")
+        except (OSError, ValueError) as e:
+            print(f"Failed to compact session notes: {e}")
 
     def load_from_file(self, filepath: str):
         """
-        从文件加载结构化内容
+        从文件加载结构化内容（会话 JSONL 逐行重放；也接受旧版 *_content.json）
 
         Args:
             filepath: 文件路径
         """
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        contents, supplements = load_contents(filepath)
 
         with self.lock:
-            self.structured_content = data
-
-        print(f"Loaded {len(self.structured_content)} batches from {filepath}")
+            self.structured_content = contents
+            self.all_supplements = supplements
+            self.content_generation += 1
+            if supplements:
+                self.prev_supplement = supplements[-1]
+            self.qa_index.clear()
+            self._caption_window = []
+            self._caption_window_tokens = 0
+            for batch_no, content in enumerate(contents, 1):
+                self._index_content(content, batch_no)
+
+        print(f"Loaded {len(contents)} batches from {filepath}")
 
     def clear(self):
         """清空所有缓冲和结果"""
         with self.lock:
-            self.transcript_buffer = []
+            self.chunker.clear()
             self.structured_content = []
             self.all_supplements = []
             self.prev_supplement = ''
+            self.content_generation += 1
+            self.qa_index.clear()
+            self._caption_window = []
+            self._caption_window_tokens = 0
+
+        if self.auto_save and self.store is not None:
+            try:
+                self.store.append_clear()
+            except OSError as e:
+                print(f"Failed to record clear: {e}")
 
         print("LLM service cleared!")
 
@@ -251,10 +530,15 @@ class LLMProcessorService:
         """获取统计信息"""
         with self.lock:
             return {
-                "buffer_size": len(self.transcript_buffer),
+                "buffer_size": len(self.chunker.buffer),
+                "buffer_tokens": self.chunker.tokens,
                 "processed_batches": len(self.structured_content),
                 "queue_size": self.process_queue.qsize(),
                 "chunk_size": self.chunk_size,
+                "pipeline_depth": self.pipeline_depth,
+                "qa_index_passages": len(self.qa_index),
+                "qa_index_tokens": self.qa_index.total_tokens,
+                "llm_client": self.llm_client.client.get_stats(),
                 "session_start_time": self.session_start_time,
                 "save_path": self.save_path
             }
@@ -262,61 +546,93 @@ class LLMProcessorService:
     def get_content_as_text(self) -> str:
         """
         将所有结构化内容转换为纯文本字符串
-        用于问答功能
+        （问答不再整体发送，见 build_qa_context）
 
         Returns:
             格式化的文本内容
         """
-        with self.lock:
-            if not self.structured_content:
-                return ""
+        content = self.get_all_content()
+        if not content:
+            return ""
 
-            text_parts = []
+        text_parts = []
 
-            for idx, batch in enumerate(self.structured_content, 1):
-                text_parts.append(f"=== Batch {idx} ===\n")
+        for idx, batch in enumerate(content, 1):
+            text_parts.append(f"=== Batch {idx} ===\n")
 
-                # Coursework
-                if batch.get("coursework"):
-                    text_parts.append("【课程安排】\n")
-                    for item in batch["coursework"]:
-                        text_parts.append(f"- {item}\n")
-                    text_parts.append("\n")
+            # Coursework
+            if batch.get("coursework"):
+                text_parts.append("【课程安排】\n")
+                for item in batch["coursework"]:
+                    text_parts.append(f"- {item}\n")
+                text_parts.append("\n")
 
-                # Knowledge
-                if batch.get("knowledge"):
-                    text_parts.append("【知识点】\n")
-                    for item in batch["knowledge"]:
-                        text_parts.append(f"- {item}\n")
-                    text_parts.append("\n")
+            # Knowledge
+            if batch.get("knowledge"):
+                text_parts.append("【知识点】\n")
+                for item in batch["knowledge"]:
+                    text_parts.append(f"- {item}\n")
+                text_parts.append("\n")
 
-                # Question
-                if batch.get("question"):
-                    text_parts.append("【问题】\n")
-                    for item in batch["question"]:
-                        text_parts.append(f"- {item}\n")
-                    text_parts.append("\n")
+            # Question
+            if batch.get("question"):
+                text_parts.append("【问题】\n")
+                for item in batch["question"]:
+                    text_parts.append(f"- {item}\n")
+                text_parts.append("\n")
 
-            return "".join(text_parts)
+        return "".join(text_parts)
 
-    def answer_question(self, user_input: str) -> str:
+    def build_qa_context(self, user_input: str) -> Tuple[List[Passage], str, str]:
         """
-        基于转写内容回答用户问题
+        选取问答用的课堂内容
 
-        Args:
-            user_input: 用户的问题
+        - full: 笔记条目和转写原文合计不超过 qa_max_tokens 时全部发送
+        - retrieval: 只发送与问题最相关的片段（BM25 top-k，预算内），剩余预算用最近的笔记条目补足
+          （“总结一下”这类问题几乎没有可匹配的词）
+        尚未加入索引的最近转写总是附在末尾。
 
         Returns:
-            LLM 的回答
+            (按时间顺序排列的片段, 最近转写, mode)
         """
-        # 获取当前所有转写内容
-        content = self.get_content_as_text()
-
-        if not content:
-            return "抱歉，当前还没有转写内容。请先开始转写。"
-
-        # 构建提示词
-        prompt = f"""<user_query>{user_input}</user_query>
+        with self.lock:
+            tail = " ".join(self._caption_window)
+            budget = max(self.qa_max_tokens - self._caption_window_tokens, 0)
+        index = self.qa_index
+
+        if index.total_tokens <= budget:
+            return index.passages[:], tail, "full"
+
+        passages = index.select(user_input, budget, self.qa_top_k)
+        used = sum(p.tokens for p in passages)
+        chosen = {p.id for p in passages}
+        for passage in reversed(index.passages[:]):
+            if used >= budget:
+                break
+            if passage.kind != "caption" and passage.id not in chosen and used + passage.tokens <= budget:
+                passages.append(passage)
+                used += passage.tokens
+        passages.sort(key=lambda p: p.id)
+        return passages, tail, "retrieval"
+
+    def build_qa_prompt(self, user_input: str) -> Optional[str]:
+        """问答提示词（用户问题 + 选取的课堂内容，见 build_qa_context）；还没有任何内容时返回 None"""
+        passages, tail, mode = self.build_qa_context(user_input)
+        if not passages and not tail:
+            return None
+
+        lines = []
+        if mode == "retrieval":
+            lines.append("（课堂内容较长，以下只列出与问题相关的部分和最近的笔记，按时间顺序排列）")
+        for p in passages:
+            label = _QA_LABELS.get(p.kind, p.kind)
+            lines.append(f"- [第{p.ref}批·{label}] {p.text}" if p.ref is not None else f"- [{label}] {p.text}")
+        if tail:
+            lines.append(f"- [最近转写] {tail}")
+        content = "\n".join(lines)
+        QA_CONTEXT_TOKENS.labels(mode=mode).observe(sum(p.tokens for p in passages) + estimate_tokens(tail))
+
+        return f"""<user_query>{user_input}</user_query>
 
 <class_content>
 {content}
@@ -325,13 +641,56 @@ class LLMProcessorService:
 请结合上述课堂内容回答用户的问题。如果用户问题是课堂设置（作业 考试 助教等）相关问题且课堂内容中没有相关信息，请明确告知用户；
 如果是知识问题且课堂内容中没有相关信息，则不影响正常回答，给出知识解答”。"""
 
+    def answer_question(self, user_input: str) -> str:
+        """
+        基于转写内容回答用户问题
+
+        Args:
+            user_input: 用户的问题
+
+        Returns:
+            LLM 的回答
+        """
+        prompt = self.build_qa_prompt(user_input)
+        if prompt is None:
+            return NO_CONTENT_ANSWER
+
         # 调用 LLM
         try:
-            response = self.llm_client.generate(prompt)
+            response = self._generate(prompt, kind="qa")
             return response
         except Exception as e:
             return f"回答问题时出错: {str(e)}"
 
+    async def astream_answer(self, user_input: str) -> AsyncIterator[str]:
+        """
+        answer_question() 的流式版本，逐块产出回答文本（在事件循环中迭代）
+
+        记录首个文本块的等待时间；迭代被取消时（客户端断开）上游请求随之关闭。
+        """
+        prompt = self.build_qa_prompt(user_input)
+        if prompt is None:
+            yield NO_CONTENT_ANSWER
+            return
+
+        t0 = time.perf_counter()
+        outcome = "error"
+        first = True
+        stream = self.llm_client.astream(prompt)
+        try:
+            async for delta in stream:
+                if first:
+                    LLM_FIRST_TOKEN_SECONDS.labels(kind="qa").observe(time.perf_counter() - t0)
+                    first = False
+                yield delta
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.labels(kind="qa_stream", outcome=outcome).observe(time.perf_counter() - t0)
+            await stream.aclose()
+
 
 # ====== 批量处理工具函数 ======
 def batch_process_from_json(input_json: str, output_json: str, chunk_size: int = 4):
@@ -368,9 +727,8 @@ def batch_process_from_json(input_json: str, output_json: str, chunk_size: int =
             transcript_text = ' '.join(chunk)
             prompt_trans = pre(prev) + transript_chunk(transcript_text)
 
-            # 调用 LLM
-            llm = DSV3()
-            resp = llm.generate(promptv2 + prompt_trans)
+            # 调用 LLM（复用服务的共享客户端）
+            resp = service.llm_client.generate(promptv2 + prompt_trans)
 
             # 提取 JSON
             resp_json = extract_json_object(resp)
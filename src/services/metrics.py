@@ -0,0 +1,394 @@
+"""
+Metrics
+进程内指标注册表（Counter / Gauge / Histogram），以 Prometheus 文本格式导出
+
+不依赖 prometheus_client；接口与其常用子集保持一致（labels()/inc()/set()/observe()/time()），
+各服务模块直接引用本文件中定义的指标对象。
+"""
+import math
+import threading
+import time
+from typing import Callable, Collection, Dict, List, Optional, Sequence, Tuple
+
+
+# 延迟类直方图的默认桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(v: float) -> str:
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape_label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ====== 指标类型 ======
+class _Metric:
+    """指标基类：按标签值组合管理子指标"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs) -> "_Metric":
+        """按标签值获取（或创建）子指标"""
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._new_child()
+                self._children[values] = child
+            return child
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        """子类实现：返回 (后缀, 标签串, 值)，不含自身标签"""
+        raise NotImplementedError
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        if self.labelnames:
+            with self._lock:
+                children = list(self._children.items())
+            for values, child in children:
+                for suffix, extra, value in child._samples_with(self.labelnames, values):
+                    lines.append(f"{self.name}{suffix}{extra} {_format_value(value)}")
+        else:
+            for suffix, extra, value in self._samples_with((), ()):
+                lines.append(f"{self.name}{suffix}{extra} {_format_value(value)}")
+        return lines
+
+    def _samples_with(self, names: Sequence[str], values: Sequence[str]) -> List[Tuple[str, str, float]]:
+        return [(suffix, _format_labels(names, values), v) for suffix, _extra, v in self._samples()]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self):
+        return [("_total", "", self._value)]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以绑定取值函数（如队列长度）"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, fn: Callable[[], float]):
+        """导出时调用 fn() 取值"""
+        self._fn = fn
+
+    @property
+    def value(self) -> float:
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def _samples(self):
+        return [("", "", self.value)]
+
+
+class _Timer:
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram(_Metric):
+    """累积桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        i = 0
+        n = len(self.buckets)
+        while i < n and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> _Timer:
+        """计时上下文：with HIST.time(): ..."""
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self):
+        return []
+
+    def _samples_with(self, names, values):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        out = []
+        acc = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            acc += c
+            out.append(("_bucket", _format_labels(names, values, ("le", _format_value(bound))), acc))
+        plain = _format_labels(names, values)
+        out.append(("_sum", plain, total))
+        out.append(("_count", plain, count))
+        return out
+
+
+# ====== 注册表 ======
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self, skip: Collection[str] = ()) -> str:
+        """
+        导出 Prometheus 文本格式（0.0.4）
+
+        Args:
+            skip: 不导出的指标名（由其他进程导出的同名指标）
+        """
+        with self._lock:
+            metrics = [m for m in self._metrics.values() if m.name not in skip]
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ====== 指标定义 ======
+# 音频转写
+VAD_INFERENCE_SECONDS = REGISTRY.histogram(
+    "classaudio_vad_inference_seconds",
+    "VAD inference time per batch of audio blocks",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+VAD_BATCH_BLOCKS = REGISTRY.histogram(
+    "classaudio_vad_batch_blocks",
+    "Audio blocks scored per VAD call",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+DECODE_SECONDS = REGISTRY.histogram(
+    "classaudio_decode_seconds",
+    "Whisper decode duration",
+    labelnames=("stage",),
+)
+DECODE_AUDIO_SECONDS = REGISTRY.histogram(
+    "classaudio_decode_audio_seconds",
+    "Audio length passed to each Whisper decode",
+    labelnames=("stage",),
+    buckets=(0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+EVENT_QUEUE_LAG_SECONDS = REGISTRY.histogram(
+    "classaudio_event_queue_lag_seconds",
+    "Delay between VAD emitting an utterance event and the transcriber picking it up",
+    labelnames=("kind",),
+)
+QUEUE_DROPS_TOTAL = REGISTRY.counter(
+    "classaudio_queue_dropped_items",
+    "Items dropped because a bounded queue was full",
+    labelnames=("queue",),
+)
+QUEUE_SIZE = REGISTRY.gauge(
+    "classaudio_queue_size",
+    "Current number of items in a queue",
+    labelnames=("queue",),
+)
+INPUT_OVERFLOWS_TOTAL = REGISTRY.counter(
+    "classaudio_input_overflows",
+    "Input overflows reported by the audio device callback",
+)
+CAPTIONS_TOTAL = REGISTRY.counter(
+    "classaudio_captions",
+    "Captions emitted",
+    labelnames=("type",),
+)
+FINAL_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "classaudio_final_queue_wait_seconds",
+    "Time a finished utterance waits before its final decode starts",
+)
+FINAL_BATCH_SIZE = REGISTRY.histogram(
+    "classaudio_final_batch_size",
+    "Utterances decoded per batched final decode",
+    buckets=(2, 3, 4, 6, 8, 12, 16),
+)
+FINAL_REJECTED_TOTAL = REGISTRY.counter(
+    "classaudio_final_rejected",
+    "Final decodes rejected by the quality filter",
+)
+CAPTION_WRITE_SECONDS = REGISTRY.histogram(
+    "classaudio_caption_write_seconds",
+    "Time the caption writer thread spends writing (and fsyncing) one batch of session records",
+)
+PARTIAL_SKIPS_TOTAL = REGISTRY.counter(
+    "classaudio_partial_skipped",
+    "Partial decodes skipped by the scheduler",
+    labelnames=("reason",),
+)
+PARTIAL_INTERVAL_SECONDS = REGISTRY.gauge(
+    "classaudio_partial_interval_seconds",
+    "Current partial decode interval chosen by the scheduler",
+)
+PARTIAL_TAIL_SECONDS = REGISTRY.gauge(
+    "classaudio_partial_tail_seconds",
+    "Current partial decode window chosen by the scheduler when nothing is committed yet",
+)
+
+# LLM
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "classaudio_llm_request_seconds",
+    "LLM call latency",
+    labelnames=("kind", "outcome"),
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "classaudio_llm_first_token_seconds",
+    "Time from sending a streaming LLM request to receiving the first text chunk",
+    labelnames=("kind",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0),
+)
+LLM_NOTE_LAG_SECONDS = REGISTRY.histogram(
+    "classaudio_llm_note_lag_seconds",
+    "Time from the first caption of an LLM batch arriving to its structured notes being stored",
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+LLM_SPECULATION_TOTAL = REGISTRY.counter(
+    "classaudio_llm_speculative_batches",
+    "Pipelined LLM batches by how their speculative supplement turned out (exact / accepted / rerun)",
+    labelnames=("outcome",),
+)
+LLM_LAG_SAVED_SECONDS_TOTAL = REGISTRY.counter(
+    "classaudio_llm_lag_saved_seconds",
+    "Estimated note lag saved by pipelining versus processing the same batches strictly in order",
+)
+QA_CONTEXT_TOKENS = REGISTRY.histogram(
+    "classaudio_qa_context_tokens",
+    "Estimated tokens of class content put into each Q&A prompt",
+    labelnames=("mode",),
+    buckets=(100, 250, 500, 1000, 1500, 2000, 4000, 8000, 16000, 32000),
+)
+
+# API
+WS_CLIENTS = REGISTRY.gauge(
+    "classaudio_websocket_clients",
+    "Connected caption WebSocket clients",
+)
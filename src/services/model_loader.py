@@ -0,0 +1,335 @@
+"""
+Model Loader
+模型加载：VAD 与 Whisper 模型在后台并行加载并预热，逐模型记录状态
+
+Whisper 支持 dual（partial / final 各一个模型）或 single（一个模型同时服务两条路径）。
+服务只持有 partial_model / final_model 两个引用，single 模式下二者指向同一实例，
+解码参数（beam、patience、窗口）仍按路径区分，服务代码无需感知当前模式。
+"""
+import os
+import time
+import functools
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import (
+    SR, BLOCK_SAMPLES, LANGUAGE, TEMPERATURE,
+    MODEL_DIR_PARTIAL, MODEL_DIR_FINAL, COMPUTE_TYPE_PARTIAL, COMPUTE_TYPE_FINAL,
+    BEAM_SIZE, PARTIAL_BEAM_SIZE,
+    WHISPER_MODEL_MODE, SINGLE_MODEL_SOURCE, SINGLE_MODEL_NUM_WORKERS,
+    MODEL_LOAD_PARALLEL, MODEL_WARMUP, MODEL_WARMUP_SEC,
+)
+from src.services.hw_profile import core_budgets, resolve_runtime
+from src.services.vad_engine import load_vad_engine
+
+
+logger = logging.getLogger('ModelLoader')
+
+
+@dataclass
+class ModelLoadReport:
+    """模型加载报告"""
+    mode: str  # "dual" | "single"
+    shared_model: Optional[str] = None  # single 模式下共用的模型路径
+    runtime: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # 每个模型的 device / compute_type / 线程数
+    profile_sec: Dict[str, float] = field(default_factory=dict)  # 硬件自动配置耗时（命中缓存时接近 0）
+    load_sec: Dict[str, float] = field(default_factory=dict)  # 每个模型的加载耗时
+    warmup_sec: Dict[str, float] = field(default_factory=dict)  # 每个模型的预热耗时
+    rss_delta_mb: Dict[str, Optional[float]] = field(default_factory=dict)  # 每个模型加载前后的常驻内存增量（并行加载时相互重叠）
+    rss_mb: Optional[float] = None  # 加载完成后的进程常驻内存
+    saved_mb: float = 0.0  # single 模式下未加载的模型的估算内存
+    wall_sec: Optional[float] = None  # 全部模型就绪的总耗时（并行加载时小于各模型耗时之和）
+
+    @property
+    def total_load_sec(self) -> float:
+        return sum(self.load_sec.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["total_load_sec"] = round(self.total_load_sec, 2)
+        return d
+
+
+def process_rss_mb() -> Optional[float]:
+    """当前进程常驻内存（MB），无法获取时返回 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def estimate_model_mb(model_dir: str, compute_type: str) -> float:
+    """
+    按模型文件大小和 compute_type 估算一个模型实例的常驻内存（MB）
+
+    CTranslate2 加载时按 compute_type 转换权重，float16 文件转 float32 约翻倍
+    """
+    size = 0
+    for root, _dirs, files in os.walk(model_dir):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    size_mb = size / 1024 / 1024
+
+    if compute_type == "float32":
+        factor = 2.0
+    elif compute_type.startswith("int8"):
+        factor = 0.55
+    else:
+        factor = 1.0
+    return size_mb * factor + 300.0  # 运行时开销（解码缓冲、特征提取）
+
+
+def _load(model_dir: str, compute_type: str, report: ModelLoadReport, key: str,
+          beam_size: int, num_workers: int = 1):
+    from faster_whisper import WhisperModel
+
+    t0 = time.perf_counter()
+    # dual 模式下 partial / final 并发解码，各自只在分到的物理核内选线程数
+    choice = resolve_runtime(model_dir, compute_type, beam_size=beam_size, num_workers=num_workers,
+                             max_threads=core_budgets()[key])
+    report.profile_sec[key] = round(time.perf_counter() - t0, 2)
+    report.runtime[key] = asdict(choice)
+
+    rss0 = process_rss_mb()
+    t0 = time.perf_counter()
+    model = WhisperModel(model_dir, **choice.model_kwargs())
+    report.load_sec[key] = round(time.perf_counter() - t0, 2)
+    rss1 = process_rss_mb()
+    report.rss_delta_mb[key] = round(rss1 - rss0, 1) if rss0 is not None and rss1 is not None else None
+    return model
+
+
+def warmup_whisper(model, beam_size: int, word_timestamps: bool = False, seconds: float = MODEL_WARMUP_SEC):
+    """解码一段静音，触发 CTranslate2 / CUDA 的首次初始化"""
+    audio = np.zeros((int(seconds * SR),), dtype=np.float32)
+    segments, _info = model.transcribe(
+        audio,
+        language=LANGUAGE,
+        beam_size=beam_size,
+        temperature=TEMPERATURE,
+        condition_on_previous_text=False,
+        vad_filter=False,
+        word_timestamps=word_timestamps,
+    )
+    for _ in segments:
+        pass
+
+
+def whisper_load_plan(mode: str) -> List[Tuple[str, str, str, int, int, Tuple[str, ...]]]:
+    """
+    Whisper 模型加载计划
+
+    Returns:
+        [(key, model_dir, compute_type, beam_size, num_workers, targets), ...]；
+        targets 为该模型服务的路径（"partial" / "final"）
+    """
+    if mode == "dual":
+        return [
+            ("partial", MODEL_DIR_PARTIAL, COMPUTE_TYPE_PARTIAL, PARTIAL_BEAM_SIZE, 1, ("partial",)),
+            ("final", MODEL_DIR_FINAL, COMPUTE_TYPE_FINAL, BEAM_SIZE, 1, ("final",)),
+        ]
+    if mode == "single":
+        if SINGLE_MODEL_SOURCE == "final":
+            model_dir, compute_type = MODEL_DIR_FINAL, COMPUTE_TYPE_FINAL
+        elif SINGLE_MODEL_SOURCE == "partial":
+            model_dir, compute_type = MODEL_DIR_PARTIAL, COMPUTE_TYPE_PARTIAL
+        else:
+            raise ValueError(f"Unknown SINGLE_MODEL_SOURCE: {SINGLE_MODEL_SOURCE}")
+        # num_workers > 1：partial 与 final 线程可以并发调用同一个模型
+        return [("shared", model_dir, compute_type, BEAM_SIZE, SINGLE_MODEL_NUM_WORKERS, ("partial", "final"))]
+    raise ValueError(f"Unknown WHISPER_MODEL_MODE: {mode}")
+
+
+# ====== 后台加载 ======
+MODEL_NAMES = ("vad", "partial", "final")
+
+
+@dataclass
+class ModelStatus:
+    """单个模型的加载状态"""
+    state: str = "pending"  # "pending" | "loading" | "warming" | "ready" | "failed"
+    load_sec: Optional[float] = None
+    warmup_sec: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ModelLoader:
+    """
+    模型加载器
+
+    VAD、partial、final 模型各用一个线程并行加载（CTranslate2 / ONNX 加载时释放 GIL），
+    加载完成后预热，再通过 on_ready(name, obj) 交给服务；状态可随时查询，也可以等待就绪。
+    """
+
+    def __init__(
+        self,
+        on_ready: Callable[[str, Any], None],
+        mode: str = WHISPER_MODEL_MODE,
+        parallel: bool = MODEL_LOAD_PARALLEL,
+        warmup: bool = MODEL_WARMUP,
+    ):
+        self.on_ready = on_ready
+        self.mode = mode
+        self.parallel = parallel
+        self.warmup = warmup
+        self.plan = whisper_load_plan(mode)
+        self.report = ModelLoadReport(mode=mode)
+
+        self._cond = threading.Condition()
+        self._status: Dict[str, ModelStatus] = {name: ModelStatus() for name in MODEL_NAMES}
+        self._thread: Optional[threading.Thread] = None
+        self.done = threading.Event()
+
+    # ====== 状态 ======
+    def _set(self, names: Sequence[str], state: str, **fields):
+        with self._cond:
+            for name in names:
+                st = self._status[name]
+                st.state = state
+                for k, v in fields.items():
+                    setattr(st, k, v)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各模型状态（用于 /health 和 /api/status）"""
+        with self._cond:
+            return {name: asdict(st) for name, st in self._status.items()}
+
+    def is_ready(self, names: Sequence[str] = MODEL_NAMES) -> bool:
+        with self._cond:
+            return all(self._status[n].state == "ready" for n in names)
+
+    def errors(self, names: Sequence[str] = MODEL_NAMES) -> Dict[str, str]:
+        """加载失败的模型及错误信息"""
+        with self._cond:
+            return {n: self._status[n].error or "" for n in names if self._status[n].state == "failed"}
+
+    def wait(self, names: Sequence[str] = MODEL_NAMES, timeout: Optional[float] = None) -> bool:
+        """
+        等待指定模型就绪
+
+        Returns:
+            全部就绪为 True；超时或其中有模型加载失败时为 False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                states = [self._status[n].state for n in names]
+                if all(s == "ready" for s in states):
+                    return True
+                if "failed" in states:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    # ====== 加载 ======
+    def start(self) -> threading.Thread:
+        """在后台线程中加载全部模型，立即返回"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load_all, name="ModelLoader", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def load_all(self):
+        """加载全部模型（阻塞，直到每个模型都就绪或失败）"""
+        t0 = time.perf_counter()
+        tasks: List[Tuple[str, Callable[[], None]]] = [("vad", self._load_vad)]
+        for entry in self.plan:
+            tasks.append((entry[0], functools.partial(self._load_whisper, *entry)))
+
+        if self.parallel:
+            threads = [threading.Thread(target=fn, name=f"ModelLoader-{name}", daemon=True) for name, fn in tasks]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        else:
+            for _name, fn in tasks:
+                fn()
+
+        if self.mode == "single":
+            model_dir = self.plan[0][1]
+            self.report.shared_model = model_dir
+            skipped_dir, skipped_type = (
+                (MODEL_DIR_PARTIAL, COMPUTE_TYPE_PARTIAL) if model_dir == MODEL_DIR_FINAL
+                else (MODEL_DIR_FINAL, COMPUTE_TYPE_FINAL)
+            )
+            self.report.saved_mb = round(estimate_model_mb(skipped_dir, skipped_type), 1)
+
+        rss = process_rss_mb()
+        self.report.rss_mb = round(rss, 1) if rss is not None else None
+        self.report.wall_sec = round(time.perf_counter() - t0, 2)
+
+        errors = self.errors()
+        if errors:
+            logger.error(f"Model loading failed: {errors}")
+        else:
+            logger.info(
+                f"Models ready: mode={self.mode}, wall={self.report.wall_sec:.1f}s, "
+                f"load={self.report.total_load_sec:.1f}s, rss={self.report.rss_mb} MB, saved~{self.report.saved_mb} MB"
+            )
+        self.done.set()
+
+    def _load_vad(self):
+        names = ("vad",)
+        try:
+            self._set(names, "loading")
+            t0 = time.perf_counter()
+            engine = load_vad_engine()
+            load_sec = round(time.perf_counter() - t0, 2)
+
+            warmup_sec = None
+            if self.warmup:
+                self._set(names, "warming", load_sec=load_sec)
+                t0 = time.perf_counter()
+                engine.score(np.zeros((1, BLOCK_SAMPLES), dtype=np.float32))
+                engine.reset()
+                warmup_sec = round(time.perf_counter() - t0, 3)
+
+            print(f"VAD backend: {engine.name}")
+            self.on_ready("vad", engine)
+            self._set(names, "ready", load_sec=load_sec, warmup_sec=warmup_sec)
+        except Exception as e:
+            logger.exception("Failed to load VAD model")
+            self._set(names, "failed", error=str(e))
+
+    def _load_whisper(self, key: str, model_dir: str, compute_type: str, beam_size: int,
+                      num_workers: int, targets: Tuple[str, ...]):
+        try:
+            self._set(targets, "loading")
+            print(f"Loading Whisper {key} model...")
+            t0 = time.perf_counter()
+            model = _load(model_dir, compute_type, self.report, key, beam_size, num_workers=num_workers)
+            load_sec = round(time.perf_counter() - t0, 2)
+
+            warmup_sec = None
+            if self.warmup:
+                self._set(targets, "warming", load_sec=load_sec)
+                t0 = time.perf_counter()
+                # partial 路径使用词级时间戳，预热时一并初始化对齐部分
+                warmup_whisper(model, beam_size, word_timestamps="partial" in targets)
+                warmup_sec = round(time.perf_counter() - t0, 3)
+                self.report.warmup_sec[key] = warmup_sec
+
+            for name in targets:
+                self.on_ready(name, model)
+            self._set(targets, "ready", load_sec=load_sec, warmup_sec=warmup_sec)
+        except Exception as e:
+            logger.exception(f"Failed to load Whisper {key} model")
+            self._set(targets, "failed", error=str(e))
@@ -0,0 +1,166 @@
+"""
+Notes Store
+结构化笔记的会话存储：每个批次追加一行 JSONL，只写一次
+
+记录格式（每行一个 JSON 对象）：
+    {"op": "batch", "batch": 序号, "t": 写入时间, "content": {...}, "supplement": "..."}
+    {"op": "clear", "t": 写入时间}        # 清空笔记（之前的批次作废）
+
+- append / clear 只追加一行并 flush + fsync，耗时与已有批次数无关
+- compact() 重写 JSONL，去掉最后一次 clear 之前的记录和损坏的行（如进程崩溃留下的半行）
+- export_json() 导出旧版 <session>_content.json 格式（content 列表，indent=2）
+- iter_records() / load_contents() 逐行读取，不整体载入文件
+
+手动压缩 / 导出：
+    python -m src.services.notes_store compact data/logs/20260118_143025_content.jsonl
+    python -m src.services.notes_store export data/logs/20260118_143025_content.jsonl [out.json]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class NotesStore:
+    """追加写的 JSONL 笔记文件（写入串行化；读取不经过本对象的锁）"""
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync  # 每条记录写入后 fsync（批次间隔以分钟计，代价可以忽略）
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def append_batch(self, batch: int, content: Dict[str, Any], supplement: str):
+        self._append({"op": "batch", "batch": batch, "t": time.time(), "content": content, "supplement": supplement})
+
+    def append_clear(self):
+        self._append({"op": "clear", "t": time.time()})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ====== 维护 ======
+    def compact(self) -> Tuple[int, int]:
+        """
+        重写文件，只保留当前有效的批次
+
+        Returns:
+            (保留的批次数, 丢弃的行数)
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.isfile(self.path):
+                return 0, 0
+
+            kept: List[Dict[str, Any]] = []
+            dropped = 0
+            for record in iter_records(self.path, strict=False):
+                if record is None:
+                    dropped += 1
+                elif record.get("op") == "clear":
+                    dropped += len(kept) + 1
+                    kept = []
+                elif record.get("op") == "batch":
+                    kept.append(record)
+                else:
+                    dropped += 1
+
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for record in kept:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        return len(kept), dropped
+
+    def export_json(self, out_path: Optional[str] = None) -> str:
+        """导出为旧版 JSON（content 列表）；默认与 JSONL 同名、扩展名为 .json"""
+        out_path = out_path or os.path.splitext(self.path)[0] + ".json"
+        contents, _supplements = load_contents(self.path)
+        tmp = out_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(contents, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, out_path)
+        return out_path
+
+
+# ====== 读取 ======
+def iter_records(path: str, strict: bool = True) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    逐行读取记录
+
+    Args:
+        strict: False 时损坏的行产出 None 而不是抛异常（compact 用来统计）；
+                True 时只跳过文件末尾的半行（崩溃时未写完）
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                if not strict:
+                    yield None
+                elif line.endswith("\n"):
+                    raise
+                # 末尾未写完的半行：忽略
+
+
+def load_contents(path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    重放文件得到当前的 (content 列表, supplement 列表)
+
+    同时兼容旧版 *_content.json（整个文件是 content 列表）
+    """
+    if not path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f), []
+
+    contents: List[Dict[str, Any]] = []
+    supplements: List[str] = []
+    for record in iter_records(path):
+        op = record.get("op")
+        if op == "clear":
+            contents, supplements = [], []
+        elif op == "batch":
+            contents.append(record.get("content", {}))
+            supplements.append(record.get("supplement", ""))
+    return contents, supplements
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("compact", "export"):
+        print("Usage: python -m src.services.notes_store compact|export <file.jsonl> [out.json]")
+        sys.exit(2)
+
+    store = NotesStore(sys.argv[2])
+    if sys.argv[1] == "compact":
+        n_kept, n_dropped = store.compact()
+        print(f"Compacted {store.path}: kept {n_kept} batches, dropped {n_dropped} lines")
+    else:
+        out = store.export_json(sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Exported {store.path} -> {out}")
@@ -0,0 +1,244 @@
+"""
+Parallel Transcription
+长录音离线并行转写：按 Silero VAD 边界切分，多进程各自持有一个 WhisperModel 副本解码
+"""
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple, Dict, Any
+
+import numpy as np
+
+from src.config import (
+    SR, BLOCK_SAMPLES, LANGUAGE, BEAM_SIZE, TEMPERATURE, PATIENCE, DEFAULT_PROF_WORDS,
+    MODEL_DIR_FINAL, PARALLEL_WORKERS, PARALLEL_DEVICE, PARALLEL_COMPUTE_TYPE,
+    PARALLEL_MAX_MEMORY_MB, PARALLEL_REPLICA_MB,
+)
+from src.services.audio_service import (
+    SpeechSegmenter, CaptionOutput, FileTranscriptionResult,
+    int16_to_float32, transcribe_once, check_final_text, format_media_time,
+)
+from src.services.audio_source import read_audio_file
+from src.services.model_loader import estimate_model_mb
+from src.services.vad_engine import VADEngine, load_vad_engine
+
+
+logger = logging.getLogger('Parallel')
+
+MIN_SEGMENT_SEC = 0.6  # 与 finalize_sentence 的最短时长一致
+VAD_SCORE_CHUNK = 1024  # 离线切分时每次推理的块数
+
+# 工作进程内的模型（每个进程一个副本）
+_worker_model = None
+
+
+# ====== 资源规划 ======
+def estimate_replica_mb(model_dir: str = MODEL_DIR_FINAL, compute_type: str = PARALLEL_COMPUTE_TYPE) -> float:
+    """
+    估算单个模型副本的常驻内存（MB）
+
+    PARALLEL_REPLICA_MB > 0 时直接使用配置值；否则按模型文件大小和 compute_type 估算
+    """
+    if PARALLEL_REPLICA_MB > 0:
+        return float(PARALLEL_REPLICA_MB)
+    return estimate_model_mb(model_dir, compute_type)
+
+
+def plan_workers(requested: int, max_memory_mb: float = PARALLEL_MAX_MEMORY_MB,
+                 replica_mb: Optional[float] = None) -> int:
+    """
+    根据内存上限和 CPU 核数确定实际进程数
+
+    Args:
+        requested: 期望的进程数
+        max_memory_mb: 所有副本合计的内存上限
+        replica_mb: 单副本内存，None 表示自动估算
+
+    Returns:
+        实际可用的进程数（至少 1）
+    """
+    replica_mb = replica_mb or estimate_replica_mb()
+    by_memory = max(1, int(max_memory_mb // replica_mb))
+
+    # 如果安装了 psutil，再以当前可用内存的 80% 为限
+    try:
+        import psutil
+        available_mb = psutil.virtual_memory().available / 1024 / 1024
+        by_memory = min(by_memory, max(1, int(available_mb * 0.8 // replica_mb)))
+    except ImportError:
+        pass
+
+    workers = max(1, min(requested, by_memory, os.cpu_count() or 1))
+    if workers < requested:
+        logger.info(f"Workers capped {requested} -> {workers} (replica ~{replica_mb:.0f} MB, cap {max_memory_mb} MB)")
+    return workers
+
+
+# ====== VAD 切分 ======
+def split_speech_segments(audio_i16: np.ndarray, vad_engine: VADEngine) -> List[Tuple[int, int]]:
+    """
+    按实时服务相同的 VAD 规则切分整段音频
+
+    Returns:
+        [(start_sample, end_sample), ...]，按时间顺序
+    """
+    vad_engine.reset()
+    segmenter = SpeechSegmenter()
+    segments: List[Tuple[int, int]] = []
+    start: Optional[int] = None
+
+    def handle(events):
+        nonlocal start
+        for evt in events:
+            if evt.kind == "START":
+                start = evt.pos
+            elif evt.kind == "END" and start is not None:
+                segments.append((start, min(evt.pos, audio_i16.size)))
+                start = None
+
+    # 补零到整块后 reshape，避免逐块切片
+    pad = (-audio_i16.size) % BLOCK_SAMPLES
+    blocks = np.pad(audio_i16, (0, pad)).reshape(-1, BLOCK_SAMPLES) if pad else audio_i16.reshape(-1, BLOCK_SAMPLES)
+    for i in range(0, blocks.shape[0], VAD_SCORE_CHUNK):
+        chunk = int16_to_float32(blocks[i:i + VAD_SCORE_CHUNK])
+        probs = vad_engine.score(chunk)
+        for block_f32, prob in zip(chunk, probs):
+            handle(segmenter.push(block_f32, prob))
+    handle(segmenter.flush())
+
+    return segments
+
+
+# ====== 工作进程 ======
+def _init_worker(model_dir: str, device: str, compute_type: str, cpu_threads: int):
+    """工作进程初始化：加载本进程的模型副本"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(
+        model_dir,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=1,
+    )
+
+
+def _decode_segment(idx: int, audio_i16: np.ndarray, prompt: str) -> Dict[str, Any]:
+    """在工作进程中解码一个语音段（以 int16 传输，减半进程间拷贝量）"""
+    t0 = time.perf_counter()
+    text, info = transcribe_once(
+        _worker_model,
+        int16_to_float32(audio_i16),
+        language=LANGUAGE,
+        beam_size=BEAM_SIZE,
+        temperature=TEMPERATURE,
+        patience=PATIENCE,
+        initial_prompt=prompt,
+        condition_on_previous_text=True,
+        vad_filter=True,
+    )
+    return {
+        "idx": idx,
+        "text": (text or "").strip(),
+        "no_speech_prob": getattr(info, "no_speech_prob", None),
+        "avg_logprob": getattr(info, "avg_logprob", None),
+        "decode_sec": time.perf_counter() - t0,
+        "pid": os.getpid(),
+    }
+
+
+# ====== 入口 ======
+def transcribe_file_parallel(
+    path: str,
+    workers: int = PARALLEL_WORKERS,
+    *,
+    prof_words: Optional[str] = None,
+    raw_sample_rate: Optional[int] = None,
+    model_dir: str = MODEL_DIR_FINAL,
+    device: str = PARALLEL_DEVICE,
+    compute_type: str = PARALLEL_COMPUTE_TYPE,
+    max_memory_mb: float = PARALLEL_MAX_MEMORY_MB,
+    vad_engine: Optional[VADEngine] = None,
+) -> FileTranscriptionResult:
+    """
+    多进程并行转写音频文件
+
+    Args:
+        path: 音频文件路径
+        workers: 期望的进程数（受内存上限和 CPU 核数约束）
+        prof_words: 专业词汇提示词，默认 DEFAULT_PROF_WORDS
+        raw_sample_rate: 原始 PCM 的采样率
+        model_dir / device / compute_type: 每个副本的模型配置
+        max_memory_mb: 所有副本合计的内存上限
+        vad_engine: 复用已加载的 VAD 引擎
+
+    Returns:
+        FileTranscriptionResult，字幕按原始顺序排列，时间戳相对文件开始
+    """
+    t0 = time.perf_counter()
+    audio_i16 = read_audio_file(path, raw_sample_rate=raw_sample_rate)
+    audio_sec = audio_i16.size / SR
+
+    vad_engine = vad_engine or load_vad_engine()
+    segments = [
+        (s, e) for s, e in split_speech_segments(audio_i16, vad_engine)
+        if (e - s) / SR >= MIN_SEGMENT_SEC
+    ]
+    logger.info(f"{path}: {audio_sec:.1f}s audio, {len(segments)} speech segments")
+
+    n_workers = plan_workers(
+        min(workers, max(1, len(segments))),
+        max_memory_mb=max_memory_mb,
+        replica_mb=estimate_replica_mb(model_dir, compute_type),
+    )
+    cpu_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    prompt = prof_words or DEFAULT_PROF_WORDS
+
+    results: Dict[int, Dict[str, Any]] = {}
+    if segments:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(model_dir, device, compute_type, cpu_threads),
+        ) as pool:
+            # 长段先提交，减少尾部空闲
+            order = sorted(range(len(segments)), key=lambda i: segments[i][0] - segments[i][1])
+            futures = [
+                pool.submit(_decode_segment, i, audio_i16[segments[i][0]:segments[i][1]], prompt)
+                for i in order
+            ]
+            for fut in as_completed(futures):
+                r = fut.result()
+                results[r["idx"]] = r
+
+    captions: List[CaptionOutput] = []
+    for i, (start, end) in enumerate(segments):
+        r = results.get(i)
+        if r is None:
+            continue
+        reason = check_final_text(r["text"], r["no_speech_prob"], r["avg_logprob"])
+        if reason is not None:
+            logger.debug(f"Segment {i} rejected: {reason}")
+            continue
+        captions.append(CaptionOutput(
+            type="accurate",
+            text=r["text"],
+            timestamp=format_media_time(start / SR),
+            no_speech_prob=r["no_speech_prob"],
+            avg_logprob=r["avg_logprob"],
+            audio_start=start / SR,
+            audio_end=end / SR,
+        ))
+
+    return FileTranscriptionResult(
+        path=path,
+        captions=captions,
+        audio_sec=audio_sec,
+        elapsed_sec=time.perf_counter() - t0,
+        workers=n_workers,
+    )
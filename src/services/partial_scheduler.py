@@ -0,0 +1,134 @@
+"""
+Partial Scheduler
+自适应 partial 解码调度：根据实测解码耗时（EMA）和事件队列积压调整 partial 的间隔与窗口长度，
+保证 partial 不拖慢 final 字幕
+"""
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from src.config import (
+    BLOCK_MS, PARTIAL_UPDATE_MS, PARTIAL_MIN_SEC, PARTIAL_TAIL_SEC,
+    PARTIAL_ADAPTIVE, PARTIAL_MAX_UPDATE_MS, PARTIAL_DUTY, PARTIAL_MAX_BACKLOG_MS, PARTIAL_EMA_ALPHA,
+)
+from src.services.metrics import PARTIAL_SKIPS_TOTAL, PARTIAL_INTERVAL_SECONDS, PARTIAL_TAIL_SECONDS
+
+
+@dataclass
+class PartialDecision:
+    """一次调度决策"""
+    run: bool
+    reason: str  # "run" | "end_pending" | "backlog" | "interval"
+    tail_sec: float
+
+
+class PartialScheduler:
+    """
+    partial 解码调度器
+
+    - 间隔（上次解码结束到下次开始）：max(PARTIAL_UPDATE_MS, EMA 解码耗时 * (1 / PARTIAL_DUTY - 1))，
+      上限 PARTIAL_MAX_UPDATE_MS，即 partial 解码最多占用 PARTIAL_DUTY 的实时时间
+    - 窗口：按 EMA 的每秒音频解码代价，把单次解码控制在 PARTIAL_UPDATE_MS 左右
+    - 有 END 事件等待处理，或 evt_q 积压超过 PARTIAL_MAX_BACKLOG_MS 的音频时直接跳过
+    """
+
+    def __init__(self, adaptive: bool = PARTIAL_ADAPTIVE):
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+
+        self.ema_latency_sec = 0.0
+        self.ema_cost_per_sec = 0.0  # 每秒音频的解码耗时
+        self.interval_sec = PARTIAL_UPDATE_MS / 1000.0
+        self.tail_sec = PARTIAL_TAIL_SEC
+
+        self.last_run_t = 0.0
+        self.last_reason = "run"
+        self.last_backlog_ms = 0.0
+        self.runs = 0
+        self.skips: Dict[str, int] = {}
+
+        self._publish()
+
+    def reset_sentence(self):
+        """新句子开始：第一次 partial 不受间隔限制"""
+        with self._lock:
+            self.last_run_t = 0.0
+
+    def decide(self, now_t: float, evt_backlog: int, end_pending: Callable[[], bool]) -> PartialDecision:
+        """
+        决定本次是否执行 partial 解码
+
+        Args:
+            now_t: time.monotonic()
+            evt_backlog: evt_q 中等待的事件数（每个 CHUNK 为一个 VAD 块）
+            end_pending: 返回 evt_q 中是否已有 END 事件（需要扫描队列，放在最后检查）
+        """
+        with self._lock:
+            backlog_ms = evt_backlog * BLOCK_MS
+            self.last_backlog_ms = backlog_ms
+
+            if not self.adaptive:
+                if self.last_run_t != 0.0 and (now_t - self.last_run_t) * 1000.0 < PARTIAL_UPDATE_MS:
+                    return self._skip("interval")
+                return self._run()
+
+            if self.last_run_t != 0.0 and now_t - self.last_run_t < self.interval_sec:
+                return self._skip("interval")
+            if backlog_ms > PARTIAL_MAX_BACKLOG_MS:
+                return self._skip("backlog")
+            if end_pending():
+                return self._skip("end_pending")
+            return self._run()
+
+    def record(self, decode_sec: float, audio_sec: float, end_t: float):
+        """记录一次 partial 解码的耗时（end_t 为解码结束的 time.monotonic()），更新间隔与窗口"""
+        with self._lock:
+            self.last_run_t = end_t
+            a = PARTIAL_EMA_ALPHA
+            if self.ema_latency_sec == 0.0:
+                self.ema_latency_sec = decode_sec
+            else:
+                self.ema_latency_sec = (1 - a) * self.ema_latency_sec + a * decode_sec
+
+            if audio_sec > 0:
+                cost = decode_sec / audio_sec
+                self.ema_cost_per_sec = cost if self.ema_cost_per_sec == 0.0 else (1 - a) * self.ema_cost_per_sec + a * cost
+
+            if self.adaptive:
+                base = PARTIAL_UPDATE_MS / 1000.0
+                gap = self.ema_latency_sec * (1.0 / PARTIAL_DUTY - 1.0)
+                self.interval_sec = min(max(base, gap), PARTIAL_MAX_UPDATE_MS / 1000.0)
+                if self.ema_cost_per_sec > 0:
+                    self.tail_sec = min(max(base / self.ema_cost_per_sec, PARTIAL_MIN_SEC), PARTIAL_TAIL_SEC)
+            self._publish()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前调度状态（用于 /api/status）"""
+        with self._lock:
+            return {
+                "adaptive": self.adaptive,
+                "interval_ms": round(self.interval_sec * 1000.0, 1),
+                "tail_sec": round(self.tail_sec, 2),
+                "ema_decode_ms": round(self.ema_latency_sec * 1000.0, 1),
+                "ema_cost_per_audio_sec": round(self.ema_cost_per_sec, 4),
+                "event_backlog_ms": self.last_backlog_ms,
+                "last_decision": self.last_reason,
+                "runs": self.runs,
+                "skips": dict(self.skips),
+            }
+
+    def _run(self) -> PartialDecision:
+        self.last_reason = "run"
+        self.runs += 1
+        return PartialDecision(run=True, reason="run", tail_sec=self.tail_sec)
+
+    def _skip(self, reason: str) -> PartialDecision:
+        self.last_reason = reason
+        self.skips[reason] = self.skips.get(reason, 0) + 1
+        if reason != "interval":  # 间隔未到属于正常节奏，不计入指标
+            PARTIAL_SKIPS_TOTAL.labels(reason=reason).inc()
+        return PartialDecision(run=False, reason=reason, tail_sec=self.tail_sec)
+
+    def _publish(self):
+        PARTIAL_INTERVAL_SECONDS.set(self.interval_sec)
+        PARTIAL_TAIL_SECONDS.set(self.tail_sec)
@@ -0,0 +1,160 @@
+"""
+Retrieval Index
+问答用的进程内检索索引：BM25 词法检索，覆盖结构化笔记条目和 accurate 转写原文
+
+- 增量更新：每个片段加入时只追加倒排表，不重建索引（add 耗时与已有片段数无关）
+- 查询：倒排表按需转为 NumPy 数组（缓存到该词有新片段为止），只对包含查询词的片段打分
+- select()：按得分取 top-k 片段，在 token 预算内返回，结果按加入顺序（时间顺序）排列
+
+分词不依赖具体模型的分词器：英文 / 数字按词（小写），中日韩文字按相邻二字组（单字词保留单字）。
+线程安全：LLM 处理线程写入，API 线程查询。
+"""
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.services.transcript_chunker import estimate_tokens
+
+
+_TERM_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]")
+
+# 常见英文虚词（出现在几乎所有片段中，只增加打分开销）
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he i in is it its of on or so that the this "
+    "to was we were what when where which who why will with you".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """检索词列表（可重复）"""
+    terms: List[str] = []
+    for run in _TERM_RE.findall(text):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            word = run.lower()
+            if word not in _STOPWORDS:
+                terms.append(word)
+    return terms
+
+
+class Passage:
+    """一个可检索的片段"""
+    __slots__ = ("id", "kind", "ref", "text", "tokens")
+
+    def __init__(self, id: int, kind: str, ref: Optional[int], text: str, tokens: int):
+        self.id = id
+        self.kind = kind  # coursework / knowledge / question / caption
+        self.ref = ref  # 笔记条目所属批次序号（从 1 开始）；转写片段为 None
+        self.text = text
+        self.tokens = tokens  # estimate_tokens(text)，用于提示词预算
+
+
+class RetrievalIndex:
+    """BM25 倒排索引"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.passages: List[Passage] = []
+            self.total_tokens = 0
+            # 词 -> (片段 id 列表, 词频列表)；同一片段在每个词的列表中只出现一次
+            self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+            # 词 -> (缓存时的片段数, id 数组, 词频数组)
+            self._arrays: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+            self._lengths = np.zeros(256, dtype=np.float32)  # 各片段的检索词数（按容量倍增）
+            self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add(self, text: str, kind: str, ref: Optional[int] = None) -> Passage:
+        """加入一个片段"""
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+
+        with self.lock:
+            passage = Passage(len(self.passages), kind, ref, text, estimate_tokens(text))
+            self.passages.append(passage)
+            self.total_tokens += passage.tokens
+
+            if passage.id >= len(self._lengths):
+                self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+            self._lengths[passage.id] = len(terms)
+            self._total_length += len(terms)
+
+            for term, tf in counts.items():
+                ids, tfs = self._postings.setdefault(term, ([], []))
+                ids.append(passage.id)
+                tfs.append(tf)
+        return passage
+
+    def _posting_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """词的倒排表（NumPy 数组，调用方持有 self.lock）"""
+        posting = self._postings.get(term)
+        if posting is None:
+            return None
+        ids, tfs = posting
+        cached = self._arrays.get(term)
+        if cached is None or cached[0] != len(ids):
+            cached = (len(ids), np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            self._arrays[term] = cached
+        return cached[1], cached[2]
+
+    def search(self, query: str, top_k: int) -> List[Tuple[Passage, float]]:
+        """按 BM25 得分从高到低返回最多 top_k 个片段（只返回至少包含一个查询词的片段）"""
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.passages)
+            if n == 0 or not terms or top_k <= 0:
+                return []
+            lengths = self._lengths[:n]
+            avg_length = max(self._total_length / n, 1.0)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                arrays = self._posting_arrays(term)
+                if arrays is None:
+                    continue
+                ids, tfs = arrays
+                df = len(ids)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                # 同一词的 ids 互不重复，可直接按下标累加
+                scores[ids] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[ids])
+
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            order = matched[np.argsort(-scores[matched], kind="stable")]
+            return [(self.passages[i], float(scores[i])) for i in order]
+
+    def select(self, query: str, max_tokens: int, top_k: int) -> List[Passage]:
+        """
+        取检索得分最高的片段，总 token 数不超过 max_tokens
+
+        放不下的片段跳过（继续尝试得分更低但更短的片段）；结果按加入顺序排列。
+        """
+        chosen: List[Passage] = []
+        used = 0
+        for passage, _score in self.search(query, top_k):
+            if used + passage.tokens > max_tokens:
+                continue
+            chosen.append(passage)
+            used += passage.tokens
+        chosen.sort(key=lambda p: p.id)
+        return chosen
@@ -0,0 +1,103 @@
+"""
+Transcript Chunker
+LLM 批次切分策略：按 token 预算、最长等待时间和讲课停顿决定何时把转写缓冲区送去处理
+
+触发条件（满足任一即切出一个批次）：
+- 缓冲区 token 数达到 max_tokens（长段独白不再等）
+- 最早一条已等待 max_wait_sec（延迟上限，不论长短）
+- 距最后一条已停顿 silence_sec，且 token 数不少于 min_tokens（讲课自然停顿处切分，短句不单独调用 LLM）
+- 条数达到 max_captions（旧的固定条数策略；0 关闭）
+- flush()：停止录音时强制处理剩余内容
+
+本类不含线程和锁，时间由调用方传入（服务中为 time.monotonic()，模拟器中为回放时间）。
+"""
+import re
+from typing import List, Optional
+
+from src.config import (
+    LLM_CHUNK_SIZE, LLM_CHUNK_MIN_TOKENS, LLM_CHUNK_MAX_TOKENS, LLM_CHUNK_MAX_WAIT_SEC, LLM_CHUNK_SILENCE_SEC,
+)
+
+
+# 中日韩单字、连续的字母数字、其他单个符号各计一个 token（近似，不依赖具体模型的分词器）
+_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+class TranscriptChunker:
+    """转写缓冲区及其切分策略"""
+
+    def __init__(
+        self,
+        max_captions: int = LLM_CHUNK_SIZE,
+        min_tokens: int = LLM_CHUNK_MIN_TOKENS,
+        max_tokens: int = LLM_CHUNK_MAX_TOKENS,
+        max_wait_sec: float = LLM_CHUNK_MAX_WAIT_SEC,
+        silence_sec: float = LLM_CHUNK_SILENCE_SEC,
+    ):
+        """
+        Args:
+            max_captions / max_tokens / max_wait_sec / silence_sec: 各触发条件，0 表示关闭该条件
+            min_tokens: 停顿切分的最少 token 数
+        """
+        self.max_captions = max_captions
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_wait_sec = max_wait_sec
+        self.silence_sec = silence_sec
+
+        self.buffer: List[str] = []
+        self.tokens = 0
+        self.first_time = 0.0  # 缓冲区中最早一条的加入时间
+        self.last_time = 0.0  # 最后一条的加入时间
+
+    def add(self, text: str, now: float) -> Optional[List[str]]:
+        """加入一条转写文本；达到条数或 token 上限时返回切出的批次"""
+        if not self.buffer:
+            self.first_time = now
+        self.buffer.append(text)
+        self.tokens += estimate_tokens(text)
+        self.last_time = now
+
+        if (self.max_captions and len(self.buffer) >= self.max_captions) or \
+                (self.max_tokens and self.tokens >= self.max_tokens):
+            return self.flush()
+        return None
+
+    def poll(self, now: float) -> Optional[List[str]]:
+        """定时检查：等待超时或停顿足够长时返回切出的批次"""
+        if not self.buffer:
+            return None
+        # 与 next_deadline 的计算方式一致（浮点误差下 now 恰为期限时也要切分）
+        if self.max_wait_sec and now >= self.first_time + self.max_wait_sec:
+            return self.flush()
+        if self.silence_sec and now >= self.last_time + self.silence_sec and self.tokens >= self.min_tokens:
+            return self.flush()
+        return None
+
+    def next_deadline(self) -> Optional[float]:
+        """下一次 poll 可能切分的时间（缓冲区为空时为 None）"""
+        if not self.buffer:
+            return None
+        deadlines = []
+        if self.max_wait_sec:
+            deadlines.append(self.first_time + self.max_wait_sec)
+        if self.silence_sec and self.tokens >= self.min_tokens:
+            deadlines.append(self.last_time + self.silence_sec)
+        return min(deadlines) if deadlines else None
+
+    def flush(self) -> Optional[List[str]]:
+        """取出缓冲区中的全部内容（为空时返回 None）"""
+        if not self.buffer:
+            return None
+        chunk = self.buffer
+        self.buffer = []
+        self.tokens = 0
+        return chunk
+
+    def clear(self):
+        self.buffer = []
+        self.tokens = 0
@@ -0,0 +1,125 @@
+"""
+Utterance Buffer
+预分配的连续语音段缓冲区，替代 list + np.concatenate 的累积方式
+"""
+import numpy as np
+
+
+class UtteranceBuffer:
+    """
+    语音段缓冲区
+
+    - 一次性预分配连续内存，句子之间 clear() 复用，不再重新分配
+    - 维护运行中的采样数，无需每个 CHUNK 重新求和
+    - float32 存储时 tail()/full() 直接返回零拷贝视图
+    - int16 存储时内存减半，tail()/full() 转换到预分配的 float32 暂存区
+    - 超出容量时丢弃最旧的采样（滑动窗口），保证视图始终连续
+
+    注意：tail()/full()/view() 返回的数组在下一次 append()/clear() 之前有效
+    """
+
+    def __init__(self, capacity: int, dtype: str = "float32"):
+        """
+        Args:
+            capacity: 最大采样数
+            dtype: 存储类型，"float32" 或 "int16"
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float32), np.dtype(np.int16)):
+            raise ValueError(f"Unsupported buffer dtype: {dtype}")
+
+        self.capacity = int(capacity)
+        self._buf = np.zeros((self.capacity,), dtype=self.dtype)
+        self._size = 0
+        self.dropped_samples = 0
+
+        # int16 存储时的 float32 输出暂存区
+        self._f32_out = np.zeros((self.capacity,), dtype=np.float32) if self.is_int16 else None
+        # float32 -> int16 写入时的暂存区（按块大小按需增长）
+        self._f32_in = np.zeros((0,), dtype=np.float32)
+
+    @property
+    def is_int16(self) -> bool:
+        return self.dtype == np.dtype(np.int16)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self):
+        """清空（不释放内存）"""
+        self._size = 0
+        self.dropped_samples = 0
+
+    def append(self, block: np.ndarray):
+        """
+        追加一段音频
+
+        Args:
+            block: 1D 音频，float32（[-1, 1)）或 int16
+        """
+        n = int(block.size)
+        if n == 0:
+            return
+
+        if n >= self.capacity:
+            # 单块就超过容量：只保留最后 capacity 个采样
+            self.dropped_samples += self._size + (n - self.capacity)
+            self._size = 0
+            block = block[-self.capacity:]
+            n = self.capacity
+        elif self._size + n > self.capacity:
+            # 丢弃最旧的采样，把剩余部分移到开头
+            keep = self.capacity - n
+            drop = self._size - keep
+            self._buf[:keep] = self._buf[drop:self._size]
+            self._size = keep
+            self.dropped_samples += drop
+
+        dst = self._buf[self._size:self._size + n]
+        self._write(dst, block)
+        self._size += n
+
+    def _write(self, dst: np.ndarray, block: np.ndarray):
+        """按存储类型写入，避免中间临时数组"""
+        if block.dtype == self.dtype:
+            dst[:] = block
+        elif self.is_int16:
+            # float32 -> int16：int16 来源的样本乘 32768 后是精确整数
+            if self._f32_in.size < block.size:
+                self._f32_in = np.zeros((block.size,), dtype=np.float32)
+            tmp = self._f32_in[:block.size]
+            np.multiply(block, 32768.0, out=tmp, casting="unsafe")
+            np.clip(tmp, -32768.0, 32767.0, out=tmp)
+            np.copyto(dst, tmp, casting="unsafe")
+        else:
+            # int16 -> float32
+            np.multiply(block, 1.0 / 32768.0, out=dst, casting="unsafe")
+
+    def view(self, start: int = 0, end: int = None) -> np.ndarray:
+        """按存储类型返回 [start, end) 的零拷贝视图"""
+        end = self._size if end is None else min(int(end), self._size)
+        start = max(0, min(int(start), end))
+        return self._buf[start:end]
+
+    def _as_float32(self, start: int, end: int) -> np.ndarray:
+        if not self.is_int16:
+            return self._buf[start:end]
+        out = self._f32_out[:end - start]
+        np.multiply(self._buf[start:end], 1.0 / 32768.0, out=out, casting="unsafe")
+        return out
+
+    def tail(self, n_samples: int) -> np.ndarray:
+        """最后 n_samples 个采样（float32）；n_samples <= 0 表示全部"""
+        if n_samples <= 0 or n_samples >= self._size:
+            return self._as_float32(0, self._size)
+        return self._as_float32(self._size - int(n_samples), self._size)
+
+    def full(self) -> np.ndarray:
+        """整句音频（float32）"""
+        return self._as_float32(0, self._size)
+
+    def copy(self) -> np.ndarray:
+        """整句音频的独立副本（float32），用于跨线程传递"""
+        return np.array(self.full(), dtype=np.float32, copy=True)
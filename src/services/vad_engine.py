@@ -0,0 +1,223 @@
+"""
+VAD Engine
+Silero VAD 推理引擎：ONNX Runtime（CPU，无 torch 依赖）为主，torch 模型为回退
+"""
+import os
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from src.config import SR, BLOCK_SAMPLES, VAD_DIR, VAD_BACKEND, VAD_ONNX_PATH, VAD_ONNX_THREADS
+
+
+logger = logging.getLogger('VAD')
+
+
+class VADEngine:
+    """
+    VAD 引擎接口
+
+    score() 一次接收多个连续的音频块，按时间顺序逐块推理，
+    循环状态在多次调用之间保持（同一路音频流）。
+    """
+
+    name = "base"
+
+    def reset(self):
+        """重置循环状态（新的音频流开始时调用）"""
+        raise NotImplementedError
+
+    def score(self, blocks: np.ndarray) -> np.ndarray:
+        """
+        计算语音概率
+
+        Args:
+            blocks: (n, BLOCK_SAMPLES) float32，按时间顺序排列
+
+        Returns:
+            (n,) float32 语音概率
+        """
+        raise NotImplementedError
+
+
+class OnnxSileroVAD(VADEngine):
+    """
+    Silero VAD 的 ONNX Runtime 后端
+
+    支持三种导出格式：
+    - v5（input + state + sr，64 采样上下文）、v4（input + sr + h/c）：第一维是并行的音频流，
+      同一路流的各块只能逐块调用 session.run
+    - 按时间成批（input 为 (块数, 64 + 512)，h/c，无 sr；faster-whisper 自带的 silero_vad_v6.onnx）：
+      一次 session.run 处理 score() 收到的全部块，前端卷积按批计算，只有 LSTM 在图内按时间递推
+    输入缓冲区预分配，推理循环中不产生额外的 Python 对象转换。
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, num_threads: int = 1):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=opts,
+            providers=["CPUExecutionProvider"],
+        )
+
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        input_names = set(inputs)
+        self.is_v5 = "state" in input_names
+        self.is_batched = not self.is_v5 and "sr" not in input_names
+        # v5 / 按时间成批的格式需要把上一块末尾的若干采样拼在输入前面
+        if self.is_v5 or self.is_batched:
+            self.context_size = 64 if SR == 16000 else 32
+        else:
+            self.context_size = 0
+        if self.is_batched:
+            hidden = inputs["h"].shape[-1]
+            self._hidden_shape = (1, 1, hidden if isinstance(hidden, int) else 128)
+
+        self._x = np.zeros((1, self.context_size + BLOCK_SAMPLES), dtype=np.float32)
+        self._sr = np.array(SR, dtype=np.int64)
+        self.reset()
+
+    @property
+    def format(self) -> str:
+        return "v5" if self.is_v5 else ("batched" if self.is_batched else "v4")
+
+    def reset(self):
+        if self.is_v5:
+            self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        elif self.is_batched:
+            self._h = np.zeros(self._hidden_shape, dtype=np.float32)
+            self._c = np.zeros(self._hidden_shape, dtype=np.float32)
+        else:
+            self._h = np.zeros((2, 1, 64), dtype=np.float32)
+            self._c = np.zeros((2, 1, 64), dtype=np.float32)
+        self._x[:] = 0.0
+
+    def score(self, blocks: np.ndarray) -> np.ndarray:
+        if self.is_batched:
+            return self._score_batched(blocks)
+
+        n = blocks.shape[0]
+        out = np.empty((n,), dtype=np.float32)
+        ctx = self.context_size
+        x = self._x
+        run = self.session.run
+
+        for i in range(n):
+            x[0, ctx:] = blocks[i]
+            if self.is_v5:
+                prob, self._state = run(None, {"input": x, "state": self._state, "sr": self._sr})
+            else:
+                prob, self._h, self._c = run(None, {"input": x, "sr": self._sr, "h": self._h, "c": self._c})
+            out[i] = prob[0, 0] if prob.ndim == 2 else prob.reshape(-1)[0]
+            if ctx:
+                x[0, :ctx] = blocks[i, -ctx:]
+
+        return out
+
+    def _score_batched(self, blocks: np.ndarray) -> np.ndarray:
+        """一次推理全部块：每行是 上一块末尾 ctx 个采样 + 本块"""
+        n = blocks.shape[0]
+        ctx = self.context_size
+        if self._x.shape[0] < n:
+            grown = np.zeros((n, ctx + BLOCK_SAMPLES), dtype=np.float32)
+            grown[0, :ctx] = self._x[0, :ctx]
+            self._x = grown
+        x = self._x[:n]
+        x[1:, :ctx] = blocks[:-1, -ctx:]
+        x[:, ctx:] = blocks
+
+        prob, self._h, self._c = self.session.run(None, {"input": x, "h": self._h, "c": self._c})
+        self._x[0, :ctx] = blocks[-1, -ctx:]
+        return np.asarray(prob, dtype=np.float32).reshape(-1)[:n].copy()
+
+
+class TorchSileroVAD(VADEngine):
+    """torch JIT 版 Silero VAD（回退方案，沿用 load_silero_vad_local）"""
+
+    name = "torch"
+
+    def __init__(self, model):
+        import torch
+
+        self._torch = torch
+        self.model = model
+        try:
+            self.model.eval()
+        except Exception:
+            pass
+
+    def reset(self):
+        reset_states = getattr(self.model, "reset_states", None)
+        if callable(reset_states):
+            reset_states()
+
+    def score(self, blocks: np.ndarray) -> np.ndarray:
+        n = blocks.shape[0]
+        out = np.empty((n,), dtype=np.float32)
+        x_all = self._torch.from_numpy(np.ascontiguousarray(blocks, dtype=np.float32))
+        with self._torch.no_grad():
+            for i in range(n):
+                prob = self.model(x_all[i], SR)
+                out[i] = float(prob.item()) if hasattr(prob, "item") else float(prob)
+        return out
+
+
+def bundled_silero_onnx() -> Optional[str]:
+    """faster-whisper 自带的 Silero VAD（按时间成批的导出格式），不可用时返回 None"""
+    try:
+        from faster_whisper.utils import get_assets_path
+    except ImportError:
+        return None
+    path = os.path.join(get_assets_path(), "silero_vad_v6.onnx")
+    return path if os.path.isfile(path) else None
+
+
+def find_silero_onnx(vad_dir: str) -> Optional[str]:
+    """查找 ONNX 模型文件：本地 silero-vad 仓库优先，找不到时用 faster-whisper 自带的模型"""
+    candidates: List[str] = [
+        os.path.join(vad_dir, "src", "silero_vad", "data", "silero_vad.onnx"),
+        os.path.join(vad_dir, "files", "silero_vad.onnx"),
+        os.path.join(vad_dir, "silero_vad.onnx"),
+    ]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return bundled_silero_onnx()
+
+
+def load_vad_engine(backend: str = VAD_BACKEND) -> VADEngine:
+    """
+    加载 VAD 引擎
+
+    Args:
+        backend: "onnx"（失败时回退到 torch）或 "torch"
+
+    Returns:
+        VADEngine 实例
+    """
+    if backend == "onnx":
+        model_path = VAD_ONNX_PATH or find_silero_onnx(os.path.abspath(VAD_DIR))
+        try:
+            if not model_path or not os.path.isfile(model_path):
+                raise FileNotFoundError(f"Silero ONNX model not found (VAD_DIR={VAD_DIR})")
+            engine = OnnxSileroVAD(model_path, num_threads=VAD_ONNX_THREADS)
+            logger.info(f"VAD engine: onnx ({model_path}, format={engine.format})")
+            return engine
+        except Exception as e:
+            logger.warning(f"ONNX VAD unavailable ({e}), falling back to torch")
+    elif backend != "torch":
+        raise ValueError(f"Unknown VAD backend: {backend}")
+
+    from src.services.audio_service import load_silero_vad_local
+
+    engine = TorchSileroVAD(load_silero_vad_local(VAD_DIR))
+    logger.info("VAD engine: torch")
+    return engine
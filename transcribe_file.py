@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+ClassAudio 离线文件转写入口
+以快于实时的速度转写录好的课堂音频（WAV / FLAC / 原始 16-bit PCM）
+
+用法：
+    python transcribe_file.py lecture1.wav lecture2.flac --out-dir data/offline
+    python transcribe_file.py long_lecture.wav --workers 8   # 多进程并行（按 VAD 边界切分）
+"""
+import argparse
+import os
+import sys
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.services.audio_service import AudioTranscriptionService
+from src.services.parallel_transcribe import transcribe_file_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClassAudio offline file transcription")
+    parser.add_argument("inputs", nargs="+", help="audio files (.wav / .flac / .pcm)")
+    parser.add_argument("--out-dir", default=None, help="output directory (default: next to each input)")
+    parser.add_argument("--raw-rate", type=int, default=None, help="sample rate of raw PCM input (default: 16000)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, each with its own final model (default: 1 = streaming pipeline)")
+    args = parser.parse_args()
+
+    service = None
+    if args.workers <= 1:
+        service = AudioTranscriptionService()
+        service.initialize()
+
+    total_audio = 0.0
+    total_elapsed = 0.0
+    for path in args.inputs:
+        print(f"\nTranscribing {path} ...")
+        if service is not None:
+            result = service.transcribe_file(path, raw_sample_rate=args.raw_rate)
+        else:
+            result = transcribe_file_parallel(path, workers=args.workers, raw_sample_rate=args.raw_rate)
+
+        out_dir = args.out_dir or os.path.dirname(os.path.abspath(path))
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        with open(out_path, "w", encoding="utf-8") as f:
+            for caption in result.captions:
+                f.write(f"[{caption.timestamp}] {caption.text}\n")
+
+        total_audio += result.audio_sec
+        total_elapsed += result.elapsed_sec
+        print(f"  captions: {len(result.captions)} (workers: {result.workers})")
+        print(f"  audio: {result.audio_sec:.1f}s, elapsed: {result.elapsed_sec:.1f}s, RTF: {result.rtf:.3f}")
+        print(f"  saved to: {out_path}")
+
+    if len(args.inputs) > 1 and total_audio > 0:
+        print(f"\nTotal: audio {total_audio:.1f}s, elapsed {total_elapsed:.1f}s, RTF {total_elapsed / total_audio:.3f}")
+
+
+if __name__ == "__main__":
+    main()